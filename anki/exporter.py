@@ -1,5 +1,10 @@
+import hashlib
+import json
 import os
-from typing import List, Any
+import time
+import unicodedata
+from typing import Any, Dict, List, Optional, Tuple
+
 import genanki
 
 from .templates import basic_model, cloze_model
@@ -45,64 +50,144 @@ def _format_difficulty(card: Any) -> str:
     return f"<span class='badge {cls}'>{label}</span>" if label else ""
 
 
-def export_to_apkg(deck_name: str, cards: List[Any], output_dir: str = "exports") -> str:
+def _normalize(value: Any) -> str:
+    """用于生成 GUID 的规范化文本：全半角统一、空白折叠"""
+    return " ".join(unicodedata.normalize("NFKC", _as_text(value)).split())
+
+
+def note_guid(card: Any) -> str:
+    """
+    由规范化后的 Question/Answer/SourceDoc 派生的稳定 GUID
+
+    同一张卡片重新导出时 GUID 不变，导入 Anki 会原地更新而不是新增重复笔记。
+    """
+    return genanki.guid_for(_normalize(_get(card, "Question", "")), _normalize(_get(card, "Answer", "")),
+                            _normalize(_get(card, "SourceDoc", "")))
+
+
+def deck_id_for(deck_name: str) -> int:
+    """由牌组名称派生的稳定 deck_id，同名牌组多次导出会合并到同一个牌组"""
+    digest = hashlib.sha1(deck_name.encode("utf-8")).digest()
+    return (1 << 30) + int.from_bytes(digest[:4], "big") % (1 << 30)
+
+
+def _note_fields(c: Any) -> Tuple[str, List[str]]:
+    """返回 (模板类型, 字段列表)"""
+    ctype = (_get(c, "type", "basic") or "basic").lower()
+    tags_html = _format_tags(c)
+    diff_html = _format_difficulty(c)
+    if ctype == "cloze":
+        return "cloze", [
+            _as_text(_get(c, "Answer", "")),  # Text with cloze
+            _as_text(_get(c, "SourceDoc", "")),
+            _as_text(_get(c, "SourceLoc", "")),
+            tags_html,
+            diff_html,
+            _as_text(_get(c, "Evidence", "")),
+        ]
+    # 根据卡片类型选择合适的模板：背诵记忆模板或知识问答模板
+    card_type = _get(c, "CardType", "qa")
+    kind = "memory" if "memory" in card_type.lower() or "背诵" in _get(c, "Question", "") else "qa"
+    return "basic", [
+        _as_text(_get(c, "Question", "")),
+        _as_text(_get(c, "Answer", "")),
+        _as_text(_get(c, "SourceDoc", "")),
+        _as_text(_get(c, "SourceLoc", "")),
+        tags_html,
+        diff_html,
+        _as_text(_get(c, "Evidence", "")),
+        kind,  # CardType字段
+    ]
+
+
+def _fingerprint(model_kind: str, fields: List[str]) -> str:
+    """笔记全部字段的指纹，用于判断已导出的笔记内容是否有变化"""
+    return hashlib.sha1(json.dumps([model_kind, fields], ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def manifest_path_for(deck_name: str, output_dir: str = "exports") -> str:
+    return os.path.join(output_dir, f"{deck_name}.manifest.json")
+
+
+def _load_manifest(path: str) -> Dict[str, str]:
+    """读取已导出笔记的清单 {GUID: 指纹}；不存在或损坏时视为空"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        notes = data.get("notes", {})
+        return notes if isinstance(notes, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def delta_path_for(deck_name: str, output_dir: str = "exports") -> str:
+    """增量包的路径 {牌组}.delta-<时间>.apkg；同一秒内多次导出时追加序号，不覆盖之前的增量包"""
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    path = os.path.join(output_dir, f"{deck_name}.delta-{stamp}.apkg")
+    n = 1
+    while os.path.exists(path):
+        path = os.path.join(output_dir, f"{deck_name}.delta-{stamp}-{n}.apkg")
+        n += 1
+    return path
+
+
+def export_deck(deck_name: str, cards: List[Any], output_dir: str = "exports",
+                incremental: bool = False) -> Dict[str, Any]:
+    """
+    导出 .apkg 并维护导出清单
+
+    {牌组}.apkg 总是包含本次导出的全部卡片；增量模式下另把清单中没有或内容有变化的笔记
+    写入单独的 {牌组}.delta-<时间>.apkg，完整牌组不会被只含变化部分的包覆盖。GUID 稳定，导入 Anki 后原地更新
+
+    Args:
+        incremental: 额外写出增量包，并在清单中保留本次未出现的笔记
+
+    Returns:
+        {"path": 完整牌组路径（没有卡片时为 None）, "delta_path": 增量包路径（非增量模式或没有变化时为 None），
+         "added", "updated", "unchanged"}
+    """
     os.makedirs(output_dir, exist_ok=True)
-    deck = genanki.Deck(deck_id=2059400110, name=deck_name)
-    basic = basic_model()
-    cloze = cloze_model()
+    manifest_path = manifest_path_for(deck_name, output_dir)
+    previous = _load_manifest(manifest_path) if incremental else {}
+    deck_id = deck_id_for(deck_name)
+    deck = genanki.Deck(deck_id=deck_id, name=deck_name)
+    delta = genanki.Deck(deck_id=deck_id, name=deck_name)
+    models = {"basic": basic_model(), "cloze": cloze_model()}
 
+    exported: Dict[str, str] = {}
+    stats = {"added": 0, "updated": 0, "unchanged": 0}
     for c in cards:
-        ctype = (_get(c, "type", "basic") or "basic").lower()
-        tags_html = _format_tags(c)
-        diff_html = _format_difficulty(c)
-        if ctype == "cloze":
-            note = genanki.Note(
-                model=cloze,
-                fields=[
-                    _as_text(_get(c, "Answer", "")),  # Text with cloze
-                    _as_text(_get(c, "SourceDoc", "")),
-                    _as_text(_get(c, "SourceLoc", "")),
-                    tags_html,
-                    diff_html,
-                    _as_text(_get(c, "Evidence", "")),
-                ],
-            )
-        else:
-            # 根据卡片类型选择合适的模板
-            card_type = _get(c, "CardType", "qa")
-            if "memory" in card_type.lower() or "背诵" in _get(c, "Question", ""):
-                # 使用背诵记忆模板
-                note = genanki.Note(
-                    model=basic,
-                    fields=[
-                        _as_text(_get(c, "Question", "")),
-                        _as_text(_get(c, "Answer", "")),
-                        _as_text(_get(c, "SourceDoc", "")),
-                        _as_text(_get(c, "SourceLoc", "")),
-                        tags_html,
-                        diff_html,
-                        _as_text(_get(c, "Evidence", "")),
-                        "memory",  # CardType字段
-                    ],
-                )
-            else:
-                # 使用知识问答模板
-                note = genanki.Note(
-                    model=basic,
-                    fields=[
-                        _as_text(_get(c, "Question", "")),
-                        _as_text(_get(c, "Answer", "")),
-                        _as_text(_get(c, "SourceDoc", "")),
-                        _as_text(_get(c, "SourceLoc", "")),
-                        tags_html,
-                        diff_html,
-                        _as_text(_get(c, "Evidence", "")),
-                        "qa",  # CardType字段
-                    ],
-                )
+        guid = note_guid(c)
+        if guid in exported:
+            continue  # 同一 GUID 只写一条
+        model_kind, fields = _note_fields(c)
+        fingerprint = _fingerprint(model_kind, fields)
+        exported[guid] = fingerprint
+        note = genanki.Note(model=models[model_kind], fields=fields, guid=guid)
         deck.add_note(note)
+        old = previous.get(guid)
+        if old == fingerprint:
+            stats["unchanged"] += 1
+            continue
+        stats["added" if old is None else "updated"] += 1
+        delta.add_note(note)
+
+    path = None
+    if deck.notes:
+        path = os.path.join(output_dir, f"{deck_name}.apkg")
+        genanki.Package(deck).write_to_file(path)
+    delta_path = None
+    if incremental and delta.notes:
+        delta_path = delta_path_for(deck_name, output_dir)
+        genanki.Package(delta).write_to_file(delta_path)
+    # 增量模式下保留清单中本次未出现的笔记，它们仍在用户的 Anki 牌组里
+    notes = {**previous, **exported} if incremental else exported
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump({"deck_name": deck_name, "deck_id": deck_id, "notes": notes}, f, ensure_ascii=False)
+    return {"path": path, "delta_path": delta_path, **stats}
+
 
-    pkg = genanki.Package(deck)
-    apkg_path = os.path.join(output_dir, f"{deck_name}.apkg")
-    pkg.write_to_file(apkg_path)
-    return apkg_path
+def export_to_apkg(deck_name: str, cards: List[Any], output_dir: str = "exports", incremental: bool = False) -> Optional[str]:
+    """返回需要导入 Anki 的文件：增量模式下为增量包，否则为完整牌组"""
+    result = export_deck(deck_name, cards, output_dir, incremental)
+    return result["delta_path"] if incremental else result["path"]
@@ -0,0 +1,249 @@
+"""
+批处理命令行：不开界面，一次处理整个目录的文档，适合把整门课的资料放着跑一夜
+
+用法：
+    anki-assist ./syllabus --keywords 不正当竞争 --workers 4 --max-concurrency 8
+    python -m app.cli "data/uploads/*.pdf" --merge 刑法学总论 --incremental
+
+每个文档单独运行一次 run_pipeline，多个文档在线程池中并行；所有运行共用一个调度器，
+--max-concurrency、--rpm、--tpm 是整个批次的全局上限。默认每个文档导出一个 .apkg，--merge 时合并为一个牌组。
+进度记录在输出目录的 batch_state.json：重新执行同一命令时，内容与参数都没变的已完成文档直接跳过，
+失败或中途被打断的文档重新处理，已完成的 LLM 请求从检查点续跑，不会重复请求。
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from dotenv import load_dotenv  # noqa: E402
+
+from anki.exporter import export_deck  # noqa: E402
+from llm.scheduler import RateLimitedScheduler  # noqa: E402
+from models.schemas import Card, PipelineInput, PipelineOutput  # noqa: E402
+from pipeline.graph import CHECKPOINTER, new_run_config, release_run, run_pipeline  # noqa: E402
+from pipeline.nodes.ingest import SUPPORTED_EXTS  # noqa: E402
+from pipeline.utils.stage_cache import file_fingerprint, stage_key  # noqa: E402
+
+STATE_FILE = "batch_state.json"
+# 决定批处理结果的输入字段；并发、限流、缓存开关等只影响速度，改动后已完成的文档无需重跑
+_RESULT_FIELDS = ("keywords", "api_base", "extract_model", "card_model", "dedup_threshold", "min_quality",
+                  "max_cards_per_item", "chunk_tokens", "card_batch_size", "retrieval_recall", "parse_statutes")
+
+
+def collect_files(inputs: List[str]) -> List[str]:
+    """展开目录（递归）与通配符，返回支持格式的文件绝对路径（去重、排序）"""
+    found = set()
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            for root, _, names in os.walk(pattern):
+                found.update(os.path.join(root, n) for n in names)
+        else:
+            found.update(glob.glob(pattern, recursive=True))
+    return sorted(os.path.abspath(p) for p in found
+                  if os.path.isfile(p) and os.path.splitext(p)[1].lower() in SUPPORTED_EXTS)
+
+
+class BatchState:
+    """
+    输出目录中的批处理进度：{文件路径: {"fingerprint", "settings", "status", "cards", "errors", ...}}
+
+    status 为 running / done / partial（有请求失败，已导出现有卡片）/ failed，只有 done 会在下次运行时跳过。
+    """
+
+    def __init__(self, output_dir: str) -> None:
+        self.path = os.path.join(output_dir, STATE_FILE)
+        self.cards_dir = os.path.join(output_dir, ".cards")
+        self._lock = threading.Lock()
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.files: Dict[str, Dict[str, Any]] = json.load(f).get("files", {})
+        except Exception:
+            self.files = {}
+
+    def is_done(self, path: str, fingerprint: str, settings: str) -> bool:
+        entry = self.files.get(path) or {}
+        return (entry.get("status") == "done" and entry.get("fingerprint") == fingerprint
+                and entry.get("settings") == settings and os.path.exists(entry.get("cards", "")))
+
+    def update(self, path: str, **fields: Any) -> None:
+        """更新一个文件的记录并立即落盘（先写临时文件再替换，中途被打断也不会留下损坏的记录）"""
+        with self._lock:
+            self.files[path] = {**self.files.get(path, {}), **fields, "updated_at": time.strftime("%Y-%m-%d %H:%M:%S")}
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"files": self.files}, f, ensure_ascii=False, indent=2)
+            os.replace(tmp, self.path)
+
+    def save_cards(self, run_id: str, cards: List[Card]) -> str:
+        os.makedirs(self.cards_dir, exist_ok=True)
+        path = os.path.join(self.cards_dir, f"{run_id}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump([c.model_dump() for c in cards], f, ensure_ascii=False)
+        return path
+
+    def load_cards(self, path: str) -> List[Card]:
+        entry = self.files.get(path) or {}
+        try:
+            with open(entry.get("cards", ""), "r", encoding="utf-8") as f:
+                return [Card(**c) for c in json.load(f)]
+        except Exception:
+            return []
+
+
+def process_file(path: str, base_input: PipelineInput, api_key: str, scheduler: RateLimitedScheduler,
+                 max_concurrency: int, run_id: str) -> PipelineOutput:
+    """运行单个文档；同一 run_id 有未完成的检查点时从断点续跑"""
+    config = new_run_config(api_key, max_concurrency, run_id=run_id, scheduler=scheduler,
+                            metadata={"files": os.path.basename(path), "keywords": ", ".join(base_input.keywords),
+                                      "source": "cli"})
+    try:
+        if run_pipeline.get_state(config).next:
+            output = run_pipeline.invoke(None, config=config)
+        else:
+            output = run_pipeline.invoke(base_input.model_copy(update={"file_paths": [path]}), config=config)
+    finally:
+        release_run(run_id)
+    return output if isinstance(output, PipelineOutput) else PipelineOutput(**output)
+
+
+def _describe_export(result: Dict[str, Any]) -> str:
+    """导出结果的路径说明：完整牌组，增量模式下另附增量包"""
+    if not result["path"]:
+        return ""
+    text = f" → {result['path']}"
+    if result.get("delta_path"):
+        text += f"（增量包 {result['delta_path']}）"
+    return text
+
+
+def run_batch(files: List[str], base_input: PipelineInput, args: argparse.Namespace) -> int:
+    """处理全部文件并导出，返回失败的文件数"""
+    state = BatchState(args.output)
+    settings = stage_key({k: getattr(base_input, k) for k in _RESULT_FIELDS})
+    todo = []
+    for path in files:
+        fingerprint = file_fingerprint(path)
+        if state.is_done(path, fingerprint, settings) and not args.force:
+            continue
+        todo.append((path, fingerprint, stage_key("cli", path, fingerprint, settings)[:32]))
+    print(f"共 {len(files)} 个文件，已完成 {len(files) - len(todo)} 个，本次处理 {len(todo)} 个")
+
+    scheduler = RateLimitedScheduler(max_concurrency=args.max_concurrency, requests_per_minute=args.rpm,
+                                     tokens_per_minute=args.tpm)
+    failed = 0
+    started = time.time()
+
+    def _one(path: str, fingerprint: str, run_id: str) -> Optional[str]:
+        """处理并导出一个文件，返回错误信息（成功时为 None）"""
+        state.update(path, fingerprint=fingerprint, settings=settings, status="running", run_id=run_id)
+        t0 = time.time()
+        try:
+            output = process_file(path, base_input, args.api_key, scheduler, args.max_concurrency, run_id)
+        except Exception as e:
+            state.update(path, status="failed", errors=[f"运行失败: {e}"])
+            return f"运行失败: {e}"
+        # 重试后仍失败的模型请求会被各节点吞掉，只体现在 metrics 里；有失败时结果不完整，下次重新处理。
+        # 被调度器重试成功的请求不算失败
+        llm_failures = output.metrics.get("failed_requests", 0)
+        errors = output.errors + ([f"{llm_failures} 次模型请求失败"] if llm_failures else [])
+        if not output.cards and errors:
+            state.update(path, status="failed", errors=errors)
+            return "; ".join(errors)
+        cards_path = state.save_cards(run_id, output.cards)
+        # 结果已保存，检查点不再需要
+        CHECKPOINTER.delete_thread(run_id)
+        exported = ""
+        if not args.merge:
+            name = os.path.splitext(os.path.basename(path))[0]
+            exported = _describe_export(export_deck(name, output.cards, args.output, args.incremental))
+        # 部分请求失败时先导出已有的卡片，状态记为 partial，下次运行重新处理（成功的请求命中响应缓存）
+        state.update(path, status="partial" if llm_failures else "done", cards=cards_path, errors=errors,
+                     card_count=len(output.cards), seconds=round(time.time() - t0, 1))
+        print(f"  ✓ {os.path.basename(path)}：{len(output.cards)} 张卡片（{time.time() - t0:.1f}s）"
+              + exported)
+        for err in errors:
+            print(f"    ! {err}")
+        return None
+
+    executor = ThreadPoolExecutor(max_workers=max(1, args.workers))
+    try:
+        futures = {executor.submit(_one, *job): job[0] for job in todo}
+        for fut in as_completed(futures):
+            err = fut.result()
+            if err is not None:
+                failed += 1
+                print(f"  ✗ {os.path.basename(futures[fut])}：{err}")
+    except KeyboardInterrupt:
+        print("已中断：未开始的文件会在下次运行时处理，进行中的文件从检查点续跑")
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    executor.shutdown()
+
+    if args.merge:
+        cards = [c for path in files if (state.files.get(path) or {}).get("status") in ("done", "partial")
+                 for c in state.load_cards(path)]
+        result = export_deck(args.merge, cards, args.output, args.incremental)
+        print(f"合并导出 {args.merge}：新增 {result['added']}，更新 {result['updated']}，未变 {result['unchanged']}"
+              + (_describe_export(result) or "（没有需要写入的卡片）"))
+    print(f"完成 {len(todo) - failed} 个，失败 {failed} 个，用时 {time.time() - started:.1f}s，"
+          f"调度器统计 {scheduler.stats}")
+    return failed
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    load_dotenv(override=True)
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("inputs", nargs="+", help="文档目录（递归）或通配符，如 'syllabus/**/*.pdf'")
+    parser.add_argument("-k", "--keywords", nargs="*", default=[], help="关键词，留空表示全文抽取")
+    parser.add_argument("-o", "--output", default="exports", help="输出目录（.apkg 与批处理进度）")
+    parser.add_argument("--merge", metavar="DECK", help="把全部文档的卡片合并导出为这个牌组；默认每个文档一个牌组")
+    parser.add_argument("--incremental", action="store_true", help="只写入新增或内容有变化的笔记")
+    parser.add_argument("--force", action="store_true", help="忽略进度记录，重新处理全部文件")
+    parser.add_argument("--api-base", default=os.getenv("DEEPSEEK_BASE_URL", ""))
+    parser.add_argument("--api-key", default=os.getenv("DEEPSEEK_API_KEY", ""))
+    parser.add_argument("--extract-model", default="DeepSeek-V3")
+    parser.add_argument("--card-model", default="DeepSeek-V3")
+    parser.add_argument("--workers", type=int, default=4, help="同时处理的文档数")
+    parser.add_argument("--max-concurrency", type=int, default=8, help="整个批次同时在途的 LLM 请求上限")
+    parser.add_argument("--rpm", type=int, default=0, help="整个批次每分钟请求上限，0 不限")
+    parser.add_argument("--tpm", type=int, default=0, help="整个批次每分钟 token 上限，0 不限")
+    parser.add_argument("--dedup-threshold", type=float, default=0.88)
+    parser.add_argument("--min-quality", type=float, default=0.3)
+    parser.add_argument("--max-cards-per-item", type=int, default=3)
+    parser.add_argument("--card-batch-size", type=int, default=8)
+    parser.add_argument("--chunk-tokens", type=int, default=0)
+    parser.add_argument("--retrieval-recall", type=float, default=0.1)
+    parser.add_argument("--no-llm-cache", action="store_true", help="不复用本地缓存的模型响应")
+    parser.add_argument("--no-statute-parser", action="store_true", help="法条文档也交给模型抽取，不在本地按条切分")
+    parser.add_argument("--trace", action="store_true", help="为每个文档写运行追踪文件（data/traces）")
+    args = parser.parse_args(argv)
+
+    if not args.api_base or not args.api_key:
+        parser.error("请通过 --api-base/--api-key 或环境变量 DEEPSEEK_BASE_URL/DEEPSEEK_API_KEY 配置模型接口")
+    files = collect_files(args.inputs)
+    if not files:
+        parser.error(f"没有找到支持的文档（{', '.join(SUPPORTED_EXTS)}）")
+
+    # API Key 通过运行配置传入，不随输入写进检查点
+    base_input = PipelineInput(file_paths=[], keywords=args.keywords, api_base=args.api_base, api_key="",
+                               extract_model=args.extract_model, card_model=args.card_model,
+                               dedup_threshold=args.dedup_threshold, min_quality=args.min_quality,
+                               max_cards_per_item=args.max_cards_per_item, max_concurrency=args.max_concurrency,
+                               requests_per_minute=args.rpm, tokens_per_minute=args.tpm,
+                               use_llm_cache=not args.no_llm_cache, chunk_tokens=args.chunk_tokens,
+                               card_batch_size=args.card_batch_size, retrieval_recall=args.retrieval_recall,
+                               parse_statutes=not args.no_statute_parser, trace=args.trace)
+    return 1 if run_batch(files, base_input, args) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,127 @@
+"""
+卡片复核界面用到的纯数据处理
+
+卡片可能有上千张，界面只渲染当前页；选择状态以卡片 ID 的集合保存，
+单次交互的开销只与每页条数有关，与卡片总数无关。
+"""
+
+import hashlib
+import json
+import os
+import re
+from typing import Any, Dict, Iterable, List, Sequence, Set, Tuple
+
+from models.schemas import Card
+
+
+def card_id(card: Card) -> str:
+    """按卡片内容生成的稳定 ID：同一张卡片在重跑、翻页、筛选后 ID 不变"""
+    payload = json.dumps([card.type, card.Question, card.Answer, card.SourceDoc, card.SourceLoc], ensure_ascii=False)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def card_ids(cards: Sequence[Card]) -> List[str]:
+    """为每张卡片生成 ID，内容完全相同的卡片追加序号以保证唯一"""
+    ids: List[str] = []
+    seen: Dict[str, int] = {}
+    for card in cards:
+        cid = card_id(card)
+        n = seen.get(cid, 0)
+        seen[cid] = n + 1
+        ids.append(cid if n == 0 else f"{cid}-{n}")
+    return ids
+
+
+class CardIndex:
+    """一次运行结果的卡片索引：ID、筛选项在结果产生时计算一次，之后每次交互直接复用"""
+
+    def __init__(self, cards: Sequence[Card]) -> None:
+        self.cards = list(cards)
+        self.ids = card_ids(self.cards)
+        self.by_id: Dict[str, Card] = dict(zip(self.ids, self.cards))
+        self.tags = sorted({t for c in self.cards for t in c.Tags})
+        self.sources = sorted({c.SourceDoc for c in self.cards})
+        self.difficulties = sorted({c.Difficulty or "" for c in self.cards})
+
+    def filter(self, tags: Iterable[str] = (), sources: Iterable[str] = (), difficulties: Iterable[str] = (),
+               text: str = "") -> List[str]:
+        """按标签（任一命中）、来源、难度与关键字筛选，返回卡片 ID（保持原顺序）；条件为空表示不限"""
+        tags, sources, difficulties = set(tags), set(sources), set(difficulties)
+        text = text.strip().lower()
+        out: List[str] = []
+        for cid, c in zip(self.ids, self.cards):
+            if tags and tags.isdisjoint(c.Tags):
+                continue
+            if sources and c.SourceDoc not in sources:
+                continue
+            if difficulties and (c.Difficulty or "") not in difficulties:
+                continue
+            if text and text not in c.Question.lower() and text not in c.Answer.lower():
+                continue
+            out.append(cid)
+        return out
+
+    def rows(self, ids: Sequence[str], selected: Set[str]) -> List[Dict[str, Any]]:
+        """当前页的表格行"""
+        out = []
+        for cid in ids:
+            c = self.by_id[cid]
+            out.append({
+                "id": cid,
+                "选择": cid in selected,
+                "问题": c.Question,
+                "答案": c.Answer,
+                "来源": f"{c.SourceDoc}（{c.SourceLoc}）",
+                "标签": ", ".join(c.Tags),
+                "难度": c.Difficulty or "",
+                "质量分": round(c.quality, 2),
+            })
+        return out
+
+    def selected_cards(self, selected: Set[str]) -> List[Card]:
+        """按原顺序返回被选中的卡片"""
+        return [c for cid, c in zip(self.ids, self.cards) if cid in selected]
+
+
+def page_slice(ids: Sequence[str], page: int, page_size: int) -> Tuple[List[str], int, int]:
+    """取第 page 页（从 1 开始，越界时收回到最后一页），返回 (本页 ID, 实际页码, 总页数)"""
+    pages = max(1, -(-len(ids) // page_size))
+    page = min(max(1, page), pages)
+    start = (page - 1) * page_size
+    return list(ids[start:start + page_size]), page, pages
+
+
+def page_key(page_ids: Sequence[str]) -> str:
+    """当前页内容的指纹，用作表格组件的 key：页内卡片一变，表格的编辑记录随之作废"""
+    return hashlib.sha1("|".join(page_ids).encode("utf-8")).hexdigest()[:12]
+
+
+def apply_grid_edits(selected: Set[str], page_ids: Sequence[str], edited_rows: Dict[int, Dict[str, Any]],
+                     column: str = "选择") -> Set[str]:
+    """把表格组件记录的勾选修改（行号 -> 修改的列）合并进选择集合"""
+    out = set(selected)
+    for row, changes in edited_rows.items():
+        row = int(row)
+        if column not in changes or not 0 <= row < len(page_ids):
+            continue
+        if changes[column]:
+            out.add(page_ids[row])
+        else:
+            out.discard(page_ids[row])
+    return out
+
+
+def default_deck_name(sources: Sequence[str], keywords: Sequence[str]) -> str:
+    """
+    默认牌组名称：只有一个来源文档时取其文件名，否则按关键词命名
+
+    名称决定 deck_id、导出文件名与增量导出清单，同样的文档与关键词每次导出都得到同一个名称，增量导出才能对上。
+    """
+    stems = sorted({os.path.splitext(s)[0] for s in sources if s})
+    if len(stems) == 1:
+        name = stems[0]
+    else:
+        words = [k.strip() for k in keywords if k and k.strip()]
+        name = "Law-Notes-" + "-".join(words) if words else "Law-Notes"
+    # 名称同时用作 .apkg 文件名
+    return re.sub(r'[\\/:*?"<>|]', "_", name)
@@ -1,12 +1,14 @@
 import os
 import io
 import json
+import time
 #解析时间用于牌组的名称
 from datetime import datetime
+import pandas as pd
 import streamlit as st
 from streamlit_tags import st_tags
 from dotenv import load_dotenv
-from models.schemas import PipelineInput
+from models.schemas import PipelineInput, PipelineOutput
 
 # sys库用于与python解释器交互，提供了若干“系统级的方法接口”
 # 这段代码的目的是要
@@ -17,11 +19,87 @@ BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 if BASE_DIR not in sys.path:
     sys.path.insert(0, BASE_DIR)
 
-from pipeline.graph import run_pipeline
-from anki.exporter import export_to_apkg
+from pipeline.jobs import get_job_manager, ACTIVE_STATUSES, RESUMABLE_STATUSES
+from anki.exporter import export_deck
+from pipeline.utils.doc_store import get_document_store
+from app.review import CardIndex, page_slice, page_key, apply_grid_edits, default_deck_name
 
 load_dotenv(override=True) #override参数决定是否覆盖同名变量
 
+# 运行进度中各阶段的显示名称，以及实时预览最多显示的卡片数
+STAGE_LABELS = {"documents": "读取文件", "items": "抽取知识点", "extract": "抽取知识点", "cards": "生成卡片",
+                "quality": "质量过滤", "dedup": "去重"}
+PREVIEW_LIMIT = 50
+JOB_STATUS_LABELS = {"queued": "排队中", "running": "运行中", "done": "已完成", "failed": "失败",
+                     "cancelled": "已取消", "interrupted": "已中断"}
+
+
+def _select_filtered(ids, on):
+    """批量勾选/取消当前筛选结果中的全部卡片"""
+    if on:
+        st.session_state.cards_selected = st.session_state.cards_selected | set(ids)
+    else:
+        st.session_state.cards_selected = st.session_state.cards_selected - set(ids)
+    st.session_state.grid_version += 1
+
+
+def _on_grid_edit(key, page_ids):
+    """表格勾选变化时，在脚本重跑前把修改合并进选择集合"""
+    edits = st.session_state[key].get("edited_rows", {})
+    st.session_state.cards_selected = apply_grid_edits(st.session_state.cards_selected, page_ids, edits)
+
+
+def _set_output(output):
+    """保存运行结果；卡片 ID 与筛选项只在得到新结果时计算一次，默认全选"""
+    st.session_state.pipeline_output = output
+    index = CardIndex(output.cards)
+    st.session_state.card_index = index
+    st.session_state.cards_selected = set(index.ids)
+    st.session_state.grid_version += 1
+
+
+def _render_progress(job):
+    """显示任务的进度快照：各阶段进度与预计剩余时间、复用的上次结果，以及最近生成的卡片"""
+    progress = job["progress"]
+    counts = progress["counts"]
+    st.caption(f"已读取文档 {counts['document']} 份 · 知识点 {counts['item']} 个 · 卡片 {counts['card']} 张")
+    for stage, count in progress["cached"].items():
+        st.write(f"{STAGE_LABELS.get(stage, stage)}：复用上次结果（{count} 条）")
+    for stage, p in progress["stages"].items():
+        done, total = p["done"], p["total"]
+        text = f"{STAGE_LABELS.get(stage, stage)}：{done}/{total}"
+        if 0 < done < total:
+            eta = (time.time() - p["started"]) / done * (total - done)
+            text += f"，预计剩余 {eta:.0f} 秒"
+        st.progress(min(1.0, done / total) if total else 1.0, text=text)
+    if progress["cards"]:
+        _render_preview(progress["cards"])
+
+
+def _load_job(job):
+    """把结束的任务结果载入当前会话（每个任务只载入一次，刷新页面后也能取回结果）"""
+    st.session_state.loaded_job = job["id"]
+    if job["status"] == "done":
+        _set_output(jobs.output(job["id"]))
+    elif job["status"] == "failed":
+        _set_output(PipelineOutput(documents=[], extracted_items=[], cards=[], errors=[f"运行失败: {job['error']}"]))
+
+
+@st.fragment(run_every=1.0)
+def _job_panel(job_id):
+    """每秒轮询一次任务进度；任务结束后整页重跑以载入结果"""
+    job = jobs.get(job_id)
+    if job is None or job["status"] not in ACTIVE_STATUSES:
+        st.rerun()
+    with st.status(f"任务{JOB_STATUS_LABELS[job['status']]}，关闭或刷新页面不影响运行", expanded=True):
+        _render_progress(job)
+    st.button("取消任务", on_click=jobs.cancel, args=(job_id,))
+
+
+def _render_preview(cards):
+    """显示最近收到的卡片"""
+    st.dataframe([{k: c[k] for k in ("Question", "Answer", "SourceDoc")} for c in cards[-PREVIEW_LIMIT:]])
+
 
 #=================================================================================================================================
 
@@ -31,8 +109,18 @@ st.set_page_config(page_title="法律文档→Anki", layout="wide")
 # 初始化session_state用于保存图运行结果和用户是否保留
 if "pipeline_output" not in st.session_state:
     st.session_state.pipeline_output = None
+# 复核表格的索引与被选中卡片的 ID 集合；grid_version 在批量选择后递增，使表格丢弃旧的编辑记录
+if "card_index" not in st.session_state:
+    st.session_state.card_index = None
 if "cards_selected" not in st.session_state:
-    st.session_state.cards_selected = {}
+    st.session_state.cards_selected = set()
+if "grid_version" not in st.session_state:
+    st.session_state.grid_version = 0
+# 管线在后台任务中运行，会话只关联任务 ID；任务 ID 同时写进地址栏，刷新页面后据此重新关联
+jobs = get_job_manager()
+if "active_job" not in st.session_state:
+    st.session_state.active_job = st.query_params.get("job")
+    st.session_state.loaded_job = None
 
 #=================================================================================================================================
 
@@ -62,6 +150,23 @@ with st.sidebar:
     min_quality = st.slider("最低质量分", 0.0, 1.0, 0.30, 0.01, help="为了保证卡片质量，低于该分数的卡片会被过滤")
     #数字框
     max_cards_per_item = st.number_input("每个知识点最多卡片数", 1, 5, 3, 1)
+    st.divider()
+    st.subheader("性能")
+    max_concurrency = st.number_input("最大并发请求数", 1, 32, 4, 1, help="同时发送给模型的请求上限，受限于 API 的速率限制")
+    requests_per_minute = st.number_input("每分钟请求上限（0 不限）", 0, 10000, 0, 10)
+    tokens_per_minute = st.number_input("每分钟 token 上限（0 不限）", 0, 10000000, 0, 10000)
+    chunk_tokens = st.number_input("抽取分块 token 预算（0 按模型默认）", 0, 60000, 0, 500,
+                                   help="每次抽取请求发送的原文上限，越大请求越少，但不能超过模型上下文")
+    retrieval_recall = st.slider("关键词预筛召回比例", 0.01, 1.0, 0.1, 0.01,
+                                 help="有关键词时先在本地检索相关段落，只把这部分原文发给模型；1 表示全文发送")
+    parse_statutes = st.checkbox("本地解析法条文档", value=True,
+                                 help="按 第X章/第X条 结构直接切出条文，不调用模型；案例、讲义等材料仍由模型抽取")
+    card_batch_size = st.number_input("每次制卡请求打包的知识点数", 1, 20, 8, 1, help="多个知识点合并为一次请求，显著减少调用次数；1 表示逐条请求")
+    use_llm_cache = st.checkbox("复用模型响应缓存", value=True, help="输入与参数未变时直接使用本地缓存的响应，不再调用 API")
+    trace = st.checkbox("写运行追踪文件", value=False, help="把各阶段耗时与每次模型调用逐条写入 data/traces/<run ID>.jsonl")
+    doc_stats = get_document_store().stats()
+    st.caption(f"解析缓存：{doc_stats['entries']} 个文档，{doc_stats['bytes'] / 1024 / 1024:.1f} MB，"
+               f"本次会话命中率 {doc_stats['hit_ratio']:.0%}")
 #=================================================================================================================================
 #主页面布置
 
@@ -84,12 +189,32 @@ with col1:
     run_btn = st.button("运行抽取与制卡", type="primary")
 with col2:
     reset_btn = st.button("重置")
+
+# 最近的任务（所有会话共享）：可以查看任何一个任务的进度与结果，中断、取消或失败的任务可以从检查点继续
+recent_jobs = jobs.list(10)
+attach_btn = resume_btn = False
+picked_job = None
+if recent_jobs:
+    active_count = sum(j["status"] in ACTIVE_STATUSES for j in recent_jobs)
+    with st.expander(f"任务队列（{active_count} 个进行中）"):
+        picked_job = st.selectbox("选择任务", recent_jobs,
+                                  format_func=lambda j: f"{datetime.fromtimestamp(j['created_at']):%m-%d %H:%M} · "
+                                                        f"{JOB_STATUS_LABELS.get(j['status'], j['status'])} · "
+                                                        f"{j['metadata'].get('files', j['id'])}")
+        col3, col4 = st.columns(2)
+        with col3:
+            attach_btn = st.button("查看该任务")
+        with col4:
+            resume_btn = st.button("继续运行", disabled=picked_job["status"] not in RESUMABLE_STATUSES)
 #=================================================================================================================================
 # 第一步运行管线时的判断逻辑与数据流
 
 if reset_btn:
     st.session_state.pipeline_output = None
-    st.session_state.cards_selected = {}
+    st.session_state.card_index = None
+    st.session_state.cards_selected = set()
+    st.session_state.active_job = None
+    st.query_params.clear()
     st.rerun()
 
 if run_btn:
@@ -102,35 +227,69 @@ if run_btn:
         os.makedirs("data/uploads", exist_ok=True)
         # 保存上传文件的绝对路径/相对路径，便于后续代码需要
         saved_paths = []
-        # 将文件路径拼接后写入指定路径并保存（会覆盖同名文件）
+        # 将文件路径拼接后写入指定路径并保存（同名文件内容变化时才覆盖，避免每次点击都重写）
         for uf in uploaded_files:
             save_path = os.path.join("data", "uploads", uf.name)
-            with open(save_path, "wb") as f:
-                f.write(uf.getbuffer())
+            data = uf.getvalue()
+            unchanged = False
+            if os.path.exists(save_path) and os.path.getsize(save_path) == len(data):
+                with open(save_path, "rb") as f:
+                    unchanged = f.read() == data
+            if not unchanged:
+                with open(save_path, "wb") as f:
+                    f.write(data)
             saved_paths.append(save_path)
 
-        #信息反馈：配合with形成旋转加载效果
-        with st.spinner("运行管线中，请稍候…"):
-            try:
-                input = PipelineInput(file_paths= saved_paths,
-                                      keywords=keywords,
-                                      api_base=base_url,
-                                      api_key=api_key,
-                                      extract_model=extract_model,
-                                      card_model=card_model,
-                                      dedup_threshold=dedup_threshold,
-                                      min_quality=min_quality,
-                                      max_cards_per_item=int(max_cards_per_item))
-                
-                thread_config = {
-                    "configurable": {
-                        "thread_id": "1001"
-                }
-}
-                output = run_pipeline.invoke(input, config = thread_config)
-            except Exception as e:
-                output = {"documents": [], "extracted_items": [], "cards": [], "errors": [f"运行失败: {e}"]}
-        st.session_state.pipeline_output = output
+        # API Key 通过运行配置传入，不随输入写进检查点；每次运行是一个新的后台任务，中断后可在上方续跑
+        try:
+            input = PipelineInput(file_paths= saved_paths,
+                                  keywords=keywords,
+                                  api_base=base_url,
+                                  api_key="",
+                                  extract_model=extract_model,
+                                  card_model=card_model,
+                                  dedup_threshold=dedup_threshold,
+                                  min_quality=min_quality,
+                                  max_cards_per_item=int(max_cards_per_item),
+                                  max_concurrency=int(max_concurrency),
+                                  requests_per_minute=int(requests_per_minute),
+                                  tokens_per_minute=int(tokens_per_minute),
+                                  use_llm_cache=use_llm_cache,
+                                  chunk_tokens=int(chunk_tokens),
+                                  card_batch_size=int(card_batch_size),
+                                  retrieval_recall=float(retrieval_recall),
+                                  parse_statutes=parse_statutes,
+                                  trace=trace)
+        except Exception as e:
+            _set_output(PipelineOutput(documents=[], extracted_items=[], cards=[], errors=[f"运行失败: {e}"]))
+        else:
+            st.session_state.active_job = jobs.submit(input, api_key, int(max_concurrency), metadata={
+                "files": ", ".join(uf.name for uf in uploaded_files), "keywords": ", ".join(keywords)})
+
+if attach_btn:
+    st.session_state.active_job = picked_job["id"]
+    st.session_state.loaded_job = None
+
+if resume_btn:
+    if not api_key or not base_url:
+        st.warning("请配置 Base URL 和 API Key")
+    else:
+        # 沿用原 run ID 从检查点续跑，已完成的解析与 LLM 请求不再重复
+        st.session_state.active_job = jobs.resume(picked_job["id"], api_key, int(max_concurrency))
+
+# 关联的任务还在运行时轮询进度；已结束的任务把结果载入本会话
+if st.session_state.active_job:
+    st.query_params["job"] = st.session_state.active_job
+    active = jobs.get(st.session_state.active_job)
+    if active is None:
+        st.session_state.active_job = None
+    elif active["status"] in ACTIVE_STATUSES:
+        _job_panel(active["id"])
+    else:
+        if st.session_state.loaded_job != active["id"]:
+            _load_job(active)
+        if active["status"] in ("cancelled", "interrupted"):
+            st.info(f"任务{JOB_STATUS_LABELS[active['status']]}，可在上方任务队列中继续运行")
 
 output = st.session_state.pipeline_output
 #=================================================================================================================================
@@ -143,63 +302,101 @@ if not output:
 else:
     docs = output.documents
     items = output.extracted_items
-    cards = output.cards
     errors = output.errors
+    index = st.session_state.card_index
+    if index is None:
+        index = st.session_state.card_index = CardIndex(output.cards)
+        st.session_state.cards_selected = set(index.ids)
 
     if errors:
         for err in errors:
             st.error(err)
     
-    # 可折叠/展开的容器组件
-    with st.expander("抽取结果（结构化）", expanded=False):
-        # 能先将python对象如list，dict等转为json格式，再用美化界面展示
-        st.json({"documents": docs, "items": items[:50]})
+    metrics = output.metrics
+    if metrics:
+        with st.expander("运行统计", expanded=False):
+            llm = metrics.get("llm", {})
+            col1, col2, col3, col4 = st.columns(4)
+            col1.metric("总耗时", f"{metrics.get('total_ms', 0) / 1000:.1f} s")
+            col2.metric("模型调用", llm.get("calls", 0), help=f"命中缓存 {llm.get('cached', 0)} 次，失败 {llm.get('failures', 0)} 次")
+            col3.metric("Token（输入/输出）", f"{llm.get('prompt_tokens', 0)} / {llm.get('completion_tokens', 0)}")
+            col4.metric("估算费用", f"¥{llm.get('cost', 0):.4f}")
+            st.dataframe([{"阶段": STAGE_LABELS.get(s["name"], s["name"]), "耗时 (ms)": s["ms"], "条数": s.get("count"),
+                           "复用缓存": s.get("cached", False)} for s in metrics.get("stages", [])], hide_index=True)
+            st.caption(f"单次调用耗时 p50 {llm.get('latency_ms_p50', 0):.0f} ms，p95 {llm.get('latency_ms_p95', 0):.0f} ms")
+            counters = {**metrics.get("counters", {}), **{f"scheduler.{k}": v for k, v in metrics.get("scheduler", {}).items()}}
+            if counters:
+                st.dataframe([{"计数": k, "值": v} for k, v in sorted(counters.items())], hide_index=True)
 
-    st.write(f"生成卡片数：{len(cards)}（根据阈值过滤后）")
+    # 可折叠/展开的容器组件；表格只渲染可见行，知识点再多也不会拖慢页面
+    with st.expander("抽取结果（结构化）", expanded=False):
+        st.dataframe([{"文档": d.name, "页数": d.pages, "字数": len(d.text)} for d in docs], hide_index=True)
+        st.dataframe([{"类型": i.type, "标题": i.title or "", "条号": i.articleNo or "", "文档": i.docName or "",
+                       "页码": "-".join(map(str, i.pageRange or [])), "内容": i.text or ""} for i in items],
+                     hide_index=True)
 
-    # 卡片列表渲染（复核并选择）- 增强版，支持LLM归纳展示和用户确认
+    # 卡片复核：筛选 + 分页表格，每次交互只渲染当前页
     st.info("💡 新功能：系统现在使用LLM智慧归纳生成卡片，您可以查看归纳过程并确认最终内容")
-    
-    for idx, card in enumerate(cards): # 将序列类型打上“下标”
-        card_id = f"card_{idx}"
-        include_default = True
-        quality = card.quality
-        # 切分三列的比例 - 调整为更好的布局
-        cols = st.columns([0.1, 0.5, 0.4])
-
-        with cols[0]:
-            # 展示界面为打勾框，并对streamlit_state的字典进行更新
-            # checkbox的特性有返回值为bool型，状态持久（对key唯一标识进行赋值）、触发重跑
-            st.session_state.cards_selected[card_id] = st.checkbox("选择", value=include_default, key=card_id)
-            
-        with cols[1]:
-            # 展示markdown
+    f1, f2, f3, f4 = st.columns(4)
+    tag_filter = f1.multiselect("按标签筛选", index.tags)
+    source_filter = f2.multiselect("按来源筛选", index.sources)
+    difficulty_filter = f3.multiselect("按难度筛选", index.difficulties, format_func=lambda d: d or "未标注")
+    text_filter = f4.text_input("搜索问题/答案")
+    filtered = index.filter(tag_filter, source_filter, difficulty_filter, text_filter)
+
+    b1, b2, b3, b4 = st.columns(4)
+    b1.button(f"全选筛选结果（{len(filtered)}）", on_click=_select_filtered, args=(filtered, True))
+    b2.button("取消选择筛选结果", on_click=_select_filtered, args=(filtered, False))
+    page_size = b3.selectbox("每页条数", [25, 50, 100, 200], index=1)
+    pages = max(1, -(-len(filtered) // page_size))
+    if st.session_state.get("review_page", 1) > pages:
+        st.session_state.review_page = pages
+    page = b4.number_input("页码", 1, pages, 1, 1, key="review_page")
+    page_ids, page, pages = page_slice(filtered, page, page_size)
+
+    grid_key = f"review_grid_{st.session_state.grid_version}_{page_key(page_ids)}"
+    st.data_editor(
+        pd.DataFrame(index.rows(page_ids, st.session_state.cards_selected),
+                     columns=["id", "选择", "问题", "答案", "来源", "标签", "难度", "质量分"]),
+        key=grid_key,
+        on_change=_on_grid_edit,
+        args=(grid_key, page_ids),
+        hide_index=True,
+        disabled=["问题", "答案", "来源", "标签", "难度", "质量分"],
+        column_config={
+            "id": None,
+            "选择": st.column_config.CheckboxColumn("选择", width="small"),
+            "问题": st.column_config.TextColumn("问题", width="large"),
+            "答案": st.column_config.TextColumn("答案", width="large"),
+        },
+    )
+    st.caption(f"生成卡片数：{len(index.cards)}（根据阈值过滤后），筛选后 {len(filtered)} 张，"
+               f"第 {page}/{pages} 页，已选择 {len(st.session_state.cards_selected)} 张")
+
+    # 单张卡片的详情（归纳过程、证据片段）按需展开，不再为每张卡片都渲染
+    if page_ids:
+        with st.expander("卡片详情"):
+            detail_id = st.selectbox("选择卡片", page_ids, format_func=lambda cid: index.by_id[cid].Question[:60])
+            card = index.by_id[detail_id]
             st.markdown(f"**Q**: {card.Question}")
             st.markdown(f"**A**: {card.Answer}")
-            
-            # 显示LLM归纳过程（如果有）
-            if hasattr(card, 'llm_induction') and card.llm_induction:
-                with st.expander("🧠 LLM归纳过程"):
-                    st.write(card.llm_induction)
-            
-        with cols[2]:
-            #小号文字，颜色更淡，用于写补充性的文字
-            st.caption(f"来源：{card.SourceDoc}（{card.SourceLoc}）")
-            st.caption(f"标签：{', '.join(card.Tags)}")
-            st.caption(f"难度：{card.Difficulty}  质量分：{quality:.2f}")
-            
-            # 显示归纳提示版本（如果有）
-            if hasattr(card, 'induction_prompt') and card.induction_prompt:
+            st.caption(f"来源：{card.SourceDoc}（{card.SourceLoc}）  标签：{', '.join(card.Tags)}  "
+                       f"难度：{card.Difficulty}  质量分：{card.quality:.2f}")
+            if card.induction_prompt:
                 st.caption(f"归纳方式: {card.induction_prompt}")
-            
-            with st.expander("证据片段"):
-                st.write(card.Evidence)
-        st.divider()
+            if card.llm_induction:
+                st.markdown("**🧠 LLM归纳过程**")
+                st.write(card.llm_induction)
+            st.markdown("**证据片段**")
+            st.write(card.Evidence)
 
-    exportable = [c for i, c in enumerate(cards) if st.session_state.cards_selected.get(f"card_{i}")]
+    exportable = index.selected_cards(st.session_state.cards_selected)
 
     st.subheader("Step 3 - 导出 .apkg")
-    deck_name = st.text_input("Deck 名称", value=f"Law-Notes-{datetime.now().strftime('%Y%m%d-%H%M')}")
+    # 默认名称由来源文档与关键词决定，不含时间：同一批资料多次导出落到同一个牌组与清单，增量导出才能生效
+    deck_name = st.text_input("Deck 名称", value=default_deck_name(index.sources, keywords))
+    incremental_export = st.checkbox("增量导出", value=False,
+                                     help="只写入该牌组上次导出后新增或内容有变化的卡片；导入 Anki 时按 GUID 原地更新，需保持牌组名称不变")
     
     # 添加导出前确认机制
     if len(exportable) > 0:
@@ -222,10 +419,21 @@ else:
                 st.warning("请先确认卡片内容无误")
             else:
                 os.makedirs("exports", exist_ok=True)
-                apkg_path = export_to_apkg(deck_name=deck_name, cards=exportable, output_dir="exports")
-                with open(apkg_path, "rb") as f:
-                    data = f.read()
-                st.success(f"已导出：{apkg_path}")
-                st.download_button("下载 .apkg", data=data, file_name=os.path.basename(apkg_path), mime="application/octet-stream")
+                result = export_deck(deck_name=deck_name, cards=exportable, output_dir="exports",
+                                     incremental=incremental_export)
+                # 增量模式下导入 Anki 的是增量包；完整牌组照常写出，供首次导入或重建牌组
+                apkg_path = result["delta_path"] if incremental_export else result["path"]
+                summary = f"新增 {result['added']} 张，更新 {result['updated']} 张，未变化 {result['unchanged']} 张"
+                if apkg_path is None:
+                    st.info(f"没有需要导出的新卡片（{summary}）")
+                else:
+                    with open(apkg_path, "rb") as f:
+                        data = f.read()
+                    st.success(f"已导出：{apkg_path}（{summary}）")
+                    st.download_button("下载 .apkg", data=data, file_name=os.path.basename(apkg_path), mime="application/octet-stream")
+                if incremental_export and result["path"]:
+                    with open(result["path"], "rb") as f:
+                        st.download_button("下载完整牌组", data=f.read(), file_name=os.path.basename(result["path"]),
+                                           mime="application/octet-stream")
     else:
         st.warning("请至少选择一张卡片")
@@ -0,0 +1,85 @@
+"""
+去重基准：比较 DedupIndex 与逐对比较在 1k/10k/50k 张卡片上的耗时
+
+用法：
+    python benchmarks/bench_dedup.py
+    python benchmarks/bench_dedup.py --sizes 1000 10000 --brute-max 10000 --threshold 0.88
+
+卡片为合成的中文法律问答，约 30% 为已有卡片的轻微改写（近重复）。
+逐对比较只在 size ≤ --brute-max 时运行，并校验两者保留的卡片完全一致。
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from models.schemas import Card  # noqa: E402
+from pipeline.nodes.quality import deduplicate_cards, deduplicate_cards_bruteforce  # noqa: E402
+
+# 汉字使用频率近似 Zipf 分布：少数常用字占大头，长尾字区分度高
+_VOCAB = [chr(0x4E00 + i) for i in range(3500)]
+_WEIGHTS = [1.0 / (rank + 1) for rank in range(len(_VOCAB))]
+_STEMS = ["什么是", "如何认定", "哪些情形属于", "构成要件包括", "法律后果是", "适用条件为"]
+
+
+def _phrase(rng: random.Random, n: int) -> str:
+    return "".join(rng.choices(_VOCAB, weights=_WEIGHTS, k=n))
+
+
+def _mutate(rng: random.Random, s: str) -> str:
+    chars = list(s)
+    for _ in range(rng.randint(1, 3)):
+        i = rng.randrange(len(chars))
+        if rng.random() < 0.5:
+            chars[i] = _phrase(rng, 1)
+        else:
+            chars.insert(i, _phrase(rng, 1))
+    return "".join(chars)
+
+
+def synthetic_cards(n: int, seed: int = 42) -> list:
+    rng = random.Random(seed)
+    cards = []
+    for i in range(n):
+        if cards and rng.random() < 0.3:
+            src = rng.choice(cards)
+            q, a = _mutate(rng, src.Question), _mutate(rng, src.Answer)
+        else:
+            q = f"{_phrase(rng, rng.randint(4, 10))}{rng.choice(_STEMS)}{_phrase(rng, rng.randint(2, 8))}？"
+            a = _phrase(rng, rng.randint(40, 160)) + "。"
+        cards.append(Card(Question=q, Answer=a, SourceDoc="bench", SourceLoc=f"第{i}条"))
+    return cards
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--threshold", type=float, default=0.88)
+    parser.add_argument("--brute-max", type=int, default=1000, help="逐对比较的最大规模（O(n²)，较大时很慢）")
+    args = parser.parse_args()
+
+    print(f"{'cards':>8} {'kept':>8} {'index(s)':>10} {'brute(s)':>10} {'speedup':>8}  same")
+    for n in args.sizes:
+        cards = synthetic_cards(n)
+        t0 = time.perf_counter()
+        kept = deduplicate_cards(cards, args.threshold)
+        t_index = time.perf_counter() - t0
+
+        t_brute, same = None, "-"
+        if n <= args.brute_max:
+            t0 = time.perf_counter()
+            ref = deduplicate_cards_bruteforce(cards, args.threshold)
+            t_brute = time.perf_counter() - t0
+            same = "yes" if [id(c) for c in kept] == [id(c) for c in ref] else "NO"
+
+        brute_col = f"{t_brute:>10.3f}" if t_brute is not None else f"{'-':>10}"
+        speed_col = f"{t_brute / t_index:>7.1f}x" if t_brute is not None else f"{'-':>8}"
+        print(f"{n:>8} {len(kept):>8} {t_index:>10.3f} {brute_col} {speed_col}  {same}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""
+端到端基准：在本地模拟的 OpenAI 兼容服务上完整运行 run_pipeline
+
+用法：
+    python benchmarks/bench_pipeline.py
+    python benchmarks/bench_pipeline.py --sizes 20000 200000 --latency-ms 800 --error-rate 0.05 --json bench.json
+
+场景包括 data/uploads 下的示例 PDF，以及按 --sizes（字数）合成的法条式文本。每个场景在独立的子进程、
+独立的临时工作目录中运行：解析缓存、阶段缓存、响应缓存与检查点都从空开始，峰值内存互不影响。
+报告墙钟时间、模型调用次数、token 用量、峰值 RSS，以及 PipelineOutput.metrics 中各阶段的耗时，
+任何一个节点的性能回退都会体现在数字上。模拟服务的用法见 benchmarks/mock_openai.py。
+"""
+
+import argparse
+import glob
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mock_openai import MockConfig, MockOpenAIServer  # noqa: E402
+
+_RESULT_PREFIX = "BENCH_RESULT "
+_SUBJECTS = ["经营者", "行政机关", "当事人", "人民法院", "监督检查部门", "行为人"]
+_ACTS = ["不得实施不正当竞争行为", "应当依法履行告知义务", "可以申请行政复议", "应当承担相应的民事责任",
+         "不得滥用相对优势地位", "应当遵循自愿、平等、公平、诚信的原则"]
+_CONDITIONS = ["在生产经营活动中", "违反本法规定", "情节严重的", "造成损害的", "经责令改正拒不改正的"]
+
+
+def synthetic_statute(chars: int, keyword: str = "不正当竞争", seed: int = 42) -> str:
+    """合成约 chars 字的法条式文本（编/章/条），约一成条文包含关键词"""
+    rng = random.Random(seed)
+    parts: List[str] = []
+    size = 0
+    article = 0
+    while size < chars:
+        if article % 40 == 0:
+            parts.append(f"第{article // 40 + 1}章 一般规定")
+        article += 1
+        sentences = []
+        for _ in range(rng.randint(2, 4)):
+            subject = rng.choice(_SUBJECTS)
+            act = rng.choice(_ACTS)
+            if rng.random() < 0.1:
+                act = f"不得从事{keyword}活动"
+            sentences.append(f"{rng.choice(_CONDITIONS)}，{subject}{act}。")
+        parts.append(f"第{article}条 " + "".join(sentences))
+        size += len(parts[-1])
+    return "\n".join(parts)
+
+
+def _peak_rss_mb() -> Optional[float]:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 以 KB 计，macOS 以字节计
+    return round(peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024, 1)
+
+
+def run_worker(spec: Dict[str, Any]) -> Dict[str, Any]:
+    """子进程中运行一次管线（当前目录为临时工作目录）"""
+    from models.schemas import PipelineInput
+    from pipeline.graph import new_run_config, run_pipeline
+
+    pipeline_input = PipelineInput(
+        file_paths=spec["files"],
+        keywords=spec["keywords"],
+        api_base=spec["api_base"],
+        api_key="bench",
+        extract_model=spec["model"],
+        card_model=spec["model"],
+        dedup_threshold=0.88,
+        min_quality=0.3,
+        max_cards_per_item=3,
+        max_concurrency=spec["concurrency"],
+        use_llm_cache=False,
+        card_batch_size=spec["batch_size"],
+        retrieval_recall=spec["recall"],
+        parse_statutes=spec["parse_statutes"],
+    )
+    started = time.perf_counter()
+    output = run_pipeline.invoke(pipeline_input, config=new_run_config("bench", spec["concurrency"]))
+    wall = time.perf_counter() - started
+    return {
+        "wall_s": round(wall, 3),
+        "documents": len(output.documents),
+        "chars": sum(len(d.text) for d in output.documents),
+        "items": len(output.extracted_items),
+        "cards": len(output.cards),
+        "errors": len(output.errors),
+        "peak_rss_mb": _peak_rss_mb(),
+        "metrics": output.metrics,
+    }
+
+
+def run_scenario(name: str, files: List[str], server: MockOpenAIServer, args: argparse.Namespace) -> Dict[str, Any]:
+    spec = {
+        "files": [os.path.abspath(f) for f in files],
+        "keywords": args.keywords,
+        "api_base": server.base_url,
+        "model": args.model,
+        "concurrency": args.concurrency,
+        "batch_size": args.batch_size,
+        "recall": args.recall,
+        "parse_statutes": not args.no_statute_parser,
+    }
+    server.reset_stats()
+    with tempfile.TemporaryDirectory(prefix="bench_pipeline_") as workdir:
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get("PYTHONPATH")])))
+        proc = subprocess.run([sys.executable, os.path.abspath(__file__), "--worker", json.dumps(spec)],
+                              cwd=workdir, env=env, capture_output=True, text=True, encoding="utf-8")
+    lines = [line for line in proc.stdout.splitlines() if line.startswith(_RESULT_PREFIX)]
+    if proc.returncode != 0 or not lines:
+        raise RuntimeError(f"场景 {name} 运行失败：\n{proc.stderr[-2000:]}")
+    result = json.loads(lines[-1][len(_RESULT_PREFIX):])
+    result["name"] = name
+    result["server"] = server.reset_stats()
+    return result
+
+
+def print_report(results: List[Dict[str, Any]]) -> None:
+    print(f"{'scenario':<14} {'docs':>5} {'chars':>9} {'items':>6} {'cards':>6} {'wall(s)':>8} {'calls':>6} "
+          f"{'429':>5} {'in_tok':>9} {'out_tok':>9} {'p95(ms)':>8} {'rss(MB)':>8}")
+    for r in results:
+        llm = r["metrics"].get("llm", {})
+        rss = f"{r['peak_rss_mb']:>8.1f}" if r["peak_rss_mb"] is not None else f"{'-':>8}"
+        print(f"{r['name']:<14} {r['documents']:>5} {r['chars']:>9} {r['items']:>6} {r['cards']:>6} "
+              f"{r['wall_s']:>8.2f} {r['server']['requests']:>6} {r['server']['errors']:>5} "
+              f"{llm.get('prompt_tokens', 0):>9} {llm.get('completion_tokens', 0):>9} "
+              f"{llm.get('latency_ms_p95', 0):>8.0f} {rss}")
+
+    stage_names: List[str] = []
+    for r in results:
+        for s in r["metrics"].get("stages", []):
+            if s["name"] not in stage_names:
+                stage_names.append(s["name"])
+    print()
+    print(f"{'stage (ms)':<14} " + " ".join(f"{n:>10}" for n in stage_names))
+    for r in results:
+        ms = {s["name"]: s["ms"] for s in r["metrics"].get("stages", [])}
+        print(f"{r['name']:<14} " + " ".join(f"{ms[n]:>10.1f}" if n in ms else f"{'-':>10}" for n in stage_names))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="*", default=[20000, 100000, 500000], help="合成语料的字数")
+    parser.add_argument("--no-uploads", action="store_true", help="不运行 data/uploads 下的示例 PDF")
+    parser.add_argument("--keywords", nargs="+", default=["不正当竞争"])
+    parser.add_argument("--model", default="DeepSeek-V3")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--batch-size", type=int, default=8, help="每次制卡请求打包的知识点数")
+    parser.add_argument("--recall", type=float, default=0.1, help="关键词预筛召回比例")
+    parser.add_argument("--no-statute-parser", action="store_true",
+                        help="法条文档也走模型抽取（合成语料是法条式文本，默认会被本地解析）")
+    parser.add_argument("--latency-ms", type=float, default=200.0, help="模拟服务的延迟中位数")
+    parser.add_argument("--latency-sigma", type=float, default=0.5)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="模拟服务返回 429 的比例")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="把完整结果（含 metrics）写入该文件，便于对比回归")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(_RESULT_PREFIX + json.dumps(run_worker(json.loads(args.worker)), ensure_ascii=False))
+        return
+
+    scenarios = []
+    uploads = sorted(glob.glob(os.path.join(ROOT, "data", "uploads", "*.pdf")))
+    if uploads and not args.no_uploads:
+        scenarios.append(("uploads", uploads))
+
+    config = MockConfig(latency_ms=args.latency_ms, latency_sigma=args.latency_sigma, error_rate=args.error_rate,
+                        seed=args.seed)
+    server = MockOpenAIServer(config=config).start()
+    results = []
+    with tempfile.TemporaryDirectory(prefix="bench_corpus_") as corpus_dir:
+        for chars in args.sizes:
+            path = os.path.join(corpus_dir, f"synthetic_{chars}.txt")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(synthetic_statute(chars, args.keywords[0]))
+            scenarios.append((f"synth-{chars // 1000}k", [path]))
+        try:
+            for name, files in scenarios:
+                print(f"running {name} ...", file=sys.stderr)
+                results.append(run_scenario(name, files, server, args))
+        finally:
+            server.stop()
+
+    print_report(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"args": {k: v for k, v in vars(args).items() if k != "worker"}, "results": results}, f,
+                      ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
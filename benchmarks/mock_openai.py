@@ -0,0 +1,271 @@
+"""
+本地的 OpenAI 兼容模拟服务，供基准测试与离线调试使用，不消耗真实 API 额度
+
+用法：
+    python benchmarks/mock_openai.py --port 8765 --latency-ms 800 --error-rate 0.05
+    # 然后把 Base URL 设为 http://127.0.0.1:8765/v1，API Key 任意
+
+只实现 POST .../chat/completions（含 stream=true 的 SSE）。按提示词识别请求类型并返回固定格式的 JSON：
+结构化抽取与语义补充从原文中摘录句子作为条目，制卡（逐条/批量）为每个条目生成若干张卡片，
+其余请求返回空的 {"cards": []}。响应内容由请求内容决定，同样的输入得到同样的输出。
+延迟服从对数正态分布（--latency-ms 为中位数），--error-rate 比例的请求返回 429。
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from llm.tokens import estimate_messages_tokens, estimate_tokens  # noqa: E402
+
+_SENTENCE_RE = re.compile(r"[^。！？；\n]{12,}[。！？；]")
+_ITEM_RE = re.compile(r"【条目 (\d+)】\n内容：(.*?)\n来源：", re.S)
+_ITEM_TYPES = ("Statute", "JudicialInterpretation", "Case", "KeywordHit")
+
+
+class MockConfig:
+    def __init__(self, latency_ms: float = 0.0, latency_sigma: float = 0.5, error_rate: float = 0.0,
+                 items_per_chunk: int = 3, cards_per_item: int = 2, stream_chunk_chars: int = 24,
+                 seed: Optional[int] = None) -> None:
+        """
+        Args:
+            latency_ms: 单次请求延迟的中位数，0 表示立即返回
+            latency_sigma: 对数正态分布的 σ，越大长尾越重
+            error_rate: 返回 429 的请求比例
+            items_per_chunk: 每次抽取请求最多返回的条目数
+            cards_per_item: 每个条目生成的卡片数（不超过提示词要求的张数）
+            stream_chunk_chars: 流式响应每个分片的字符数
+        """
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.items_per_chunk = items_per_chunk
+        self.cards_per_item = cards_per_item
+        self.stream_chunk_chars = stream_chunk_chars
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+
+    def sample_latency(self) -> float:
+        if self.latency_ms <= 0:
+            return 0.0
+        with self.rng_lock:
+            return self.latency_ms / 1000.0 * self.rng.lognormvariate(0.0, self.latency_sigma)
+
+    def should_fail(self) -> bool:
+        if self.error_rate <= 0:
+            return False
+        with self.rng_lock:
+            return self.rng.random() < self.error_rate
+
+
+def _pick_sentences(text: str, n: int) -> List[str]:
+    """按内容哈希从原文中挑选 n 个句子，保证同样的输入得到同样的条目"""
+    sentences = [s.strip() for s in _SENTENCE_RE.findall(text)]
+    if not sentences:
+        return [text.strip()[:120]] if text.strip() else []
+    seed = int(hashlib.md5(text.encode("utf-8")).hexdigest()[:8], 16)
+    rng = random.Random(seed)
+    return rng.sample(sentences, min(n, len(sentences)))
+
+
+def _cards_for(content: str, n: int) -> List[Dict[str, str]]:
+    content = " ".join(content.split())
+    cards = []
+    for i in range(n):
+        head = content[i * 8:i * 8 + 20] or content[:20]
+        cards.append({
+            "type": "cloze" if i % 3 == 2 else "basic",
+            "Question": f"根据原文，“{head}”的含义是什么？（角度{i + 1}）",
+            "Answer": content[:160],
+            "Difficulty": ("easy", "medium", "hard")[i % 3],
+        })
+    return cards
+
+
+def _requested_cards(prompt: str, default: int) -> int:
+    m = re.search(r"生成(\d+)张", prompt)
+    return min(default, int(m.group(1))) if m else default
+
+
+def canned_response(messages: List[Dict[str, str]], config: MockConfig) -> str:
+    """按提示词识别请求类型，返回对应格式的 JSON 文本"""
+    system = next((m["content"] for m in messages if m.get("role") == "system"), "")
+    user = next((m["content"] for m in reversed(messages) if m.get("role") == "user"), "")
+    if "结构化助手" in system:
+        text = user.split("请对下列原文做结构化抽取：\n", 1)[-1]
+        items = [{"type": _ITEM_TYPES[i % len(_ITEM_TYPES)], "title": s[:16], "text": s, "evidence": s}
+                 for i, s in enumerate(_pick_sentences(text, config.items_per_chunk))]
+        return json.dumps({"items": items}, ensure_ascii=False)
+    if "results" in system:
+        n = _requested_cards(user, config.cards_per_item)
+        results = [{"index": int(idx), "cards": _cards_for(content, n)} for idx, content in _ITEM_RE.findall(user)]
+        return json.dumps({"results": results}, ensure_ascii=False)
+    if "Anki" in system:
+        content = user.split("内容：", 1)[-1].split("\n来源：", 1)[0]
+        return json.dumps({"cards": _cards_for(content, _requested_cards(user, config.cards_per_item))},
+                          ensure_ascii=False)
+    if "文档内容:" in user:
+        text = user.split("文档内容:", 1)[-1].rsplit("\n关键词:", 1)[0]
+        items = [{"type": "KeywordHit", "title": s[:16], "content": s, "evidence": s, "semantic_matches": []}
+                 for s in _pick_sentences(text, config.items_per_chunk)]
+        return json.dumps({"items": items}, ensure_ascii=False)
+    return json.dumps({"cards": []}, ensure_ascii=False)
+
+
+class MockOpenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, config: Optional[MockConfig] = None) -> None:
+        super().__init__((host, port), _Handler)
+        self.config = config or MockConfig()
+        self.stats = {"requests": 0, "errors": 0, "stream": 0, "prompt_tokens": 0, "completion_tokens": 0}
+        self.stats_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def count(self, **delta: int) -> None:
+        with self.stats_lock:
+            for k, v in delta.items():
+                self.stats[k] += v
+
+    def reset_stats(self) -> Dict[str, int]:
+        """返回当前计数并清零"""
+        with self.stats_lock:
+            out = dict(self.stats)
+            for k in self.stats:
+                self.stats[k] = 0
+        return out
+
+    def handle_error(self, request: Any, client_address: Any) -> None:
+        # 客户端中途断开（被测进程被杀死、请求超时）是预期内的，不打印堆栈
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    def start(self) -> "MockOpenAIServer":
+        """在后台线程中提供服务"""
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: MockOpenAIServer
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def _send_json(self, status: int, payload: Dict[str, Any]) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self) -> None:
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": f"unknown path {self.path}", "type": "not_found"}})
+            return
+        try:
+            request = json.loads(body or b"{}")
+        except ValueError:
+            self._send_json(400, {"error": {"message": "invalid JSON body", "type": "invalid_request_error"}})
+            return
+        config = self.server.config
+        time.sleep(config.sample_latency())
+        if config.should_fail():
+            self.server.count(requests=1, errors=1)
+            self._send_json(429, {"error": {"message": "rate limited (mock)", "type": "rate_limit_error"}})
+            return
+
+        messages = request.get("messages") or []
+        model = request.get("model") or "mock"
+        content = canned_response(messages, config)
+        prompt_tokens = estimate_messages_tokens(messages)
+        completion_tokens = estimate_tokens(content)
+        stream = bool(request.get("stream"))
+        self.server.count(requests=1, stream=int(stream), prompt_tokens=prompt_tokens,
+                          completion_tokens=completion_tokens)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        created = int(time.time())
+        if not stream:
+            self._send_json(200, {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                             "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                          "total_tokens": prompt_tokens + completion_tokens},
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        step = max(1, config.stream_chunk_chars)
+        for i in range(0, len(content), step):
+            self._send_event({"id": completion_id, "object": "chat.completion.chunk", "created": created,
+                              "model": model, "choices": [{"index": 0, "delta": {"content": content[i:i + step]},
+                                                           "finish_reason": None}]})
+        self._send_event({"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                          "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def _send_event(self, payload: Dict[str, Any]) -> None:
+        self.wfile.write(b"data: " + json.dumps(payload, ensure_ascii=False).encode("utf-8") + b"\n\n")
+        self.wfile.flush()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="延迟中位数（毫秒）")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="对数正态分布的 σ")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回 429 的请求比例")
+    parser.add_argument("--items-per-chunk", type=int, default=3)
+    parser.add_argument("--cards-per-item", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    config = MockConfig(latency_ms=args.latency_ms, latency_sigma=args.latency_sigma, error_rate=args.error_rate,
+                        items_per_chunk=args.items_per_chunk, cards_per_item=args.cards_per_item, seed=args.seed)
+    server = MockOpenAIServer(args.host, args.port, config)
+    print(f"mock OpenAI server on {server.base_url}  (Ctrl+C 退出)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(json.dumps(server.stats, ensure_ascii=False))
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
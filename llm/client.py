@@ -1,26 +1,357 @@
-import os
-from typing import List, Dict, Optional
-from openai import OpenAI
+import asyncio
+import copy
+import hashlib
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Awaitable, Dict, Iterator, List, Optional, Sequence, Tuple, TypeVar
 
-# 这个可能需要重构为chatOpenAI
-class DeepSeekClient:
-    def __init__(self, api_base: str, api_key: str, default_model: str = "DeepSeek-V3") -> None:
+import httpx
+from openai import AsyncOpenAI
+
+from llm.cache import ResponseCache, make_cache_key
+from llm.scheduler import is_retryable, note_cache_hit, retry_after
+from llm.tokens import estimate_messages_tokens, estimate_tokens
+from models.schemas import ChatResult
+
+T = TypeVar("T")
+
+# 连接池与超时：长连接复用，避免每个请求重新握手 TLS
+DEFAULT_LIMITS = httpx.Limits(max_connections=200, max_keepalive_connections=50, keepalive_expiry=60.0)
+DEFAULT_TIMEOUT = httpx.Timeout(120.0, connect=10.0)
+
+# httpx.AsyncClient 绑定创建它的事件循环：每个循环一个默认配置的连接池，该循环上的所有客户端共用
+_SHARED_HTTP: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+_SHARED_HTTP_LOCK = threading.Lock()
+
+_LOOP: Optional[asyncio.AbstractEventLoop] = None
+_LOOP_LOCK = threading.Lock()
+
+
+def _shared_http_client(loop: asyncio.AbstractEventLoop) -> httpx.AsyncClient:
+    with _SHARED_HTTP_LOCK:
+        client = _SHARED_HTTP.get(loop)
+        if client is None:
+            client = httpx.AsyncClient(limits=DEFAULT_LIMITS, timeout=DEFAULT_TIMEOUT)
+            _SHARED_HTTP[loop] = client
+        return client
+
+
+def _background_loop() -> asyncio.AbstractEventLoop:
+    """进程内共享的后台事件循环；同步客户端把请求提交到这里，所有请求共用同一个连接池"""
+    global _LOOP
+    with _LOOP_LOCK:
+        if _LOOP is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="llm-client-loop", daemon=True).start()
+            _LOOP = loop
+        return _LOOP
+
+
+def _run(awaitable: Awaitable[T]) -> T:
+    """在后台事件循环上执行协程，阻塞当前线程直到完成"""
+    async def _await() -> T:
+        return await awaitable
+    return asyncio.run_coroutine_threadsafe(_await(), _background_loop()).result()
+
+
+def _iter_async(agen: AsyncIterator[T]) -> Iterator[T]:
+    """把后台事件循环上的异步生成器转成同步迭代器；提前结束时关闭生成器"""
+    done = object()
+
+    async def _next() -> Any:
+        try:
+            return await agen.__anext__()
+        except StopAsyncIteration:
+            return done
+
+    try:
+        while True:
+            value = _run(_next())
+            if value is done:
+                return
+            yield value
+    finally:
+        _run(agen.aclose())
+
+
+class LLMRequestError(Exception):
+    """失败的 ChatResult 转成的异常，带上状态码与重试提示，调度器据此决定是否退避重试"""
+
+    def __init__(self, result: ChatResult) -> None:
+        super().__init__(result.error or "LLM 请求失败")
+        self.result = result
+        self.status_code = result.status_code
+        self.retryable = result.retryable
+        self.retry_after = result.retry_after
+
+
+def content_or_raise(result: ChatResult) -> str:
+    """成功时返回内容，失败时抛出 LLMRequestError；供经调度器提交、需要失败重试的节点使用"""
+    if not result.ok:
+        raise LLMRequestError(result)
+    return result.content
+
+
+def _error_result(exc: Exception, model: str, started: float) -> ChatResult:
+    status = getattr(exc, "status_code", None)
+    return ChatResult(
+        ok=False,
+        error=f"{type(exc).__name__}: {exc}",
+        status_code=status if isinstance(status, int) else None,
+        retryable=is_retryable(exc),
+        retry_after=retry_after(exc),
+        model=model,
+        latency_ms=(time.perf_counter() - started) * 1000,
+    )
+
+
+class AsyncDeepSeekClient:
+    """
+    异步客户端：同一事件循环内共享一个带长连接池的 httpx.AsyncClient，
+    每次请求返回 ChatResult（内容、错误、耗时与 token 用量），不抛出异常
+    """
+
+    def __init__(
+        self,
+        api_base: str,
+        api_key: str,
+        default_model: str = "DeepSeek-V3",
+        cache: Optional[ResponseCache] = None,
+        limits: httpx.Limits = DEFAULT_LIMITS,
+        timeout: httpx.Timeout = DEFAULT_TIMEOUT,
+        max_retries: int = 0,
+    ) -> None:
+        """
+        Args:
+            limits: 连接池上限（最大连接数、保活连接数、保活时长）；取默认值时与同一循环上的其他客户端共用连接池
+            timeout: 请求超时（总超时与建连超时）
+            max_retries: SDK 内部对可重试错误的重试次数；经 RateLimitedScheduler 提交时保持 0，
+                由调度器退避，否则它看不到限流、无法收缩速率
+        """
         if not api_base or not api_key:
             raise ValueError("api_base 和 api_key 不能为空")
-        self.client = OpenAI(base_url=api_base, api_key=api_key)
+        self.api_base = api_base
+        self.api_key = api_key
         self.default_model = default_model
+        self.cache = cache
+        self.limits = limits
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.metrics = None  # 本次运行的指标记录器（pipeline/utils/metrics.py），见 with_metrics
+        self._clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncOpenAI]" = weakref.WeakKeyDictionary()
+        self._own_http: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
 
-    def chat(self, messages: List[Dict[str, str]], model: Optional[str] = None, temperature: float = 0.2, max_tokens: Optional[int] = None) -> str:
+    def with_metrics(self, metrics: Any) -> "AsyncDeepSeekClient":
+        """返回共享连接与缓存、但把每次调用记录到 metrics 的浅拷贝"""
+        clone = copy.copy(self)
+        clone.metrics = metrics
+        return clone
+
+    def _client(self) -> AsyncOpenAI:
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            if self.limits is DEFAULT_LIMITS and self.timeout is DEFAULT_TIMEOUT:
+                http_client = _shared_http_client(loop)
+            else:
+                http_client = httpx.AsyncClient(limits=self.limits, timeout=self.timeout)
+                self._own_http[loop] = http_client
+            client = AsyncOpenAI(base_url=self.api_base, api_key=self.api_key, http_client=http_client,
+                                 max_retries=self.max_retries)
+            self._clients[loop] = client
+        return client
+
+    def _record(self, result: ChatResult, estimated: bool = False, stream: bool = False) -> None:
+        if self.metrics is not None:
+            self.metrics.record_call(result.model, result.latency_ms, prompt_tokens=result.prompt_tokens,
+                                     completion_tokens=result.completion_tokens, cached=result.cached, ok=result.ok,
+                                     estimated=estimated, stream=stream)
+
+    def lookup(self, messages: List[Dict[str, str]], model: Optional[str] = None, temperature: float = 0.2,
+               max_tokens: Optional[int] = None, stream: bool = False) -> Tuple[Optional[str], Optional[ChatResult]]:
+        """查本地响应缓存，返回 (缓存键, 命中时的结果)；没有缓存时键为 None"""
+        if self.cache is None:
+            return None, None
         model_name = model or self.default_model
+        started = time.perf_counter()
+        key = make_cache_key(model_name, messages, temperature, max_tokens)
+        cached = self.cache.get(key)
+        if cached is None:
+            return key, None
+        result = ChatResult(content=cached, model=model_name, cached=True,
+                            latency_ms=(time.perf_counter() - started) * 1000)
+        self._record(result, stream=stream)
+        return key, result
+
+    async def complete(self, messages: List[Dict[str, str]], model: Optional[str] = None, temperature: float = 0.2,
+                       max_tokens: Optional[int] = None) -> ChatResult:
+        key, hit = self.lookup(messages, model, temperature, max_tokens)
+        if hit is not None:
+            return hit
+        model_name = model or self.default_model
+        started = time.perf_counter()
+        try:
+            resp = await self._client().chat.completions.create(
+                model=model_name,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+            )
+        except Exception as e:
+            result = _error_result(e, model_name, started)
+            self._record(result)
+            return result
+        content = resp.choices[0].message.content or ""
+        usage = resp.usage
+        result = ChatResult(
+            content=content,
+            model=model_name,
+            latency_ms=(time.perf_counter() - started) * 1000,
+            prompt_tokens=getattr(usage, "prompt_tokens", 0) or 0,
+            completion_tokens=getattr(usage, "completion_tokens", 0) or 0,
+        )
+        self._record(result)
+        # 空响应不写入缓存，下次仍会重新请求
+        if key is not None and content:
+            self.cache.set(key, content, model=model_name)
+        return result
+
+    chat = complete
+
+    async def stream_live(self, key: Optional[str], messages: List[Dict[str, str]], model: Optional[str] = None,
+                          temperature: float = 0.2, max_tokens: Optional[int] = None) -> AsyncIterator[str]:
+        """不查缓存、直接发出流式请求（先用 lookup 查缓存）；完整接收后以 key 写入缓存。失败时抛出异常"""
+        model_name = model or self.default_model
+        started = time.perf_counter()
+        parts: List[str] = []
         try:
-            resp = self.client.chat.completions.create(
+            response = await self._client().chat.completions.create(
                 model=model_name,
                 messages=messages,
                 temperature=temperature,
                 max_tokens=max_tokens,
+                stream=True,
             )
-            return resp.choices[0].message.content or ""
+            async for chunk in response:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    parts.append(delta)
+                    yield delta
         except Exception as e:
-            # 记录到控制台，避免中断应用
-            print(f"[DeepSeekClient.chat] 调用失败: {e}")
-            return ""
+            self._record(_error_result(e, model_name, started), stream=True)
+            raise
+        content = "".join(parts)
+        # 流式响应默认不带用量，按本地估算记录
+        self._record(ChatResult(content=content, model=model_name,
+                                latency_ms=(time.perf_counter() - started) * 1000,
+                                prompt_tokens=estimate_messages_tokens(messages),
+                                completion_tokens=estimate_tokens(content)), estimated=True, stream=True)
+        if key is not None and content:
+            self.cache.set(key, content, model=model_name)
+
+    async def stream(self, messages: List[Dict[str, str]], model: Optional[str] = None, temperature: float = 0.2,
+                     max_tokens: Optional[int] = None) -> AsyncIterator[str]:
+        """
+        流式返回内容片段，可配合 pipeline/utils/json_stream.py 边生成边解析；
+        命中缓存时一次性返回完整响应。流已开始后无法再以 ChatResult 表示失败，因此调用失败时抛出异常
+        """
+        key, hit = self.lookup(messages, model, temperature, max_tokens, stream=True)
+        if hit is not None:
+            yield hit.content
+            return
+        async for piece in self.stream_live(key, messages, model, temperature, max_tokens):
+            yield piece
+
+    async def chat_many(self, requests: Sequence[Dict[str, Any]], max_concurrency: int = 16) -> List[ChatResult]:
+        """
+        并发执行多个请求，结果与 requests 顺序一致
+
+        Args:
+            requests: 每项为 complete 的关键字参数（messages、model、temperature、max_tokens）
+            max_concurrency: 同时在途的最大请求数
+        """
+        semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+        async def _one(kwargs: Dict[str, Any]) -> ChatResult:
+            async with semaphore:
+                return await self.complete(**kwargs)
+
+        return list(await asyncio.gather(*(_one(r) for r in requests)))
+
+    async def aclose(self) -> None:
+        """释放当前事件循环上的客户端；共用的默认连接池随事件循环一起释放"""
+        loop = asyncio.get_running_loop()
+        self._clients.pop(loop, None)
+        http_client = self._own_http.pop(loop, None)
+        if http_client is not None:
+            await http_client.aclose()
+
+
+# 这个可能需要重构为chatOpenAI
+class DeepSeekClient:
+    """
+    同步接口：请求提交到进程内共享的后台事件循环，由 AsyncDeepSeekClient 发出，
+    所有实例共用同一个长连接池。complete/chat 返回 ChatResult，失败时 ok=False 而不是抛出异常
+    """
+
+    def __init__(self, api_base: str, api_key: str, default_model: str = "DeepSeek-V3", cache: Optional[ResponseCache] = None) -> None:
+        self.aclient = AsyncDeepSeekClient(api_base, api_key, default_model=default_model, cache=cache)
+        self.default_model = default_model
+        self.cache = cache
+        self.metrics = None  # 本次运行的指标记录器（pipeline/utils/metrics.py），见 with_metrics
+
+    def with_metrics(self, metrics: Any) -> "DeepSeekClient":
+        """返回共享连接与缓存、但把每次调用记录到 metrics 的浅拷贝；共享的客户端实例本身不受影响"""
+        clone = copy.copy(self)
+        clone.metrics = metrics
+        clone.aclient = self.aclient.with_metrics(metrics)
+        return clone
+
+    def complete(self, messages: List[Dict[str, str]], model: Optional[str] = None, temperature: float = 0.2, max_tokens: Optional[int] = None) -> ChatResult:
+        """
+        发出一次请求，返回内容、错误、耗时与 token 用量；经调度器提交时用 content_or_raise 取内容，失败才会重试。
+        命中缓存时通知调度器（note_cache_hit）退回占用的速率额度
+        """
+        result = _run(self.aclient.complete(messages, model, temperature, max_tokens))
+        if result.cached:
+            note_cache_hit()
+        return result
+
+    chat = complete
+
+    def stream(self, messages: List[Dict[str, str]], model: Optional[str] = None, temperature: float = 0.2, max_tokens: Optional[int] = None) -> Iterator[str]:
+        """
+        流式返回内容片段，可配合 pipeline/utils/json_stream.py 边生成边解析；
+        命中缓存时一次性返回完整响应，完整接收后写入缓存。调用失败时抛出异常
+        """
+        key, hit = self.aclient.lookup(messages, model, temperature, max_tokens, stream=True)
+        if hit is not None:
+            note_cache_hit()
+            yield hit.content
+            return
+        yield from _iter_async(self.aclient.stream_live(key, messages, model, temperature, max_tokens))
+
+
+# 最近使用的客户端实例；以密钥的哈希为键，超出上限时淘汰最久未用的，不会随用过的密钥无限增长
+_CLIENTS: "OrderedDict[Tuple[str, str, str, int], DeepSeekClient]" = OrderedDict()
+_CLIENTS_LOCK = threading.Lock()
+MAX_CLIENTS = 16
+
+
+def get_client(api_base: str, api_key: str, default_model: str = "DeepSeek-V3", cache: Optional[ResponseCache] = None) -> DeepSeekClient:
+    """按 (api_base, api_key, 模型, 缓存) 复用客户端实例，避免每次运行都重建；连接池由所有实例共用"""
+    key = (api_base, hashlib.sha256(api_key.encode("utf-8")).hexdigest(), default_model, id(cache))
+    with _CLIENTS_LOCK:
+        client = _CLIENTS.get(key)
+        if client is None:
+            client = DeepSeekClient(api_base, api_key, default_model=default_model, cache=cache)
+            _CLIENTS[key] = client
+            while len(_CLIENTS) > MAX_CLIENTS:
+                _CLIENTS.popitem(last=False)
+        else:
+            _CLIENTS.move_to_end(key)
+        return client
@@ -0,0 +1,286 @@
+"""
+带速率限制的 LLM 请求调度器
+
+在线程池中并发执行请求，同时遵守每分钟请求数（RPM）与每分钟 token 数（TPM）上限；
+遇到 429/5xx 时按指数退避重试，并自适应地收缩并发与速率（AIMD），成功后逐步恢复。
+"""
+
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Deque, Iterable, Iterator, List, Optional, Sequence, Tuple, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+_WINDOW_SECONDS = 60.0
+
+# 当前线程中正在执行的请求是否命中了响应缓存（由客户端标记）
+_local = threading.local()
+
+
+def note_cache_hit() -> None:
+    """客户端命中响应缓存、没有发出网络请求时调用，调度器据此把占用的速率额度退回"""
+    _local.cache_hit = True
+
+
+def is_retryable(exc: Exception) -> bool:
+    """429、5xx、超时与连接错误可以重试，其余错误（如 400/401）直接失败"""
+    retryable = getattr(exc, "retryable", None)
+    if isinstance(retryable, bool):  # 由失败的 ChatResult 转成的异常已经判断过
+        return retryable
+    status = getattr(exc, "status_code", None)
+    if isinstance(status, int):
+        return status == 429 or status >= 500
+    name = type(exc).__name__
+    return name in ("APIConnectionError", "APITimeoutError", "TimeoutError", "ConnectionError")
+
+
+def retry_after(exc: Exception) -> Optional[float]:
+    """读取服务端给出的 Retry-After 秒数（若有）"""
+    hinted = getattr(exc, "retry_after", None)
+    if isinstance(hinted, (int, float)):
+        return float(hinted)
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimitedScheduler:
+    def __init__(
+        self,
+        max_concurrency: int = 4,
+        requests_per_minute: int = 0,
+        tokens_per_minute: int = 0,
+        max_retries: int = 4,
+        base_delay: float = 1.0,
+        max_delay: float = 30.0,
+    ) -> None:
+        """
+        Args:
+            max_concurrency: 同时在途的最大请求数
+            requests_per_minute: 每分钟请求上限，0 表示不限
+            tokens_per_minute: 每分钟 token 上限，0 表示不限
+            max_retries: 单个请求遇到可重试错误时的最大重试次数
+            base_delay: 指数退避的基础等待秒数
+            max_delay: 单次退避的最长等待秒数
+        """
+        self.max_concurrency = max(1, max_concurrency)
+        self.requests_per_minute = max(0, requests_per_minute)
+        self.tokens_per_minute = max(0, tokens_per_minute)
+        self.max_retries = max(0, max_retries)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self._cond = threading.Condition()
+        self._window: Deque[Tuple[float, int]] = deque()  # (发出时间, token 数)
+        self._window_tokens = 0
+        self._inflight = 0
+        self._scale = 1.0  # 自适应系数，限流时减半，成功时缓慢回升
+        self._cooldown_until = 0.0
+        self.stats = {"requests": 0, "retries": 0, "throttled": 0, "failures": 0, "cache_hits": 0}
+
+    # ------------------------------------------------------------------ 限流
+    def _effective_concurrency(self) -> int:
+        return max(1, int(self.max_concurrency * self._scale))
+
+    def _wait_time(self, tokens: int, now: float) -> float:
+        """返回还需等待的秒数，0 表示可以立即发出（调用方持有锁）"""
+        while self._window and now - self._window[0][0] >= _WINDOW_SECONDS:
+            _, old_tokens = self._window.popleft()
+            self._window_tokens -= old_tokens
+        if now < self._cooldown_until:
+            return self._cooldown_until - now
+        if self._inflight >= self._effective_concurrency():
+            return _WINDOW_SECONDS  # 由 release 唤醒
+        if self.requests_per_minute:
+            rpm = max(1, int(self.requests_per_minute * self._scale))
+            if len(self._window) >= rpm:
+                return self._window[-rpm][0] + _WINDOW_SECONDS - now
+        if self.tokens_per_minute and self._window:
+            # 单个请求本身超过 TPM 时，只要窗口清空即放行，避免永久阻塞
+            excess = self._window_tokens + tokens - self.tokens_per_minute
+            if excess > 0:
+                freed = 0
+                for ts, t in self._window:
+                    freed += t
+                    if freed >= excess:
+                        return ts + _WINDOW_SECONDS - now
+                return self._window[-1][0] + _WINDOW_SECONDS - now
+        return 0.0
+
+    def _acquire(self, tokens: int) -> Tuple[float, int]:
+        """占用一个并发名额并在速率窗口中记一笔，返回该记录"""
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                wait = self._wait_time(tokens, now)
+                if wait <= 0:
+                    entry = (now, tokens)
+                    self._window.append(entry)
+                    self._window_tokens += tokens
+                    self._inflight += 1
+                    self.stats["requests"] += 1
+                    return entry
+                self._cond.wait(timeout=min(wait, _WINDOW_SECONDS))
+
+    def _release(self, throttled: bool, delay: float = 0.0) -> None:
+        with self._cond:
+            self._inflight -= 1
+            if throttled:
+                self.stats["throttled"] += 1
+                self._scale = max(0.1, self._scale * 0.5)
+                self._cooldown_until = max(self._cooldown_until, time.monotonic() + delay)
+            else:
+                self._scale = min(1.0, self._scale + 0.05)
+            self._cond.notify_all()
+
+    def _refund(self, entry: Tuple[float, int]) -> None:
+        """命中缓存的请求：归还并发名额并撤销速率窗口中的记录，不影响自适应系数"""
+        with self._cond:
+            self._inflight -= 1
+            try:
+                self._window.remove(entry)
+                self._window_tokens -= entry[1]
+            except ValueError:
+                pass  # 已滑出窗口
+            self.stats["requests"] -= 1
+            self.stats["cache_hits"] += 1
+            self._cond.notify_all()
+
+    def _backoff(self, attempt: int, exc: Exception) -> float:
+        hinted = retry_after(exc)
+        if hinted is not None:
+            return min(self.max_delay, hinted)
+        delay = min(self.max_delay, self.base_delay * (2 ** attempt))
+        return delay * (0.5 + random.random() / 2)  # 抖动，避免同时重试
+
+    # ------------------------------------------------------------------ 执行
+    def call(self, fn: Callable[[], R], tokens: int = 0) -> R:
+        """
+        在限流约束下执行一次请求，可重试错误自动退避，最终失败时抛出最后一次异常
+
+        fn 内至多发出一次 LLM 请求；客户端命中缓存（note_cache_hit）时占用的额度随即退回，
+        重复运行时缓存命中不消耗 RPM/TPM，也不拖慢后续真实请求。
+        """
+        attempt = 0
+        while True:
+            entry = self._acquire(tokens)
+            _local.cache_hit = False
+            try:
+                result = fn()
+            except Exception as e:
+                retry = is_retryable(e) and attempt < self.max_retries
+                delay = self._backoff(attempt, e) if is_retryable(e) else 0.0
+                self._release(throttled=is_retryable(e), delay=delay)
+                if not retry:
+                    with self._cond:
+                        self.stats["failures"] += 1
+                    raise
+                with self._cond:
+                    self.stats["retries"] += 1
+                attempt += 1
+                continue
+            except BaseException:
+                # 取消等并非请求失败的中断：归还名额后原样抛出
+                self._release(throttled=False)
+                raise
+            if _local.cache_hit:
+                self._refund(entry)
+            else:
+                self._release(throttled=False)
+            return result
+
+    def try_job(self, fn: Callable[[T], R], job: T, tokens: int = 0,
+                default: Optional[R] = None) -> Tuple[bool, Optional[R]]:
+        """在限流约束下执行单个任务，返回 (是否成功, 结果)；最终失败时打印错误，结果为 default"""
+        try:
+            return True, self.call(lambda: fn(job), tokens=tokens)
+        except Exception as e:
+            print(f"[RateLimitedScheduler] 请求失败: {e}")
+            return False, default
+
+    def run_job(self, fn: Callable[[T], R], job: T, tokens: int = 0, default: Optional[R] = None) -> Optional[R]:
+        """在限流约束下执行单个任务，最终失败时打印错误并返回 default"""
+        return self.try_job(fn, job, tokens, default)[1]
+
+    def map(
+        self,
+        fn: Callable[[T], R],
+        jobs: Sequence[T],
+        cost: Optional[Callable[[T], int]] = None,
+        default: Optional[R] = None,
+        on_result: Optional[Callable[[int, Optional[R]], None]] = None,
+    ) -> List[Optional[R]]:
+        """
+        并发执行 fn(job)，结果顺序与 jobs 一致（与响应到达先后无关）
+
+        Args:
+            fn: 对单个任务发起请求，失败时应抛出异常
+            jobs: 任务列表
+            cost: 估算单个任务消耗的 token 数，用于 TPM 限制
+            default: 任务最终失败时填入的结果
+            on_result: 每个任务完成（含最终失败）时立即以 (下标, 结果) 回调，在工作线程中执行
+        """
+        jobs = list(jobs)
+
+        def run(indexed: Tuple[int, T]) -> Optional[R]:
+            i, job = indexed
+            result = self.run_job(fn, job, cost(job) if cost else 0, default)
+            if on_result is not None:
+                try:
+                    on_result(i, result)
+                except Exception as e:
+                    print(f"[RateLimitedScheduler] 结果回调失败: {e}")
+            return result
+
+        if self.max_concurrency <= 1 or len(jobs) <= 1:
+            return [run(indexed) for indexed in enumerate(jobs)]
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(jobs))) as pool:
+            return list(pool.map(run, enumerate(jobs)))
+
+    def imap(
+        self,
+        fn: Callable[[T], R],
+        jobs: Iterable[T],
+        cost: Optional[Callable[[T], int]] = None,
+        default: Optional[R] = None,
+        on_result: Optional[Callable[[int, Optional[R]], None]] = None,
+        max_pending: int = 0,
+    ) -> Iterator[Tuple[T, Optional[R]]]:
+        """
+        map 的流式版本：按需从 jobs 取任务，按 jobs 的顺序逐个产出 (job, 结果)
+
+        jobs 可以是上游阶段仍在产出的生成器。已提交而结果尚未被取走的任务最多 max_pending 个
+        （0 表示 2×max_concurrency），达到上限时先等最早的结果，不再从上游取任务（背压）。
+        何时取任务、何时等待只取决于数量，与响应到达先后无关。
+        """
+        limit = max_pending or 2 * self.max_concurrency
+        pending: Deque[Tuple[T, Future]] = deque()
+
+        def run(indexed: Tuple[int, T]) -> Optional[R]:
+            i, job = indexed
+            result = self.run_job(fn, job, cost(job) if cost else 0, default)
+            if on_result is not None:
+                try:
+                    on_result(i, result)
+                except Exception as e:
+                    print(f"[RateLimitedScheduler] 结果回调失败: {e}")
+            return result
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as pool:
+            for indexed in enumerate(jobs):
+                pending.append((indexed[1], pool.submit(run, indexed)))
+                if len(pending) >= limit:
+                    job, fut = pending.popleft()
+                    yield job, fut.result()
+            while pending:
+                job, fut = pending.popleft()
+                yield job, fut.result()
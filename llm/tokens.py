@@ -0,0 +1,41 @@
+import re
+from typing import Dict, List
+
+# DeepSeek 官方换算口径：1 个中文字符 ≈ 0.6 token，1 个英文字符 ≈ 0.3 token
+_CJK_PATTERN = re.compile(r"[\u3000-\u303f\u4e00-\u9fff\uff00-\uffef]")
+CJK_TOKENS_PER_CHAR = 0.6
+OTHER_TOKENS_PER_CHAR = 0.3
+# 每条消息的角色与分隔符开销
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def char_tokens(ch: str) -> float:
+    """单个字符的 token 估算值，与 estimate_tokens 口径一致"""
+    code = ord(ch)
+    if 0x4E00 <= code <= 0x9FFF or 0x3000 <= code <= 0x303F or 0xFF00 <= code <= 0xFFEF:
+        return CJK_TOKENS_PER_CHAR
+    return OTHER_TOKENS_PER_CHAR
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """截取不超过 max_tokens 的最长前缀"""
+    used = 0.0
+    for i, ch in enumerate(text):
+        used += char_tokens(ch)
+        if used > max_tokens:
+            return text[:i]
+    return text
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算文本的 token 数（无需加载分词器）"""
+    if not text:
+        return 0
+    cjk = len(_CJK_PATTERN.findall(text))
+    other = len(text) - cjk
+    return int(cjk * CJK_TOKENS_PER_CHAR + other * OTHER_TOKENS_PER_CHAR) + 1
+
+
+def estimate_messages_tokens(messages: List[Dict[str, str]]) -> int:
+    """估算一组 chat 消息的 prompt token 数"""
+    return sum(estimate_tokens(m.get("content") or "") + MESSAGE_OVERHEAD_TOKENS for m in messages)
@@ -1,3 +1,4 @@
+from bisect import bisect_right
 from typing import List, Optional, Literal, Dict, Any
 from pydantic import BaseModel, Field
 
@@ -7,6 +8,29 @@ class Document(BaseModel):
     path: str
     text: str
     pages: int = 0
+    page_offsets: List[int] = Field(default_factory=list)  # 每页在 text 中的起始偏移（升序）
+
+    def page_at(self, offset: int) -> Optional[int]:
+        """字符偏移所在页码（从 1 开始），二分查找 O(log pages)；无分页信息时返回 None"""
+        if not self.page_offsets:
+            return None
+        return max(1, bisect_right(self.page_offsets, offset))
+
+    def page_range(self, start: int, end: int) -> Optional[List[int]]:
+        """字符区间 [start, end) 覆盖的首末页码"""
+        first = self.page_at(start)
+        if first is None:
+            return None
+        return [first, self.page_at(max(start, end - 1))]
+
+
+class PageText(BaseModel):
+    """流式解析时逐页产出的文本记录；docx/txt 没有分页，整篇作为第 1 页"""
+    docName: str
+    path: str
+    page: int  # 从 1 开始
+    text: str
+    totalPages: int = 0
 
 
 ItemType = Literal["Statute", "JudicialInterpretation", "Case", "KeywordHit", "RawText"]
@@ -25,6 +49,7 @@ class ExtractedItem(BaseModel):
     holding: Optional[str] = None
     reasoning: Optional[str] = None
     text: Optional[str] = None
+    evidence: Optional[str] = None  # 原文摘录
     pageRange: Optional[List[int]] = None
     charSpan: Optional[List[int]] = None
     keywordsHit: Optional[List[str]] = None
@@ -41,6 +66,21 @@ class ExtractResult(BaseModel):
     items: List[ExtractedItem]
 
 
+class ChatResult(BaseModel):
+    """单次 LLM 请求的结果；失败时 ok=False 并带上错误信息，而不是返回空字符串"""
+    content: str = ""
+    ok: bool = True
+    error: Optional[str] = None
+    status_code: Optional[int] = None
+    retryable: bool = False  # 429/5xx/超时/连接错误
+    retry_after: Optional[float] = None  # 服务端给出的 Retry-After 秒数
+    model: str = ""
+    latency_ms: float = 0.0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached: bool = False  # 命中本地响应缓存，未发出网络请求
+
+
 class Card(BaseModel):
     type: Literal["basic", "cloze"] = "basic"
     Question: str
@@ -68,12 +108,22 @@ class PipelineInput(BaseModel):
     dedup_threshold: float
     min_quality: float
     max_cards_per_item: int
+    max_concurrency: int = 4  # 同时在途的最大 LLM 请求数
+    requests_per_minute: int = 0  # 0 表示不限
+    tokens_per_minute: int = 0  # 0 表示不限
+    use_llm_cache: bool = True  # 相同请求直接复用本地缓存的响应
+    chunk_tokens: int = 0  # 抽取分块的 token 预算，0 表示按模型取默认值
+    card_batch_size: int = 8  # 每次制卡请求打包的知识点数，1 表示逐条请求
+    retrieval_recall: float = 0.1  # 关键词检索预筛的召回比例，1 表示全文发送给模型
+    parse_statutes: bool = True  # 结构规整的法条文档在本地按条切分，不调用模型
+    trace: bool = False  # 把本次运行的耗时、调用与计数逐条写入 JSONL 追踪文件
 
 class PipelineOutput(BaseModel):
     documents: List[Document]
     extracted_items: List[ExtractedItem]
     cards: List[Card]
     errors : List[str]
+    metrics: Dict[str, Any] = Field(default_factory=dict)  # 各阶段耗时、LLM 调用用量与费用、解析失败与重试等（见 pipeline/utils/metrics.py）
 
 
 class PipelineConfig(BaseModel):
@@ -84,3 +134,18 @@ class PipelineConfig(BaseModel):
     dedup_threshold: float = 0.88
     min_quality: float = 0.65
     max_cards_per_item: int = 3
+    max_concurrency: int = 4  # 同时在途的最大 LLM 请求数，1 表示串行
+    requests_per_minute: int = 0  # 制卡请求的每分钟请求上限，0 表示不限
+    tokens_per_minute: int = 0  # 制卡请求的每分钟 token 上限，0 表示不限
+    use_llm_cache: bool = True  # 是否启用 LLM 响应磁盘缓存
+    chunk_tokens: int = 0  # 抽取分块的 token 预算，0 表示按模型取默认值（见 pipeline/utils/chunking.py）
+    card_batch_size: int = 8  # 每次制卡请求打包的知识点数，1 表示逐条请求
+    retrieval_recall: float = 0.1  # 检索预筛按 BM25 在每篇文档内额外保留的段落比例，1 表示不预筛（见 pipeline/utils/retrieval.py）
+    parse_statutes: bool = True  # 法条文档按 第X章/第X条 结构在本地切分（见 pipeline/nodes/statute.py）
+    card_batch_tokens: int = 12000  # 单次批量制卡请求的估算 token 上限（输入 + 预留输出）
+    ingest_workers: int = 4  # 文档解析进程池大小，1 表示在当前进程内解析
+    use_doc_store: bool = True  # 按文件内容哈希复用已解析的文本
+    doc_store_path: str = "data/cache/documents.sqlite3"
+    llm_cache_path: str = "data/cache/llm_responses.sqlite3"
+    trace: bool = False  # 是否写 JSONL 追踪文件
+    trace_dir: str = "data/traces"  # 追踪文件目录，文件名为 run ID
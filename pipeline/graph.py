@@ -1,77 +1,521 @@
-from models.schemas import PipelineConfig, PipelineOutput, PipelineInput
-from llm.client import DeepSeekClient
-from pipeline.nodes.ingest import load_files
-from pipeline.nodes.extract import extract_from_documents
-from pipeline.nodes.generate_cards import generate_cards
-from pipeline.nodes.quality import quality_gate, deduplicate_cards
+import functools
+import os
+import sqlite3
+import threading
+import uuid
+from collections import deque
+from concurrent.futures import Future
+from contextlib import nullcontext
+from typing import (Any, Callable, Deque, Dict, Generic, Iterable, Iterator, List, Optional, Sequence, Set, Tuple,
+                    Type, TypeVar)
+
+from pydantic import BaseModel
+
+from models.schemas import PipelineConfig, PipelineOutput, PipelineInput, Document, ExtractedItem, Card
+from llm.client import get_client
+from llm.scheduler import RateLimitedScheduler
+from llm.cache import get_response_cache
+from pipeline.nodes.ingest import PARSER_VERSION, SUPPORTED_EXTS, build_document, page_count, page_ranges, parse_pages
+from pipeline.nodes.extract import iter_extracted_items
+from pipeline.nodes.generate_cards import iter_cards
+from pipeline.nodes.quality import CardFilter
 from pipeline.nodes.items_from_text import chunk_documents_to_items
+from pipeline.utils.stage_cache import StageCache, stage_key, file_fingerprint
+from pipeline.utils.doc_store import get_document_store
+from pipeline.utils.events import Emit, ProgressCounter, make_emitter
+from pipeline.utils.metrics import MetricsRecorder
+
+from langgraph.config import get_config, get_stream_writer
+from langgraph.func import entrypoint, task
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from langgraph.checkpoint.sqlite import SqliteSaver
+
+M = TypeVar("M", bound=BaseModel)
+T = TypeVar("T")
+R = TypeVar("R")
+
+# 进程内的阶段缓存：Streamlit 每次点击“运行”都在同一进程内，调整后处理参数时上游阶段直接复用
+STAGE_CACHE = StageCache()
+
+# 持久化检查点：每个文档解析、每次 LLM 请求完成后结果即写入 SQLite，
+# 进程崩溃或页面重跑打断运行后，以同一 run ID 续跑时已完成的部分直接复用，不再重复请求
+CHECKPOINT_PATH = os.path.join("data", "cache", "checkpoints.sqlite3")
+# 只保留最近的若干次运行，更早的检查点在新建运行时清理
+KEEP_RUNS = 20
+
+
+class _LazySqliteSaver(SqliteSaver):
+    """第一次读写检查点时才创建目录与数据库文件，导入本模块（如只用到 cancel_run）不会在当前目录下建文件"""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._conn_lock = threading.Lock()
+        # 入口的输入与输出是 pydantic 模型，显式允许反序列化；各 task 的结果都是普通 dict/list
+        serde = JsonPlusSerializer(allowed_msgpack_modules=[("models.schemas", "PipelineInput"),
+                                                            ("models.schemas", "PipelineOutput")])
+        super().__init__(None, serde=serde)  # type: ignore[arg-type]
+
+    @property  # type: ignore[override]
+    def conn(self) -> sqlite3.Connection:
+        with self._conn_lock:
+            if self._conn is None:
+                if os.path.dirname(self.path):
+                    os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                self._conn = sqlite3.connect(self.path, check_same_thread=False)
+                self._conn.execute("PRAGMA journal_mode=WAL")
+            return self._conn
+
+    @conn.setter
+    def conn(self, value: Optional[sqlite3.Connection]) -> None:
+        self._conn = value
+
+
+CHECKPOINTER = _LazySqliteSaver(CHECKPOINT_PATH)
+
+# run ID -> API Key，只保存在进程内存中，不写入检查点；运行开始时即取出删除，续跑时由 new_run_config 重新传入
+_RUN_API_KEYS: Dict[str, str] = {}
+# run ID -> 外部传入的共享调度器（同样只在进程内存中，用法同上）
+_RUN_SCHEDULERS: Dict[str, RateLimitedScheduler] = {}
+# 被请求取消的 run ID
+_CANCELLED_RUNS: Set[str] = set()
+
+
+class RunCancelled(BaseException):
+    """
+    运行被取消
+
+    与 asyncio.CancelledError 一样继承 BaseException：各阶段的 except Exception 不会把它当作普通错误吞掉，
+    运行在下一个 task 开始前停止，已完成的部分保留在检查点中，之后可以续跑。
+    """
+
+
+def cancel_run(run_id: str) -> None:
+    """请求取消运行：正在进行的请求照常完成，尚未开始的 task 不再执行"""
+    _CANCELLED_RUNS.add(run_id)
+
+
+def release_run(run_id: str) -> None:
+    """丢弃运行留在进程内存中的密钥、共享调度器与取消标记；在运行结束后调用，排队时被取消、run_pipeline 没有执行的运行也能清理"""
+    _RUN_API_KEYS.pop(run_id, None)
+    _RUN_SCHEDULERS.pop(run_id, None)
+    _CANCELLED_RUNS.discard(run_id)
+
+
+def _check_cancelled() -> None:
+    """在 task 内调用"""
+    run_id = get_config()["configurable"]["thread_id"]
+    if run_id in _CANCELLED_RUNS:
+        raise RunCancelled(run_id)
+
+
+def new_run_config(api_key: str = "", max_concurrency: int = 4, run_id: Optional[str] = None,
+                   metadata: Optional[Dict[str, str]] = None,
+                   scheduler: Optional[RateLimitedScheduler] = None) -> Dict[str, Any]:
+    """
+    运行配置：run_id 为空时生成新的唯一 ID；传入已有 run_id 并以 None 为输入调用即续跑
+
+    api_key 优先于输入中的 api_key，输入可以留空以免密钥随输入写进检查点；
+    max_concurrency 决定并行执行的 task 数；metadata（字符串值）记录在检查点里，用于辨认未完成的运行；
+    scheduler 供多个并行运行共用，使并发与 RPM/TPM 上限对它们整体生效（此时忽略输入中的限流参数）。
+    """
+    run_id = run_id or uuid.uuid4().hex
+    _CANCELLED_RUNS.discard(run_id)
+    if api_key:
+        _RUN_API_KEYS[run_id] = api_key
+    if scheduler is not None:
+        _RUN_SCHEDULERS[run_id] = scheduler
+    return {
+        "configurable": {"thread_id": run_id},
+        # 入口函数本身等也占用执行槽位，不留余量时上限 ≤2 会使 task 等不到线程而卡死
+        "max_concurrency": max(1, max_concurrency) + 2,
+        "metadata": metadata or {},
+    }
+
+
+def _recent_run_ids() -> List[str]:
+    """按最近一次检查点时间倒序的全部 run ID（检查点 ID 按时间递增）"""
+    with CHECKPOINTER.lock:
+        # 表在第一次写检查点时才创建，全新的数据库上直接查询会报错
+        CHECKPOINTER.setup()
+        rows = CHECKPOINTER.conn.execute(
+            "SELECT thread_id FROM checkpoints WHERE checkpoint_ns = '' GROUP BY thread_id ORDER BY MAX(checkpoint_id) DESC"
+        ).fetchall()
+    return [r[0] for r in rows]
+
+
+def list_unfinished_runs(limit: int = 5) -> List[Dict[str, Any]]:
+    """最近的未完成运行：[{"run_id", "updated_at", "metadata"}]"""
+    out: List[Dict[str, Any]] = []
+    for run_id in _recent_run_ids()[:KEEP_RUNS]:
+        state = run_pipeline.get_state({"configurable": {"thread_id": run_id}})
+        if state.next:
+            out.append({"run_id": run_id, "updated_at": state.created_at, "metadata": dict(state.metadata or {})})
+            if len(out) >= limit:
+                break
+    return out
+
+
+def prune_runs(keep: int = KEEP_RUNS) -> int:
+    """删除最近 keep 次之外的运行的检查点，返回删除的运行数"""
+    stale = _recent_run_ids()[keep:]
+    for run_id in stale:
+        CHECKPOINTER.delete_thread(run_id)
+    return len(stale)
+
+
+@task
+def stage_lookup(stage: str, key: str) -> Optional[List[Dict[str, Any]]]:
+    """
+    查询阶段缓存
+
+    作为 task 执行，查询结果会写入检查点：续跑时重放同样的命中/未命中，
+    保证各 task 的调用顺序与中断前一致（task 按调用顺序而不是参数匹配检查点中的结果）。
+    """
+    return STAGE_CACHE.get(stage, key)
+
+
+@task
+def plan_document(path: str, store_path: Optional[str]) -> Dict[str, Any]:
+    """
+    解析过的文件按内容哈希直接取回 {"document": ...}；
+    否则返回 {"pages": 页数, "digest": 内容哈希}，由 ingest_pages 分段解析后按 digest 写回存储
+    """
+    _check_cancelled()
+    digest = file_fingerprint(path) if store_path else None
+    if digest is not None:
+        hit = get_document_store(store_path).get(digest, PARSER_VERSION)
+        if hit is not None:
+            text, offsets, pages = hit
+            doc = Document(name=os.path.basename(path), path=path, text=text, pages=pages, page_offsets=offsets)
+            return {"document": doc.model_dump()}
+    return {"pages": page_count(path), "digest": digest}
+
+
+@task
+def ingest_pages(path: str, start: int, end: int, max_workers: int) -> List[str]:
+    """解析一个页段（在共享进程池中执行），返回各页文本"""
+    _check_cancelled()
+    return parse_pages(path, start, end, max_workers)
+
+
+@task
+def llm_request(fn: Callable[[], Any]) -> Any:
+    """一次（含限流与重试的）LLM 请求，返回值须可 JSON 序列化"""
+    return fn()
+
+
+def _notify(fut: Future, i: int, on_result: Optional[Callable[[int, Any], None]]) -> None:
+    """task 完成时以 (下标, 结果) 回调（续跑时复用的结果立即回调）"""
+    if on_result is not None:
+        fut.add_done_callback(lambda f: on_result(i, f.result()) if f.exception() is None else None)
+
 
-from langgraph.func import entrypoint
-from langgraph.checkpoint.memory import InMemorySaver
+def _gather(futures: Sequence[Future], on_result: Optional[Callable[[int, Any], None]] = None) -> List[Any]:
+    """按提交顺序取回 task 结果；on_result 在每个 task 完成时回调"""
+    for i, fut in enumerate(futures):
+        _notify(fut, i, on_result)
+    return [fut.result() for fut in futures]
 
-@entrypoint(checkpointer = InMemorySaver()) #内存检查点，短期
+
+class CheckpointedScheduler:
+    """
+    与 RateLimitedScheduler.map 接口相同，但每个请求作为一个 LangGraph task 执行，
+    仍由内部调度器负责限流与重试；完成的请求写入检查点，续跑时不再重复请求
+
+    failed 统计经由它取回的结果中最终失败、以 default 代替的任务数（续跑时从检查点重放的同样计入），
+    每个阶段各用一个实例，据此判断该阶段的输出是否完整、能否写入阶段缓存。
+    """
+
+    def __init__(self, inner: RateLimitedScheduler) -> None:
+        self.inner = inner
+        self.max_concurrency = inner.max_concurrency
+        self.failed = 0
+
+    def _submit(self, fn: Callable[[T], R], job: T, cost: Optional[Callable[[T], int]],
+                default: Optional[R]) -> Future:
+        """须在入口函数的线程中调用：task 按调用顺序匹配检查点"""
+        run_id = get_config()["configurable"]["thread_id"]
+
+        def _fn(job: T) -> R:
+            # 在拿到并发名额、即将发出请求时检查取消，排队中的请求不会再发出
+            if run_id in _CANCELLED_RUNS:
+                raise RunCancelled(run_id)
+            return fn(job)
+
+        return llm_request(functools.partial(self.inner.try_job, _fn, job, cost(job) if cost else 0, default))
+
+    def _unwrap(self, outcome: Sequence[Any]) -> Any:
+        """task 结果为 (是否成功, 结果)，取出结果并累计失败数"""
+        ok, result = outcome
+        if not ok:
+            self.failed += 1
+        return result
+
+    def map(self, fn: Callable[[T], R], jobs: Sequence[T], cost: Optional[Callable[[T], int]] = None,
+            default: Optional[R] = None, on_result: Optional[Callable[[int, Optional[R]], None]] = None
+            ) -> List[Optional[R]]:
+        outcomes = _gather([self._submit(fn, job, cost, default) for job in jobs],
+                           (lambda i, outcome: on_result(i, outcome[1])) if on_result is not None else None)
+        return [self._unwrap(outcome) for outcome in outcomes]
+
+    def imap(self, fn: Callable[[T], R], jobs: Iterable[T], cost: Optional[Callable[[T], int]] = None,
+             default: Optional[R] = None, on_result: Optional[Callable[[int, Optional[R]], None]] = None,
+             max_pending: int = 0) -> Iterator[Tuple[T, Optional[R]]]:
+        """
+        与 RateLimitedScheduler.imap 相同
+
+        何时提交下一个 task 只取决于已取走的结果（续跑时从检查点原样重放）与在途数量，
+        与响应到达先后无关，因此多个阶段交错提交时各 task 的调用顺序在续跑时依然不变。
+        """
+        limit = max_pending or 2 * self.max_concurrency
+        pending: Deque[Tuple[T, Future]] = deque()
+        notify = (lambda i, outcome: on_result(i, outcome[1])) if on_result is not None else None
+        for i, job in enumerate(jobs):
+            fut = self._submit(fn, job, cost, default)
+            _notify(fut, i, notify)
+            pending.append((job, fut))
+            if len(pending) >= limit:
+                job, fut = pending.popleft()
+                yield job, self._unwrap(fut.result())
+        while pending:
+            job, fut = pending.popleft()
+            yield job, self._unwrap(fut.result())
+
+
+def _iter_documents(file_paths: List[str], config: PipelineConfig, emit: Optional[Emit]) -> Iterator[Document]:
+    """
+    所有文件的页段依次作为 task 提交到同一个有界进程池（见 ingest.get_parse_pool），解析进程总数不超过
+    ingest_workers，在途页段不超过其两倍；按文件顺序产出文档，一篇文档的最后一个页段解析完即产出，
+    抽取阶段不必等其余文件。页段 task 都在本线程按固定顺序提交，续跑时与中断前一致
+    """
+    workers = max(1, config.ingest_workers)
+    store_path = config.doc_store_path if config.use_doc_store else None
+    paths = [p for p in file_paths if os.path.splitext(p)[1].lower() in SUPPORTED_EXTS]
+    progress = ProgressCounter(emit, "documents", len(paths))
+    plans = [plan_document(p, store_path) for p in paths]
+
+    def _ranges() -> Iterator[Tuple[str, int, int]]:
+        for p, plan in zip(paths, plans):
+            try:
+                info = plan.result()
+            except Exception:
+                return  # 出错的文件轮到它时在下面抛出，已排在前面的文件照常产出
+            if "pages" in info:
+                for start, end in page_ranges(p, info["pages"]):
+                    yield p, start, end
+
+    ranges = _ranges()
+    pending: Deque[Future] = deque()
+
+    def _next_range() -> List[str]:
+        while len(pending) < 2 * workers:
+            nxt = next(ranges, None)
+            if nxt is None:
+                break
+            pending.append(ingest_pages(*nxt, workers))
+        return pending.popleft().result()
+
+    for p, plan in zip(paths, plans):
+        info = plan.result()
+        if "document" in info:
+            doc = Document(**info["document"])
+        else:
+            page_texts: List[str] = []
+            for _ in page_ranges(p, info["pages"]):
+                page_texts.extend(_next_range())
+            doc = build_document(p, page_texts, info["pages"])
+            if info["digest"] is not None:
+                get_document_store(store_path).put(info["digest"], PARSER_VERSION, doc.text, doc.page_offsets,
+                                                   doc.pages)
+        progress.step()
+        if emit is not None:
+            emit({"type": "document", "name": doc.name, "pages": doc.pages, "chars": len(doc.text)})
+        yield doc
+
+
+def _memoized_stream(stage: str, key: str, model_cls: Type[M], produce: Callable[[], Iterable[M]],
+                     emit: Optional[Emit] = None, metrics: Optional[MetricsRecorder] = None,
+                     complete: Optional[Callable[[], bool]] = None) -> Iterator[M]:
+    """
+    按阶段输入的哈希复用上一次的输出，否则逐条产出 produce() 的结果，下游阶段不必等本阶段全部完成
+
+    全部产出后写入阶段缓存；complete 返回 False（有请求最终失败、上游阶段中途出错或输入不完整）时不缓存。
+    计时从第一次取值到最后一条产出为止，与上下游阶段重叠。produce 抛出的异常原样向上传递。
+    """
+    with metrics.span(stage) if metrics is not None else nullcontext({}) as span:
+        cached = stage_lookup(stage, key).result()
+        if cached is not None:
+            result = [model_cls(**d) for d in cached]
+            span.update(count=len(result), cached=True)
+            if emit is not None:
+                emit({"type": "stage", "stage": stage, "status": "done", "count": len(result), "cached": True})
+            yield from result
+            return
+        if emit is not None:
+            emit({"type": "stage", "stage": stage, "status": "start"})
+        result = []
+        for r in produce():
+            result.append(r)
+            yield r
+        span.update(count=len(result), cached=False)
+        if emit is not None:
+            emit({"type": "stage", "stage": stage, "status": "done", "count": len(result), "cached": False})
+        if complete is None or complete():
+            STAGE_CACHE.put(stage, key, [r.model_dump() for r in result])
+
+
+class _Upstream(Generic[M]):
+    """
+    包装上游阶段的流：边产出边收集；出错时记录错误并提前结束，
+    下游照常处理已产出的部分，但据 failed 不缓存自己的结果
+    """
+
+    def __init__(self, stream: Iterable[M], errors: List[str], label: str) -> None:
+        self.items: List[M] = []
+        self.failed = False
+        self._errors = errors
+        self._label = label
+        self._it = self._run(stream)
+
+    def _run(self, stream: Iterable[M]) -> Iterator[M]:
+        try:
+            for item in stream:
+                self.items.append(item)
+                yield item
+        except Exception as e:
+            self.failed = True
+            self._errors.append(f"{self._label}: {e}")
+
+    def __iter__(self) -> Iterator[M]:
+        return self._it
+
+    def drain(self) -> List[M]:
+        """下游没有读完时（如制卡命中缓存）把剩余部分跑完，返回全部条目"""
+        for _ in self._it:
+            pass
+        return self.items
+
+
+@entrypoint(checkpointer=CHECKPOINTER)
 def run_pipeline(input: PipelineInput) -> PipelineOutput:
+    """
+    完整管线：解析 → 抽取 → 制卡 → 质量过滤与去重
+
+    以 new_run_config() 生成的配置运行；中断后用同一配置、以 None 为输入再次调用即从断点续跑。
+    """
+    run_id = get_config()["configurable"]["thread_id"]
+    # 密钥与共享调度器只在本次调用中用到，取出后即从进程级字典中删除
+    run_api_key = _RUN_API_KEYS.pop(run_id, None)
+    shared_scheduler = _RUN_SCHEDULERS.pop(run_id, None)
     errors = []
     try:
         config = PipelineConfig(
             api_base=input.api_base,
-            api_key=input.api_key,
+            api_key=run_api_key or input.api_key,
             extract_model=input.extract_model,
             card_model=input.card_model,
             dedup_threshold=input.dedup_threshold,
             min_quality=input.min_quality,
             max_cards_per_item=input.max_cards_per_item,
+            max_concurrency=input.max_concurrency,
+            requests_per_minute=input.requests_per_minute,
+            tokens_per_minute=input.tokens_per_minute,
+            use_llm_cache=input.use_llm_cache,
+            chunk_tokens=input.chunk_tokens,
+            card_batch_size=input.card_batch_size,
+            retrieval_recall=input.retrieval_recall,
+            parse_statutes=input.parse_statutes,
+            trace=input.trace,
         )
     except Exception as e:
         errors.append(f"配置错误: {e}")
         return {"documents": [], "extracted_items": [], "cards": [], "errors": errors}
 
+    # 抽取与制卡请求共用一个调度器：并发上限 + RPM/TPM 限制 + 429/5xx 自适应退避；
+    # 每个请求作为一个 task 执行，结果写入检查点。两个阶段各包一层，分别统计最终失败的请求
+    scheduler = shared_scheduler or RateLimitedScheduler(
+        max_concurrency=config.max_concurrency,
+        requests_per_minute=config.requests_per_minute,
+        tokens_per_minute=config.tokens_per_minute,
+    )
+    extract_scheduler = CheckpointedScheduler(scheduler)
+    card_scheduler = CheckpointedScheduler(scheduler)
+    # 相同的 (model, messages, temperature, max_tokens) 直接命中磁盘缓存，不再请求网络
+    cache = get_response_cache(config.llm_cache_path) if config.use_llm_cache else None
+    # 以 stream(stream_mode="custom") 运行时，各阶段的进度与中间结果逐条推送给界面；invoke 时为空操作
+    emit = make_emitter(get_stream_writer())
+    # 各阶段耗时、每次 LLM 调用的耗时与用量、解析失败等，汇总进 output.metrics；开启 trace 时同时写 JSONL
+    metrics = MetricsRecorder(os.path.join(config.trace_dir, f"{run_id}.jsonl") if config.trace else None, run_id)
+
+    # 各阶段的缓存键只包含影响该阶段输出的输入，下游键串联上游键
     try:
-        documents = load_files(input.file_paths)
+        doc_key = stage_key("documents", [(p, file_fingerprint(p)) for p in input.file_paths])
     except Exception as e:
         errors.append(f"读取文件失败: {e}")
-        return {"documents": [], "extracted_items": [], "cards": [], "errors": errors}
+        return {"documents": [], "extracted_items": [], "cards": [], "errors": errors, "metrics": metrics.close()}
+    # 文档逐篇流入抽取阶段；解析出错时已产出的文档照常处理，但下游阶段不写缓存
+    documents = _Upstream(_memoized_stream("documents", doc_key, Document,
+                                           lambda: _iter_documents(input.file_paths, config, emit), emit, metrics),
+                          errors, "读取文件失败")
+
+    def _client(model: str) -> Any:
+        return get_client(api_base=config.api_base, api_key=config.api_key, default_model=model,
+                          cache=cache).with_metrics(metrics)
 
-    # 关键词为空时，直接以文本分块为条目
+    # 各阶段以流的方式串联：知识点一抽出即进入制卡批次，卡片一生成即做质量过滤与去重，
+    # 端到端耗时接近最慢的阶段而不是各阶段之和。阶段之间在途的请求数有上限（背压），
+    # 且所有 task 都在本线程按结果顺序提交，续跑时调用顺序与中断前一致
     if not input.keywords:
-        try:
-            extracted_items = chunk_documents_to_items(documents)
-        except Exception as e:
-            errors.append(f"文本分块失败: {e}")
-            extracted_items = []
-        # 制卡
-        try:
-            client = DeepSeekClient(api_base=config.api_base, api_key=config.api_key, default_model=config.card_model)
-            cards = generate_cards(extracted_items, client=client, model=config.card_model, max_cards_per_item=config.max_cards_per_item)
-        except Exception as e:
-            errors.append(f"制卡阶段失败: {e}")
-            cards = []
+        # 关键词为空时，直接以文本分块为条目
+        items_key = stage_key("chunks", doc_key)
+        items = _Upstream(_memoized_stream("items", items_key, ExtractedItem,
+                                           lambda: chunk_documents_to_items(documents), emit, metrics,
+                                           complete=lambda: not documents.failed),
+                          errors, "文本分块失败")
     else:
-        # 正常抽取 → 制卡（使用优化后的功能）
-        try:
-            client = DeepSeekClient(api_base=config.api_base, api_key=config.api_key, default_model=config.extract_model)
-            extracted_items = extract_from_documents(documents, input.keywords, client, model=config.extract_model)
-        except Exception as e:
-            errors.append(f"抽取阶段失败: {e}")
-            extracted_items = []
-        try:
-            # 使用增强的卡片生成功能（支持LLM智慧归纳）
-            cards = generate_cards(extracted_items, client=client, model=config.card_model, max_cards_per_item=config.max_cards_per_item)
-        except Exception as e:
-            errors.append(f"制卡阶段失败: {e}")
-            cards = []
+        items_key = stage_key("items", doc_key, config.api_base, config.extract_model, input.keywords,
+                              config.chunk_tokens, config.retrieval_recall, config.parse_statutes)
+        items = _Upstream(_memoized_stream("items", items_key, ExtractedItem, lambda: iter_extracted_items(
+            documents, input.keywords, _client(config.extract_model), model=config.extract_model,
+            scheduler=extract_scheduler, chunk_tokens=config.chunk_tokens, retrieval_recall=config.retrieval_recall,
+            emit=emit, parse_statutes=config.parse_statutes), emit, metrics,
+            complete=lambda: not documents.failed and extract_scheduler.failed == 0), errors, "抽取阶段失败")
 
+    def items_complete() -> bool:
+        # 卡片的缓存键由条目的键推导，条目不完整时卡片同样不能缓存
+        return not documents.failed and not items.failed and extract_scheduler.failed == 0
+
+    cards_key = stage_key("cards", items_key, config.api_base, config.card_model, config.max_cards_per_item,
+                          config.card_batch_size, config.card_batch_tokens)
+    card_filter = CardFilter(config.min_quality, config.dedup_threshold)
+    cards = []
     try:
-        cards = quality_gate(cards, config.min_quality)
-        cards = deduplicate_cards(cards, config.dedup_threshold)
+        for card in _memoized_stream("cards", cards_key, Card, lambda: iter_cards(
+                items, client=_client(config.card_model), model=config.card_model,
+                max_cards_per_item=config.max_cards_per_item, scheduler=card_scheduler,
+                batch_size=config.card_batch_size, batch_tokens=config.card_batch_tokens, emit=emit), emit, metrics,
+                complete=lambda: items_complete() and card_scheduler.failed == 0):
+            if card_filter.accept(card):
+                cards.append(card)
     except Exception as e:
-        errors.append(f"质量过滤/去重失败: {e}")
-
+        errors.append(f"制卡阶段失败: {e}")
+    extracted_items = items.drain()
+    # 条目命中缓存时文档流可能没有被读取，这里补齐
+    all_documents = documents.drain()
+    metrics.record_span("quality", card_filter.ms["quality"], before=card_filter.counts["cards"],
+                        count=card_filter.counts["passed_quality"])
+    metrics.record_span("dedup", card_filter.ms["dedup"], before=card_filter.counts["passed_quality"],
+                        count=card_filter.counts["kept"])
 
-    output = PipelineOutput(documents=[d.model_dump() for d in documents],
+    metrics.set("scheduler", dict(scheduler.stats))
+    # 本次运行中重试后仍失败、结果缺失的请求数（调度器可能被多个运行共用，其 failures 是合计）
+    metrics.set("failed_requests", extract_scheduler.failed + card_scheduler.failed)
+    output = PipelineOutput(documents=[d.model_dump() for d in all_documents],
                             extracted_items=[i.model_dump() for i in extracted_items],
                             cards=[c.model_dump() for c in cards],
-                            errors=errors)
+                            errors=errors,
+                            metrics=metrics.close())
     
     # 为了支持检查点，返回一个可json序列化的对象
     return output
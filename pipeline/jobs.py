@@ -0,0 +1,265 @@
+"""
+后台任务队列
+
+把 run_pipeline 作为后台任务执行：submit 立即返回任务 ID（即 run ID），工作线程池按提交顺序运行，
+状态、进度快照与结果写入本地 SQLite。Streamlit 会话只轮询任务并展示进度，页面重跑、刷新或关闭都不会打断运行；
+多个会话各自排队，每个任务有独立的 run ID。进程退出时仍在排队或运行的任务，下次启动时标记为 interrupted，
+凭 API Key 即可从检查点续跑（API Key 只在进程内存中，不写入任务记录）。
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from models.schemas import PipelineInput, PipelineOutput
+from pipeline.graph import RunCancelled, cancel_run, new_run_config, prune_runs, release_run, run_pipeline
+
+DEFAULT_JOBS_PATH = os.path.join("data", "cache", "jobs.sqlite3")
+# 同时运行的任务数；每个任务内部另有自己的 LLM 并发上限
+JOB_WORKERS = 2
+# 只保留最近的若干个任务记录
+KEEP_JOBS = 50
+# 进度快照中保留的最近卡片数（实时预览用），以及两次写入进度的最小间隔（秒）
+PREVIEW_CARDS = 50
+PROGRESS_INTERVAL = 0.5
+
+# queued → running → done / failed / cancelled；进程退出时未结束的任务为 interrupted
+ACTIVE_STATUSES = ("queued", "running")
+RESUMABLE_STATUSES = ("interrupted", "cancelled", "failed")
+
+
+def new_progress() -> Dict[str, Any]:
+    return {"stages": {}, "cached": {}, "counts": {"document": 0, "item": 0, "card": 0}, "cards": []}
+
+
+def fold_event(progress: Dict[str, Any], event: Dict[str, Any]) -> None:
+    """把一条流式事件（见 pipeline/utils/events.py）合并进进度快照"""
+    kind = event.get("type")
+    if kind == "progress":
+        stage = progress["stages"].setdefault(event["stage"], {"started": time.time()})
+        stage["done"], stage["total"] = event["done"], event["total"]
+    elif kind == "stage" and event.get("status") == "done" and event.get("cached"):
+        progress["cached"][event["stage"]] = event.get("count", 0)
+    elif kind in progress["counts"]:
+        progress["counts"][kind] += 1
+        if kind == "card":
+            progress["cards"] = (progress["cards"] + [event["card"]])[-PREVIEW_CARDS:]
+
+
+class JobStore:
+    def __init__(self, path: str = DEFAULT_JOBS_PATH) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY,"
+            " status TEXT NOT NULL,"
+            " input TEXT,"
+            " metadata TEXT NOT NULL,"
+            " progress TEXT NOT NULL,"
+            " output TEXT,"
+            " error TEXT,"
+            " created_at REAL NOT NULL,"
+            " started_at REAL,"
+            " finished_at REAL)"
+        )
+        self._conn.commit()
+
+    def create(self, job_id: str, pipeline_input: Optional[PipelineInput], metadata: Dict[str, str]) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO jobs (id, status, input, metadata, progress, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, "queued", pipeline_input.model_dump_json() if pipeline_input else None,
+                 json.dumps(metadata, ensure_ascii=False), json.dumps(new_progress()), time.time()),
+            )
+            self._conn.commit()
+
+    def update(self, job_id: str, **fields: Any) -> None:
+        """更新任务的若干列；progress 传 dict，output 传 PipelineOutput"""
+        if "progress" in fields:
+            fields["progress"] = json.dumps(fields["progress"], ensure_ascii=False)
+        if "output" in fields and fields["output"] is not None:
+            fields["output"] = fields["output"].model_dump_json()
+        columns = ", ".join(f"{k} = ?" for k in fields)
+        with self._lock:
+            self._conn.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+            self._conn.commit()
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """任务记录（不含输出）：id、status、metadata、progress、error 与各时间戳"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, status, metadata, progress, error, created_at, started_at, finished_at,"
+                " output IS NOT NULL FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return self._row(row) if row else None
+
+    def list(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """最近提交的任务，新的在前"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, status, metadata, progress, error, created_at, started_at, finished_at,"
+                " output IS NOT NULL FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [self._row(r) for r in rows]
+
+    @staticmethod
+    def _row(row: tuple) -> Dict[str, Any]:
+        job_id, status, metadata, progress, error, created_at, started_at, finished_at, has_output = row
+        return {"id": job_id, "status": status, "metadata": json.loads(metadata), "progress": json.loads(progress),
+                "error": error, "created_at": created_at, "started_at": started_at, "finished_at": finished_at,
+                "has_output": bool(has_output)}
+
+    def input(self, job_id: str) -> Optional[PipelineInput]:
+        """提交时的输入（api_key 为空）"""
+        with self._lock:
+            row = self._conn.execute("SELECT input FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if not row or not row[0]:
+            return None
+        return PipelineInput.model_validate_json(row[0])
+
+    def output(self, job_id: str) -> Optional[PipelineOutput]:
+        with self._lock:
+            row = self._conn.execute("SELECT output FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if not row or not row[0]:
+            return None
+        return PipelineOutput.model_validate_json(row[0])
+
+    def mark_interrupted(self) -> int:
+        """把上一个进程遗留的未结束任务标记为 interrupted，返回条数"""
+        with self._lock:
+            cur = self._conn.execute(
+                f"UPDATE jobs SET status = 'interrupted' WHERE status IN ({', '.join('?' for _ in ACTIVE_STATUSES)})",
+                ACTIVE_STATUSES,
+            )
+            self._conn.commit()
+            return cur.rowcount
+
+    def prune(self, keep: int = KEEP_JOBS) -> int:
+        """删除最近 keep 个之外、已经结束的任务，返回删除的条数"""
+        with self._lock:
+            cur = self._conn.execute(
+                "DELETE FROM jobs WHERE id NOT IN (SELECT id FROM jobs ORDER BY created_at DESC LIMIT ?)"
+                f" AND status NOT IN ({', '.join('?' for _ in ACTIVE_STATUSES)})",
+                (keep, *ACTIVE_STATUSES),
+            )
+            self._conn.commit()
+            return cur.rowcount
+
+
+class JobManager:
+    def __init__(self, store: JobStore, max_workers: int = JOB_WORKERS) -> None:
+        self.store = store
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="pipeline-job")
+        self._futures: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, pipeline_input: PipelineInput, api_key: str = "", max_concurrency: int = 4,
+               metadata: Optional[Dict[str, str]] = None) -> str:
+        """提交一次新的运行，立即返回任务 ID；输入中的 api_key 会被清空，密钥只经运行配置传入"""
+        metadata = metadata or {}
+        pipeline_input = pipeline_input.model_copy(update={"api_key": ""})
+        prune_runs()
+        self.store.prune()
+        config = new_run_config(api_key, max_concurrency, metadata=metadata)
+        job_id = config["configurable"]["thread_id"]
+        self.store.create(job_id, pipeline_input, metadata)
+        self._start(job_id, pipeline_input, config)
+        return job_id
+
+    def resume(self, job_id: str, api_key: str = "", max_concurrency: int = 4) -> str:
+        """从检查点续跑中断、取消或失败的任务（job_id 也可以是没有任务记录的未完成运行的 run ID）"""
+        config = new_run_config(api_key, max_concurrency, run_id=job_id)
+        pipeline_input = None
+        if not run_pipeline.get_state(config).next:
+            # 还没有可续跑的检查点（如排队时就被取消），按提交时的输入重新运行
+            pipeline_input = self.store.input(job_id)
+            if pipeline_input is None:
+                raise ValueError(f"任务 {job_id} 没有可续跑的检查点")
+        if self.store.get(job_id) is None:
+            self.store.create(job_id, None, {})
+        else:
+            self.store.update(job_id, status="queued", error=None, finished_at=None)
+        self._start(job_id, pipeline_input, config)
+        return job_id
+
+    def cancel(self, job_id: str) -> None:
+        """取消任务：排队中的直接取消；运行中的等在途请求完成后停止，已完成的部分保留在检查点中"""
+        with self._lock:
+            future = self._futures.get(job_id)
+        # cancel() 会同步执行完成回调（_forget 需要加锁），不能在持有锁时调用
+        if future is not None and future.cancel():
+            self.store.update(job_id, status="cancelled", finished_at=time.time())
+            return
+        cancel_run(job_id)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self.store.get(job_id)
+
+    def list(self, limit: int = 20) -> List[Dict[str, Any]]:
+        return self.store.list(limit)
+
+    def output(self, job_id: str) -> Optional[PipelineOutput]:
+        return self.store.output(job_id)
+
+    def _start(self, job_id: str, pipeline_input: Optional[PipelineInput], config: Dict[str, Any]) -> None:
+        with self._lock:
+            future = self._executor.submit(self._run, job_id, pipeline_input, config)
+            self._futures[job_id] = future
+        future.add_done_callback(lambda _: self._forget(job_id, future))
+
+    def _forget(self, job_id: str, future: Future) -> None:
+        with self._lock:
+            if self._futures.get(job_id) is future:
+                del self._futures[job_id]
+                # 排队时被取消的任务不会执行 run_pipeline，new_run_config 登记的密钥与调度器要在这里丢弃
+                release_run(job_id)
+
+    def _run(self, job_id: str, pipeline_input: Optional[PipelineInput], config: Dict[str, Any]) -> None:
+        """在工作线程中以流式方式运行（pipeline_input 为 None 时续跑），定期把进度写入任务记录"""
+        self.store.update(job_id, status="running", started_at=time.time(), error=None)
+        progress = new_progress()
+        last_write = 0.0
+        output = None
+        try:
+            for mode, event in run_pipeline.stream(pipeline_input, config=config, stream_mode=["custom", "values"]):
+                if mode == "values":
+                    output = event
+                    continue
+                fold_event(progress, event)
+                if time.time() - last_write >= PROGRESS_INTERVAL:
+                    self.store.update(job_id, progress=progress)
+                    last_write = time.time()
+            if output is None:
+                raise RuntimeError("管线没有返回结果")
+            if not isinstance(output, PipelineOutput):
+                output = PipelineOutput(**output)
+            self.store.update(job_id, status="done", progress=progress, output=output, finished_at=time.time())
+        except RunCancelled:
+            self.store.update(job_id, status="cancelled", progress=progress, finished_at=time.time())
+        except Exception as e:
+            print(f"[JobManager] 任务 {job_id} 失败: {e}")
+            self.store.update(job_id, status="failed", progress=progress, error=str(e), finished_at=time.time())
+
+
+_MANAGERS: Dict[str, JobManager] = {}
+_MANAGERS_LOCK = threading.Lock()
+
+
+def get_job_manager(path: str = DEFAULT_JOBS_PATH, max_workers: int = JOB_WORKERS) -> JobManager:
+    """进程内共享的任务管理器；首次创建时把上一个进程遗留的未结束任务标记为 interrupted"""
+    key = os.path.abspath(path)
+    with _MANAGERS_LOCK:
+        if key not in _MANAGERS:
+            store = JobStore(path)
+            store.mark_interrupted()
+            _MANAGERS[key] = JobManager(store, max_workers)
+        return _MANAGERS[key]
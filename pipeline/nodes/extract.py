@@ -1,15 +1,24 @@
 import json
-from typing import List
+from collections import deque
+from typing import Deque, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
-from llm.client import DeepSeekClient
+from llm.client import DeepSeekClient, content_or_raise
+from llm.scheduler import RateLimitedScheduler
+from llm.tokens import estimate_tokens
 from models.schemas import Document, ExtractResult, ExtractedItem
 from pipeline.utils.json_utils import safe_json_loads_any
-from pipeline.nodes.induction import extract_with_semantic_understanding
+from pipeline.utils.chunking import DEFAULT_OVERLAP_TOKENS, Segment, chunk_token_budget, iter_chunks, pack_spans
+from pipeline.utils.events import Emit, ProgressCounter
+from pipeline.utils.locate import stamp_location
+from pipeline.utils.metrics import count_parse_failure, record_counts
+from pipeline.utils.retrieval import PASSAGE_TOKENS, select_passages
+from pipeline.nodes.induction import extract_semantic_segment, semantic_segments
+from pipeline.nodes.statute import statute_items
 
 
 EXTRACT_SYSTEM = (
     "你是法律文档结构化助手。只基于提供的原文，禁止编造或补充任何未在原文出现的内容。\n"
-    "任务：抽取法条/司法解释/案例/关键词命中，并返回严格 JSON，包含证据片段与定位（可用页码或字符区间）。\n"
+    "任务：抽取法条/司法解释/案例/关键词命中，并返回严格 JSON，包含证据片段（evidence，须为原文摘录）。\n"
     "要求：如果信息缺失，请留空或省略字段；items[].type ∈ {Statute, JudicialInterpretation, Case, KeywordHit}；只输出 JSON。"
 )
 
@@ -23,106 +32,222 @@ def _build_user_prompt(text: str, keywords: List[str]) -> str:
     return head + text
 
 
-def _chunk_text(text: str, chunk_size: int = 12000, overlap: int = 500) -> List[str]:
-    chunks: List[str] = []
-    n = len(text)
-    if n <= chunk_size:
-        return [text]
-    start = 0
-    while start < n:
-        end = min(n, start + chunk_size)
-        chunks.append(text[start:end])
-        if end == n:
-            break
-        start = end - overlap
-        if start < 0:
-            start = 0
-    return chunks
-
-
-def extract_from_documents(documents: List[Document], keywords: List[str], client: DeepSeekClient, model: str) -> List[ExtractedItem]:
+def _extract_chunk(chunk: str, keywords: List[str], client: DeepSeekClient, model: str) -> List[dict]:
+    """对单个分块调用一次 LLM，返回解析出的原始条目（dict）；请求失败时抛出异常，由调度器重试"""
+    messages = [
+        {"role": "system", "content": EXTRACT_SYSTEM},
+        {"role": "user", "content": _build_user_prompt(chunk, keywords)},
+    ]
+    content = content_or_raise(client.complete(messages=messages, model=model, temperature=0.0))
+    if not content.strip():
+        return []
+    data = safe_json_loads_any(content)
+    if not isinstance(data, dict):
+        count_parse_failure(client, "extract")
+        return []
+    items = data.get("items") or data.get("Items") or []
+    if not isinstance(items, list):
+        return []
+    return [it for it in items if isinstance(it, dict)]
+
+
+def _retrieved_spans(doc: Document, keywords: List[str], recall: float,
+                     counts: Dict[str, int]) -> List[Tuple[int, int]]:
+    """检索预筛：返回文档中需要交给 LLM 的区间（相邻段落已合并）；只按本文档的段落打分，文档一到即可筛选"""
+    passages = list(iter_chunks(doc.text, PASSAGE_TOKENS))
+    selected = select_passages([c.text for c in passages], keywords, recall=recall)
+    counts["passages"] = counts.get("passages", 0) + len(passages)
+    counts["passages_selected"] = counts.get("passages_selected", 0) + len(selected)
+    spans: List[Tuple[int, int]] = []
+    for i in selected:
+        c = passages[i]
+        if spans and spans[-1][1] == c.start:
+            spans[-1] = (spans[-1][0], c.end)
+        else:
+            spans.append((c.start, c.end))
+    return spans
+
+
+def _iter_chunk_results(documents: Iterable[Document], keywords: List[str], client: DeepSeekClient,
+                        model: str, scheduler: RateLimitedScheduler, chunk_tokens: int = 0,
+                        retrieval_recall: float = 1.0, counts: Optional[Dict[str, int]] = None,
+                        emit: Optional[Emit] = None, max_pending: int = 0) -> Iterator[Tuple[Document, List[dict]]]:
+    """
+    并发抽取所有文档的所有分块，按（文档顺序，分块顺序）逐块产出 (文档, 条目)，条目已带上定位
+
+    documents 可以是解析阶段仍在产出的流：每到一篇文档就把它的分块提交给调度器，不必等全部文件解析完。
+    retrieval_recall < 1 且有关键词时先对每篇文档做本地检索预筛，只把相关段落拼成分块发给 LLM；
+    预筛逐篇打分，同样不必等其余文档。
+    分块请求经 scheduler.imap 提交，在途请求数受 max_pending 限制，下游消费慢时暂停提交。
+    提供 emit 时每完成一个分块就发出进度事件，并逐条发出其中的 item 事件。
+    """
+    counts = counts if counts is not None else {}
+    counts.setdefault("input_tokens", 0)
+    counts.setdefault("chunk_calls", 0)
+    budget = chunk_token_budget(model, chunk_tokens)
+    progress = ProgressCounter(emit, "extract", 0)
+
+    def _doc_jobs() -> Iterator[List[Tuple[Document, str, List[Segment]]]]:
+        for doc in documents:
+            if keywords and retrieval_recall < 1.0:
+                spans = _retrieved_spans(doc, keywords, retrieval_recall, counts)
+                yield [(doc, text, segments)
+                       for text, segments in pack_spans(doc.text, spans, budget, DEFAULT_OVERLAP_TOKENS)]
+            else:
+                yield [(doc, c.text, [(0, c.start, c.end)]) for c in iter_chunks(doc.text, budget, DEFAULT_OVERLAP_TOKENS)]
+
+    def _jobs() -> Iterator[Tuple[Document, str, List[Segment]]]:
+        for jobs in _doc_jobs():
+            counts["input_tokens"] += sum(estimate_tokens(text) for _, text, _ in jobs)
+            counts["chunk_calls"] += len(jobs)
+            progress.add_total(len(jobs))
+            yield from jobs
+
+    def _run(job: Tuple[Document, str, List[Segment]]) -> List[dict]:
+        doc, chunk, segments = job
+        raw_items = _extract_chunk(chunk, keywords, client, model)
+        for it in raw_items:
+            stamp_location(it, doc, chunk, segments)
+            it["docName"] = doc.name
+        return raw_items
+
+    def _done(_: int, raw_items: Optional[List[dict]]) -> None:
+        # 在结果回调里发事件：续跑时直接复用的分块同样计入进度
+        if emit is not None:
+            for it in raw_items or []:
+                emit({"type": "item", "item": it})
+        progress.step()
+
+    for (doc, _, _), raw_items in scheduler.imap(_run, _jobs(), default=[], on_result=_done, max_pending=max_pending):
+        yield doc, raw_items or []
+
+
+def _dedup_key(item: ExtractedItem) -> Optional[str]:
+    """按证据（没有则按正文）去掉空白后的内容判重；两者都为空的条目不参与去重"""
+    content = item.evidence or item.text or ""
+    key = "".join(content.split())
+    return key or None
+
+
+def iter_extracted_items(documents: Iterable[Document], keywords: List[str], client: DeepSeekClient, model: str,
+                         scheduler: RateLimitedScheduler, chunk_tokens: int = 0,
+                         stats: Optional[Dict[str, int]] = None, retrieval_recall: float = 1.0,
+                         emit: Optional[Emit] = None, max_pending: int = 0,
+                         parse_statutes: bool = True) -> Iterator[ExtractedItem]:
+    """
+    extract_from_documents 的流式版本：每个分块的结果一到（按分块顺序）就产出其中去重后的条目，
+    下游制卡不必等全部分块抽取完；语义补充需要全部条目数，在所有分块之后进行
+
+    documents 可以是仍在解析的文档流，每到一篇就开始处理（包括开启检索预筛时，见 _iter_chunk_results）。
+    parse_statutes 为真时，结构规整的法条文档在本地按条切分（见 pipeline/nodes/statute.py），
+    其条目随下一个分块结果一起产出，只有其余文档（包括找不到任何相关条文的法条文档）交给模型抽取。
+    """
+    counts = {"chunk_calls": 0, "input_tokens": 0, "semantic_docs": 0, "semantic_calls": 0, "items": 0,
+              "duplicates": 0, "statute_docs": 0, "statute_items": 0}
+    seen: Set[str] = set()
+    relevant: Set[int] = set()
+    arrived: List[Document] = []
+    local_items: Deque[ExtractedItem] = deque()
+
+    def _add(item: ExtractedItem) -> bool:
+        key = _dedup_key(item)
+        if key is not None:
+            if key in seen:
+                counts["duplicates"] += 1
+                return False
+            seen.add(key)
+        counts["items"] += 1
+        return True
+
+    def _llm_docs() -> Iterator[Document]:
+        """逐篇分流：法条文档在本地切分，条目暂存待产出；其余文档交给模型"""
+        for doc in documents:
+            arrived.append(doc)
+            local = statute_items(doc, keywords) if parse_statutes else None
+            if local is None:
+                yield doc
+                continue
+            counts["statute_docs"] += 1
+            local_items.extend(local)
+
+    def _flush_local() -> Iterator[ExtractedItem]:
+        while local_items:
+            item = local_items.popleft()
+            if emit is not None:
+                emit({"type": "item", "item": item.model_dump()})
+            if _add(item):
+                counts["statute_items"] += 1
+                yield item
+
+    # 逐块抽取（唯一一轮），结果按文档、分块顺序产出
+    for doc, raw_items in _iter_chunk_results(_llm_docs(), keywords, client, model, scheduler, chunk_tokens,
+                                              retrieval_recall, counts, emit, max_pending):
+        yield from _flush_local()
+        relevant.add(id(doc))
+        for it in raw_items:
+            try:
+                item = ExtractedItem(**it)
+            except Exception:
+                continue
+            if _add(item):
+                yield item
+    yield from _flush_local()
+
+    # 结果较少时做语义理解补充：本地检索相关句子后只把这些片段交给 LLM，不再受文档长度限制；
+    # 开启预筛时跳过没有任何相关段落的文档
+    if keywords and counts["items"] < len(keywords) * 5:
+        semantic_docs = [doc for doc in arrived if id(doc) in relevant]
+        counts["semantic_docs"] = len(semantic_docs)
+        # 每个检索分块一个请求，与分块抽取一样经调度器限流、重试；结果以 dict 返回，便于写入检查点
+        semantic_jobs = [(doc, content, segments) for doc in semantic_docs
+                         for content, segments in semantic_segments(doc, keywords, model, chunk_tokens)]
+        counts["semantic_calls"] = len(semantic_jobs)
+        semantic_results = scheduler.map(
+            lambda job: [it.model_dump() for it in extract_semantic_segment(
+                job[1], job[2], job[0], keywords, client, model)],
+            semantic_jobs,
+            default=[],
+        )
+        for semantic_items in semantic_results:
+            for semantic_item in semantic_items or []:
+                item = ExtractedItem(**semantic_item)
+                if _add(item):
+                    yield item
+
+    # 计数汇总进 output.metrics 的 counters（extract.chunk_calls、extract.passages_selected 等）
+    record_counts(client, "extract", counts)
+    if stats is not None:
+        stats.update(counts)
+
+
+def extract_from_documents(documents: List[Document], keywords: List[str], client: DeepSeekClient, model: str,
+                           max_concurrency: int = 4, chunk_tokens: int = 0,
+                           stats: Optional[Dict[str, int]] = None, retrieval_recall: float = 1.0,
+                           emit: Optional[Emit] = None,
+                           scheduler: Optional[RateLimitedScheduler] = None,
+                           parse_statutes: bool = True) -> List[ExtractedItem]:
     """
     从文档中抽取知识点，支持语义理解增强
-    
+
+    每个分块只调用一次 LLM；重叠分块与语义补充产生的重复条目通过哈希集合 O(1) 去重。
+
     Args:
         documents: 文档列表
         keywords: 关键词列表
         client: LLM客户端
         model: 使用的模型名称
-        
+        max_concurrency: 同时在途的最大 LLM 请求数（1 表示串行）
+        chunk_tokens: 每个分块的 token 预算，0 表示按模型取默认值
+        stats: 传入时写入本次运行的计数（chunk_calls、semantic_docs、items、duplicates、input_tokens 等）
+        retrieval_recall: 检索预筛保留的段落比例，1 表示不预筛、全文发送（见 pipeline/utils/retrieval.py）
+        emit: 进度与中间结果的事件回调（见 pipeline/utils/events.py）
+        scheduler: 请求调度器（限流与重试）；不传时按 max_concurrency 新建一个
+        parse_statutes: 结构规整的法条文档在本地按条切分，不调用模型
+
     Returns:
         抽取的知识点列表
     """
-    all_items: List[ExtractedItem] = []
-    
-    # 优化抽取策略：根据关键词情况选择最佳方法
-    if keywords:
-        # 策略1：先进行传统关键词抽取（快速、高效）
-        traditional_items = []
-        for doc in documents:
-            for chunk in _chunk_text(doc.text):
-                messages = [
-                    {"role": "system", "content": EXTRACT_SYSTEM},
-                    {"role": "user", "content": _build_user_prompt(chunk, keywords)},
-                ]
-                content = client.chat(messages=messages, model=model, temperature=0.0)
-                if not isinstance(content, str) or not content.strip():
-                    continue
-                data = safe_json_loads_any(content)
-                if not isinstance(data, dict):
-                    continue
-                items = data.get("items") or data.get("Items") or []
-                if not isinstance(items, list):
-                    continue
-                for it in items:
-                    if not isinstance(it, dict):
-                        continue
-                    try:
-                        it["docName"] = doc.name
-                        traditional_items.append(ExtractedItem(**it))
-                    except Exception:
-                        continue
-        
-        # 策略2：对结果较少的文档进行语义理解补充
-        if len(traditional_items) < len(keywords) * 5:  # 如果结果较少
-            # 按文档分别进行语义理解，避免上下文过长
-            for doc in documents:
-                if len(doc.text) < 8000:  # 只处理较短的文档
-                    semantic_items = extract_with_semantic_understanding(
-                        doc.text, keywords, client, model
-                    )
-                    # 添加语义理解结果，避免重复
-                    for semantic_item in semantic_items:
-                        if not any(t.evidence == semantic_item.evidence for t in traditional_items):
-                            all_items.append(semantic_item)
-        
-        all_items.extend(traditional_items)
-    
-    # 无关键词时保持原有逻辑
-    for doc in documents:
-        for chunk in _chunk_text(doc.text):
-            messages = [
-                {"role": "system", "content": EXTRACT_SYSTEM},
-                {"role": "user", "content": _build_user_prompt(chunk, keywords)},
-            ]
-            content = client.chat(messages=messages, model=model, temperature=0.0)
-            if not isinstance(content, str) or not content.strip():
-                continue
-            data = safe_json_loads_any(content)
-            if not isinstance(data, dict):
-                continue
-            items = data.get("items") or data.get("Items") or []
-            if not isinstance(items, list):
-                continue
-            for it in items:
-                if not isinstance(it, dict):
-                    continue
-                try:
-                    it["docName"] = doc.name
-                    # 如果是语义理解已经抽取的内容，避免重复
-                    if not any(existing.evidence == it.get("evidence") for existing in all_items):
-                        all_items.append(ExtractedItem(**it))
-                except Exception:
-                    continue
-    
-    return all_items
+    if scheduler is None:
+        scheduler = RateLimitedScheduler(max_concurrency=max_concurrency)
+    return list(iter_extracted_items(documents, keywords, client, model, scheduler, chunk_tokens, stats,
+                                     retrieval_recall, emit, parse_statutes=parse_statutes))
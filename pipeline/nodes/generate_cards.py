@@ -1,9 +1,16 @@
 import json
-from typing import List
+import threading
+from typing import Callable, Iterable, Iterator, List, Optional, Set, Tuple
 
-from llm.client import DeepSeekClient
+from llm.client import DeepSeekClient, content_or_raise
+from llm.scheduler import RateLimitedScheduler
+from llm.tokens import estimate_messages_tokens, truncate_to_tokens
 from models.schemas import ExtractedItem, Card
 from pipeline.utils.json_utils import safe_json_loads_any
+from pipeline.utils.chunking import ITEM_CHUNK_TOKENS
+from pipeline.utils.events import Emit, ProgressCounter
+from pipeline.utils.json_stream import JsonElementStream
+from pipeline.utils.metrics import count_parse_failure, record_counts
 from pipeline.nodes.induction import generate_cards_with_intelligence
 
 
@@ -15,14 +22,27 @@ CARD_SYSTEM = (
     "输出JSON：{cards:[{type:'basic'|'cloze',Question:'',Answer:'',Difficulty:'easy'|'medium'|'hard'}]}"
 )
 
+CARD_BATCH_SYSTEM = (
+    "你是法学生考试复习助手。基于提供的法律内容生成Anki卡片。\n\n"
+    "要求：1）每张卡聚焦一个知识点 2）问题简洁明确 3）答案准确完整\n"
+    "生成多种类型：问答/背诵/填空，适合期末考试复习。\n"
+    "严格基于原文，不添加外部知识。每张卡要有不同角度。\n"
+    "输入包含多个编号条目，请分别为每个条目制卡，不同条目的卡片不要混在一起。\n"
+    "输出JSON：{results:[{index:条目编号,cards:[{type:'basic'|'cloze',Question:'',Answer:'',Difficulty:'easy'|'medium'|'hard'}]}]}"
+)
+
+# 估算 TPM 时每次制卡请求预留的输出 token 数（批量请求按条目数累加）
+EXPECTED_COMPLETION_TOKENS = 800
+
 
 def _build_card_prompt(item: ExtractedItem, max_cards_per_item: int) -> str:
-    evidence = item.text or ""
+    # 与原文条目的分块预算一致，条目内容不会被截断
+    evidence = truncate_to_tokens(item.text or "", ITEM_CHUNK_TOKENS)
     content_type = "法条" if item.type == "Statute" else "案例" if item.type == "Case" else "概念"
     
     return f"""基于以下{content_type}内容，生成{max_cards_per_item}张不同的复习卡片：
 
-内容：{evidence[:500]}  # 限制长度避免过载
+内容：{evidence}
 来源：{item.docName or "未知"}
 类型：{item.type}
 
@@ -52,75 +72,280 @@ def _heuristic_quality(question: str, answer: str, evidence: str) -> float:
     return score
 
 
-def generate_cards(items: List[ExtractedItem], client: DeepSeekClient, model: str, max_cards_per_item: int) -> List[Card]:
+def _card_messages(item: ExtractedItem, max_cards_per_item: int) -> List[dict]:
+    # 放宽卡片数量限制，提高制卡效率
+    actual_max_cards = min(max_cards_per_item, 8)  # 直接使用8张上限
+    # 构建复习导向的prompt
+    return [
+        {"role": "system", "content": CARD_SYSTEM},
+        {"role": "user", "content": _build_card_prompt(item, actual_max_cards)},
+    ]
+
+
+def _request_raw_cards(item: ExtractedItem, client: DeepSeekClient, model: str, max_cards_per_item: int) -> List[dict]:
+    """为单个知识点调用一次 LLM，返回原始卡片 dict 列表；接口错误向上抛出以便调度器重试"""
+    # 调用LLM生成多样化复习卡片
+    content = content_or_raise(client.complete(messages=_card_messages(item, max_cards_per_item), model=model,
+                                               temperature=0.2))  # 降低温度提高稳定性
+    if not content.strip():
+        return []
+    data = safe_json_loads_any(content)
+    if not isinstance(data, dict):
+        count_parse_failure(client, "cards")
+        return []
+    raw_cards = data.get("cards") or []
+    if not isinstance(raw_cards, list):
+        return []
+    return [rc for rc in raw_cards if isinstance(rc, dict)]
+
+
+def _valid_raw_cards(raw) -> Optional[List[dict]]:
+    """批量响应中单个条目的卡片列表；格式不对或没有一张完整的问答卡时返回 None"""
+    if not isinstance(raw, list):
+        return None
+    cards = [rc for rc in raw if isinstance(rc, dict)]
+    if not any((rc.get("Question") or "").strip() and (rc.get("Answer") or "").strip() for rc in cards):
+        return None
+    return cards
+
+
+def _build_batch_prompt(items: List[ExtractedItem], max_cards_per_item: int) -> str:
+    parts = [f"以下共{len(items)}个条目，请为每个条目各生成{max_cards_per_item}张不同的复习卡片，"
+             f"results 中用 index 标明对应的条目编号：\n"]
+    for i, item in enumerate(items):
+        evidence = truncate_to_tokens(item.text or "", ITEM_CHUNK_TOKENS)
+        parts.append(f"【条目 {i}】\n内容：{evidence}\n来源：{item.docName or '未知'}\n类型：{item.type}\n")
+    parts.append("要求：每张卡从不同角度考察，包含问答、背诵、填空等类型。\n输出严格JSON格式。")
+    return "\n".join(parts)
+
+
+def _batch_messages(items: List[ExtractedItem], max_cards_per_item: int) -> List[dict]:
+    if len(items) == 1:
+        # 单条目的批次沿用逐条提示词，与非批量模式共享响应缓存
+        return _card_messages(items[0], max_cards_per_item)
+    return [
+        {"role": "system", "content": CARD_BATCH_SYSTEM},
+        {"role": "user", "content": _build_batch_prompt(items, min(max_cards_per_item, 8))},
+    ]
+
+
+def _request_raw_batch(items: List[ExtractedItem], client: DeepSeekClient, model: str, max_cards_per_item: int,
+                       on_entry: Optional[Callable[[int, List[dict]], None]] = None) -> List[Optional[List[dict]]]:
     """
-    生成学习卡片，专为法学生期末复习设计
-    支持多种卡片类型：知识问答、背诵记忆、填空题
+    一次请求为多个知识点制卡，返回与 items 对齐的原始卡片列表；
+    某个条目缺失或格式不对时对应位置为 None，由调用方单独重试。接口错误向上抛出以便调度器重试
+
+    提供 on_entry 时以流式方式请求，批内每个条目的卡片一写完就回调 (批内下标, 原始卡片)。
     """
-    cards: List[Card] = []
-    
-    for item in items:
+    out: List[Optional[List[dict]]] = [None] * len(items)
+    if len(items) == 1:
+        out[0] = _valid_raw_cards(_request_raw_cards(items[0], client, model, max_cards_per_item))
+        if out[0] is not None and on_entry is not None:
+            on_entry(0, out[0])
+        return out
+
+    def _take(entry) -> None:
+        if not isinstance(entry, dict):
+            return
         try:
-            # 放宽卡片数量限制，提高制卡效率
-            actual_max_cards = min(max_cards_per_item, 8)  # 直接使用8张上限
-            
-            # 构建复习导向的prompt
-            messages = [
-                {"role": "system", "content": CARD_SYSTEM},
-                {"role": "user", "content": _build_card_prompt(item, actual_max_cards)},
-            ]
-            
-            # 调用LLM生成多样化复习卡片
-            content = client.chat(messages=messages, model=model, temperature=0.2)  # 降低温度提高稳定性
-            
-            if isinstance(content, str) and content.strip():
-                data = safe_json_loads_any(content)
-                if isinstance(data, dict):
-                    raw_cards = data.get("cards") or []
-                    if isinstance(raw_cards, list):
-                        for rc in raw_cards:
-                            if isinstance(rc, dict):
-                                q = (rc.get("Question", "") or "").strip()
-                                a = (rc.get("Answer", "") or "").strip()
-                                if q and a:
-                                    evidence = (item.text or "").strip()
-                                    qual = _to_float(rc.get("quality"))
-                                    if qual <= 0.0:
-                                        qual = _heuristic_quality(q, a, evidence)
-                                    
-                                    # 创建复习专用卡片
-                                    card = Card(
-                                        type=rc.get("type", "basic"),
-                                        Question=q,
-                                        Answer=a,
-                                        SourceDoc=item.docName or "",
-                                        SourceLoc=(item.articleNo or item.section or item.docketNo or ""),
-                                        Tags=_generate_review_tags(item, rc.get("type", "basic")),
-                                        Difficulty=(rc.get("Difficulty", "") or "medium"),
-                                        Evidence=evidence,
-                                        quality=qual,
-                                        llm_induction=f"复习卡({rc.get('type', 'basic')})",
-                                        user_confirmed=False,
-                                        confirmation_time=None,
-                                        induction_prompt="law_student_review"
-                                    )
-                                    cards.append(card)
+            idx = int(entry.get("index"))
+        except (TypeError, ValueError):
+            return
+        if 0 <= idx < len(items) and out[idx] is None:
+            out[idx] = _valid_raw_cards(entry.get("cards"))
+            if out[idx] is not None and on_entry is not None:
+                on_entry(idx, out[idx])
+
+    messages = _batch_messages(items, max_cards_per_item)
+    if on_entry is not None and hasattr(client, "stream"):
+        stream = JsonElementStream(("results",))
+        for piece in client.stream(messages=messages, model=model, temperature=0.2):
+            for entry in stream.feed(piece):
+                _take(entry)
+        if not stream.done:
+            count_parse_failure(client, "card_batch")
+        return out
+    content = content_or_raise(client.complete(messages=messages, model=model, temperature=0.2))
+    data = safe_json_loads_any(content)
+    results = data.get("results") if isinstance(data, dict) else None
+    if not isinstance(results, list):
+        count_parse_failure(client, "card_batch")
+    for entry in results if isinstance(results, list) else []:
+        _take(entry)
+    return out
+
+
+def _iter_batches(items: Iterable[ExtractedItem], max_cards_per_item: int, batch_size: int,
+                  batch_tokens: int) -> Iterator[List[Tuple[int, ExtractedItem]]]:
+    """
+    按到达顺序把 (条目下标, 条目) 装入批次：每批不超过 batch_size 个条目，估算的输入+输出 token 不超过 batch_tokens
+
+    items 可以是仍在产出的生成器，批次装满（下一个条目放不下）即产出，不等待后续条目。
+    """
+    current: List[Tuple[int, ExtractedItem]] = []
+    used = 0
+    for i, item in enumerate(items):
+        cost = estimate_messages_tokens(_card_messages(item, max_cards_per_item)) + EXPECTED_COMPLETION_TOKENS
+        if current and (len(current) >= batch_size or used + cost > batch_tokens):
+            yield current
+            current, used = [], 0
+        current.append((i, item))
+        used += cost
+    if current:
+        yield current
+
+
+def _cards_from_raw(item: ExtractedItem, raw_cards: List[dict]) -> List[Card]:
+    cards: List[Card] = []
+    for rc in raw_cards:
+        q = (rc.get("Question", "") or "").strip()
+        a = (rc.get("Answer", "") or "").strip()
+        if q and a:
+            evidence = (item.text or "").strip()
+            qual = _to_float(rc.get("quality"))
+            if qual <= 0.0:
+                qual = _heuristic_quality(q, a, evidence)
             
-            # 只在卡片很少时补充生成背诵卡片
-            if len(cards) < 3 and item.type == "Statute":
-                try:
-                    memory_cards = _generate_memory_cards(item, client, model)
-                    cards.extend(memory_cards)
-                except Exception:
-                    pass
-                    
-        except Exception as e:
-            print(f"卡片生成失败: {e}")
-            continue
-    
+            # 创建复习专用卡片
+            card = Card(
+                type=rc.get("type", "basic"),
+                Question=q,
+                Answer=a,
+                SourceDoc=item.docName or "",
+                SourceLoc=(item.articleNo or item.section or item.docketNo or ""),
+                Tags=_generate_review_tags(item, rc.get("type", "basic")),
+                Difficulty=(rc.get("Difficulty", "") or "medium"),
+                Evidence=evidence,
+                quality=qual,
+                llm_induction=f"复习卡({rc.get('type', 'basic')})",
+                user_confirmed=False,
+                confirmation_time=None,
+                induction_prompt="law_student_review"
+            )
+            cards.append(card)
     return cards
 
 
+def iter_cards(items: Iterable[ExtractedItem], client: DeepSeekClient, model: str, max_cards_per_item: int,
+               scheduler: Optional[RateLimitedScheduler] = None, batch_size: int = 1, batch_tokens: int = 12000,
+               emit: Optional[Emit] = None, max_pending: int = 0) -> Iterator[Card]:
+    """
+    generate_cards 的流式版本：items 可以是上游（抽取）仍在产出的生成器，
+    攒够一批就提交请求，卡片按 items 顺序逐个产出，下游质量过滤与去重不必等全部卡片生成
+
+    已提交而未取走结果的批次最多 max_pending 个（0 表示 2×并发上限），达到上限时暂停读取上游。
+    """
+    if scheduler is None:
+        scheduler = RateLimitedScheduler(max_concurrency=1)
+    batch_mode = batch_size > 1
+
+    # 总数随上游条目的到达而增长
+    progress = ProgressCounter(emit, "cards", 0)
+    ready: Set[int] = set()
+    ready_lock = threading.Lock()
+
+    def _on_ready(i: int, item: ExtractedItem, raw: List[dict]) -> None:
+        # 流式请求被调度器重试时同一条目可能回调多次，只发一次
+        with ready_lock:
+            if i in ready:
+                return
+            ready.add(i)
+        for card in _cards_from_raw(item, raw):
+            emit({"type": "card", "card": card.model_dump()})
+        progress.step()
+
+    on_ready = _on_ready if emit is not None else None
+
+    def _batches() -> Iterator[List[Tuple[int, ExtractedItem]]]:
+        for batch in _iter_batches(items, max_cards_per_item, batch_size if batch_mode else 1, batch_tokens):
+            if emit is not None:
+                progress.add_total(len(batch))
+            yield batch
+
+    def _run(batch: List[Tuple[int, ExtractedItem]]) -> List[Optional[List[dict]]]:
+        if batch_mode:
+            on_entry = (lambda pos, raw: on_ready(*batch[pos], raw)) if on_ready is not None else None
+            return _request_raw_batch([item for _, item in batch], client, model, max_cards_per_item, on_entry)
+        raw = _request_raw_cards(batch[0][1], client, model, max_cards_per_item)
+        if on_ready is not None:
+            on_ready(*batch[0], raw)
+        return [raw]
+
+    def _cost(batch: List[Tuple[int, ExtractedItem]]) -> int:
+        batch_items = [item for _, item in batch]
+        return estimate_messages_tokens(_batch_messages(batch_items, max_cards_per_item)) \
+            + EXPECTED_COMPLETION_TOKENS * len(batch_items)
+
+    def _retry_cost(item: ExtractedItem) -> int:
+        return estimate_messages_tokens(_card_messages(item, max_cards_per_item)) + EXPECTED_COMPLETION_TOKENS
+
+    counts = {"items": 0, "batches": 0, "retries": 0}
+    produced = 0
+    for batch, result in scheduler.imap(_run, _batches(), cost=_cost, default=None, max_pending=max_pending):
+        counts["batches"] += 1
+        counts["items"] += len(batch)
+        # 整批失败（接口错误或响应无法解析）时批内条目全部逐条重试，否则只重试缺失或格式不对的条目；
+        # 单条目批次已经是逐条请求，失败了不再重复
+        raws = [result[pos] if result is not None else None for pos in range(len(batch))]
+        retry = [pos for pos, raw in enumerate(raws) if raw is None] if len(batch) > 1 else []
+        if retry:
+            counts["retries"] += len(retry)
+            retried = scheduler.map(
+                lambda pos: _request_raw_cards(batch[pos][1], client, model, max_cards_per_item),
+                retry,
+                cost=lambda pos: _retry_cost(batch[pos][1]),
+                default=[],
+            )
+            for pos, raw in zip(retry, retried):
+                raws[pos] = raw
+
+        for (i, item), raw_cards in zip(batch, raws):
+            # 续跑时复用的请求不会触发请求内的回调，在这里补发；最终没有拿到卡片的条目也计入进度
+            if on_ready is not None:
+                on_ready(i, item, raw_cards or [])
+            try:
+                cards = _cards_from_raw(item, raw_cards or [])
+
+                # 只在卡片很少时补充生成背诵卡片
+                if produced + len(cards) < 3 and item.type == "Statute":
+                    try:
+                        memory_cards = _generate_memory_cards(item, client, model)
+                        if emit is not None:
+                            for card in memory_cards:
+                                emit({"type": "card", "card": card.model_dump()})
+                        cards.extend(memory_cards)
+                    except Exception:
+                        pass
+
+            except Exception as e:
+                print(f"卡片生成失败: {e}")
+                continue
+            produced += len(cards)
+            yield from cards
+
+    # 计数汇总进 output.metrics 的 counters（cards.items、cards.batches、cards.retries）
+    record_counts(client, "cards", counts)
+
+
+def generate_cards(items: List[ExtractedItem], client: DeepSeekClient, model: str, max_cards_per_item: int,
+                   scheduler: Optional[RateLimitedScheduler] = None, batch_size: int = 1,
+                   batch_tokens: int = 12000, emit: Optional[Emit] = None) -> List[Card]:
+    """
+    生成学习卡片，专为法学生期末复习设计
+    支持多种卡片类型：知识问答、背诵记忆、填空题
+
+    各知识点的 LLM 请求交给 scheduler 并发执行（受 RPM/TPM 限制，429/5xx 自动退避），
+    结果按 items 顺序合并，因此输出卡片顺序与响应到达先后无关。
+
+    batch_size > 1 时把多个知识点打包进同一请求（估算 token 不超过 batch_tokens），
+    按条目编号把卡片映射回各自的知识点；批内个别条目缺失或格式不对时只重试该条目。
+
+    提供 emit 时，每个知识点的卡片一确定就发出 card 事件（质量过滤与去重之前的预览）和进度事件，
+    批量请求以流式方式接收，批内第一个条目写完即可看到卡片。
+    """
+    return list(iter_cards(items, client, model, max_cards_per_item, scheduler, batch_size, batch_tokens, emit))
+
+
 def _calculate_optimal_card_count(item: ExtractedItem) -> int:
     """根据内容类型和长度计算最优卡片数量"""
     base_count = 2
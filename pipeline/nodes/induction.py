@@ -4,10 +4,19 @@ LLM智慧归纳与语义理解模块
 提供LLM智慧归纳、语义理解关键词抽取功能
 """
 
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 import json
-from models.schemas import ExtractedItem, Card
-from llm.client import DeepSeekClient
+from models.schemas import Document, ExtractedItem, Card
+from llm.client import DeepSeekClient, content_or_raise
+from pipeline.nodes.normalize import segment_with_spans
+from pipeline.utils.chunking import DEFAULT_OVERLAP_TOKENS, Segment, chunk_token_budget, pack_spans
+from pipeline.utils.json_utils import safe_json_loads_any
+from pipeline.utils.locate import stamp_location
+from pipeline.utils.metrics import count_parse_failure
+from pipeline.utils.semantic_index import SemanticIndex
+
+# 语义补充时每篇文档检索的相关句子数
+SEMANTIC_TOP_K = 20
 
 
 def generate_cards_with_intelligence(items: List[ExtractedItem], client: DeepSeekClient, 
@@ -74,34 +83,28 @@ def generate_cards_with_intelligence(items: List[ExtractedItem], client: DeepSee
     return cards
 
 
-def extract_with_semantic_understanding(documents_text: str, keywords: List[str],
-                                      client: DeepSeekClient, model: str) -> List[ExtractedItem]:
-    """
-    基于语义理解的关键词抽取 - 智能分段处理所有内容
-    """
-    try:
-        # 根据文档大小智能选择处理策略
-        text_length = len(documents_text)
-        
-        if text_length <= 15000:  # 小文档直接处理
-            return _process_semantic_segment(documents_text, keywords, client, model)
-        else:  # 大文档分段处理
-            return _process_large_document(documents_text, keywords, client, model)
-            
-    except Exception as e:
-        print(f"语义理解抽取失败: {e}")
+def _semantic_spans(document: Document, keywords: List[str], top_k: int, neighbours: int) -> List[Tuple[int, int]]:
+    """在本地语义索引中检索相关句子，连同前后相邻句子合并为文档区间"""
+    sentences = segment_with_spans(document)
+    if not sentences:
         return []
-
-
-def _process_semantic_segment(text_segment: str, keywords: List[str],
-                             client: DeepSeekClient, model: str) -> List[ExtractedItem]:
-    """处理单个文本段落的语义理解"""
-    try:
-        # 构建语义理解prompt - 动态调整内容长度
-        segment_size = min(len(text_segment), 15000)  # 保证不超过合理长度
-        content = text_segment[:segment_size]
-        
-        prompt = f"""请分析以下法律文档内容，找出与关键词"{', '.join(keywords)}"相关的知识点：
+    index = SemanticIndex([s for s, _, _ in sentences])
+    hits = sorted({j for i, _ in index.search(keywords, top_k=top_k)
+                   for j in range(max(0, i - neighbours), min(len(sentences), i + neighbours + 1))})
+    spans: List[Tuple[int, int]] = []
+    prev = -2
+    for j in hits:
+        _, start, end = sentences[j]
+        if j == prev + 1:
+            spans[-1] = (spans[-1][0], end)
+        else:
+            spans.append((start, end))
+        prev = j
+    return spans
+
+
+def _semantic_prompt(content: str, keywords: List[str]) -> str:
+    return f"""请分析以下法律文档片段，找出与关键词"{', '.join(keywords)}"相关的知识点：
 
 文档内容: {content}
 关键词: {', '.join(keywords)}
@@ -124,83 +127,77 @@ def _process_semantic_segment(text_segment: str, keywords: List[str],
     ]
 }}
 """
-        
-        # 调用LLM进行语义理解
-        response = client.generate(prompt, model=model)
-        
-        # 解析响应
-        result = parse_json_response(response)
-        items = []
-        
-        for item_data in result.get("items", []):
-            item = ExtractedItem(
-                type=item_data.get("type", "KeywordHit"),
-                title=item_data.get("title"),
-                text=item_data.get("content"),
-                evidence=item_data.get("evidence"),
-                docName="语义抽取结果",
-                keywordsHit=item_data.get("semantic_matches", []),
-                semantic_matches=item_data.get("semantic_matches", []),
-                induction_quality=0.7,  # 默认质量
-                induction_notes="语义理解抽取"
-            )
-            items.append(item)
-        
-        return items
-        
+
+
+def semantic_segments(document: Document, keywords: List[str], model: str, chunk_tokens: int = 0,
+                      top_k: int = SEMANTIC_TOP_K, neighbours: int = 1) -> List[Tuple[str, List[Segment]]]:
+    """
+    语义补充的本地检索：对文档句子做 TF-IDF 检索与关键词扩展（任意长度的文档都只需毫秒级 CPU 时间），
+    把检索到的片段拼成不超过 token 预算的分块，返回 [(分块文本, 原文区间)]，每个分块对应一次 LLM 请求
+
+    Args:
+        top_k: 检索的相关句子数
+        neighbours: 每个相关句子前后各带上的句子数
+    """
+    spans = _semantic_spans(document, keywords, top_k, neighbours)
+    if not spans:
+        return []
+    budget = chunk_token_budget(model, chunk_tokens)
+    return list(pack_spans(document.text, spans, budget, DEFAULT_OVERLAP_TOKENS))
+
+
+def extract_with_semantic_understanding(document: Document, keywords: List[str], client: DeepSeekClient,
+                                        model: str, chunk_tokens: int = 0, top_k: int = SEMANTIC_TOP_K,
+                                        neighbours: int = 1) -> List[ExtractedItem]:
+    """
+    基于语义理解的关键词抽取：先本地检索（见 semantic_segments），只把相关片段逐块交给 LLM
+
+    单个分块请求失败时打印错误并跳过；需要重试与限流时改用 semantic_segments + extract_semantic_segment 经调度器提交。
+    """
+    try:
+        segments_list = semantic_segments(document, keywords, model, chunk_tokens, top_k, neighbours)
     except Exception as e:
-        print(f"段落语义理解失败: {e}")
+        print(f"语义理解抽取失败: {e}")
         return []
+    items: List[ExtractedItem] = []
+    for content, segments in segments_list:
+        try:
+            items.extend(extract_semantic_segment(content, segments, document, keywords, client, model))
+        except Exception as e:
+            print(f"段落语义理解失败: {e}")
+    return items
 
 
-def _process_large_document(documents_text: str, keywords: List[str],
-                           client: DeepSeekClient, model: str) -> List[ExtractedItem]:
-    """智能分段处理大文档"""
-    all_items = []
-    
-    # 计算最优分段大小和重叠度
-    text_length = len(documents_text)
-    if text_length <= 50000:
-        segment_size = 15000
-        overlap = 1000
-    else:
-        segment_size = 20000
-        overlap = 1500
-    
-    # 分段处理
-    start_pos = 0
-    segment_index = 0
-    
-    while start_pos < text_length:
-        end_pos = min(start_pos + segment_size, text_length)
-        
-        # 提取段落，确保在合适的位置切分（避免切断句子）
-        segment_text = documents_text[start_pos:end_pos]
-        
-        # 如果不是最后一段，尝试在句子边界切分
-        if end_pos < text_length:
-            # 寻找最后一个句号作为切分点
-            last_period = segment_text.rfind('。')
-            if last_period > len(segment_text) * 0.8:  # 如果在段落的后20%找到句号
-                segment_text = segment_text[:last_period + 1]
-                end_pos = start_pos + len(segment_text)
-        
-        print(f"处理文档段落 {segment_index + 1}: {start_pos}-{end_pos} ({len(segment_text)}字符)")
-        
-        # 处理该段落
-        segment_items = _process_semantic_segment(segment_text, keywords, client, model)
-        all_items.extend(segment_items)
-        
-        # 移动到下一段落
-        start_pos = end_pos - overlap
-        segment_index += 1
-        
-        # 避免处理过多段落（防止API调用过多）
-        if segment_index >= 10:  # 最多处理10个段落
-            print(f"文档过长，已处理前10个段落，总计{len(all_items)}个知识点")
-            break
-    
-    return all_items
+def extract_semantic_segment(content: str, segments: List[Segment], document: Document, keywords: List[str],
+                             client: DeepSeekClient, model: str) -> List[ExtractedItem]:
+    """对检索到的片段调用一次 LLM 做语义理解；请求失败时抛出异常，供调度器退避重试"""
+    response = content_or_raise(client.complete(
+        messages=[{"role": "user", "content": _semantic_prompt(content, keywords)}], model=model, temperature=0.0))
+    result = safe_json_loads_any(response) if response else None
+    raw_items = result.get("items") if isinstance(result, dict) else None
+    if response and not isinstance(raw_items, list):
+        count_parse_failure(client, "semantic")
+    items = []
+    for item_data in raw_items if isinstance(raw_items, list) else []:
+        if not isinstance(item_data, dict):
+            continue
+        it = {
+            "type": item_data.get("type", "KeywordHit"),
+            "title": item_data.get("title"),
+            "text": item_data.get("content"),
+            "evidence": item_data.get("evidence"),
+            "docName": document.name,
+            "keywordsHit": item_data.get("semantic_matches", []),
+            "semantic_matches": item_data.get("semantic_matches", []),
+            "induction_quality": 0.7,  # 默认质量
+            "induction_notes": "语义理解抽取",
+        }
+        stamp_location(it, document, content, segments)
+        try:
+            items.append(ExtractedItem(**it))
+        except Exception:
+            continue
+    return items
 
 
 def parse_json_response(response: str) -> Dict[str, Any]:
@@ -1,19 +1,40 @@
 import os
-from typing import List
+import threading
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Deque, Dict, Iterator, List, Optional, Tuple
 import fitz  # PyMuPDF
 from docx import Document as DocxDocument
 
-from models.schemas import Document
+from models.schemas import Document, PageText
+from pipeline.utils.doc_store import DocumentStore
+from pipeline.utils.events import Emit, ProgressCounter
+from pipeline.utils.stage_cache import file_fingerprint
 
+# 解析逻辑（分页、拼接方式等）变化时递增，使旧的解析缓存失效
+PARSER_VERSION = "3"
 
-def _read_pdf(path: str) -> tuple[str, int]:
+SUPPORTED_EXTS = (".pdf", ".docx", ".txt")
+
+# 大文件按页段拆分给进程池，每个任务解析的页数
+PAGES_PER_TASK = 16
+
+
+def _read_pdf_pages(path: str, start: int, end: int) -> List[str]:
+    """解析 [start, end) 页（从 0 开始），供进程池调用，因此必须是模块级函数"""
+    doc = fitz.open(path)
+    try:
+        return [doc.load_page(i).get_text("text", sort=True) for i in range(start, min(end, doc.page_count))]
+    finally:
+        doc.close()
+
+
+def _pdf_page_count(path: str) -> int:
     doc = fitz.open(path)
-    pages = doc.page_count
-    texts = []
-    for i in range(pages):
-        page = doc.load_page(i)
-        texts.append(page.get_text("text"))
-    return "\n".join(texts), pages
+    try:
+        return doc.page_count
+    finally:
+        doc.close()
 
 
 def _read_docx(path: str) -> tuple[str, int]:
@@ -27,19 +48,172 @@ def _read_txt(path: str) -> tuple[str, int]:
         return f.read(), 0
 
 
-def load_files(file_paths: List[str]) -> List[Document]:
-    documents: List[Document] = []
-    for p in file_paths:
+def _read_whole(path: str) -> List[str]:
+    """无分页格式整篇读取，返回单元素列表，与 _read_pdf_pages 的返回形式一致"""
+    ext = os.path.splitext(path)[1].lower()
+    text, _ = _read_docx(path) if ext == ".docx" else _read_txt(path)
+    return [text]
+
+
+# 一个解析任务：(文件序号, 路径, 起始页, 结束页, 总页数)；无分页格式的起止页为 (0, 1)，总页数为 0
+_Task = Tuple[int, str, int, int, int]
+
+
+def _plan_tasks(file_paths: List[str], pages_per_task: int) -> Iterator[_Task]:
+    for idx, p in enumerate(file_paths):
         ext = os.path.splitext(p)[1].lower()
-        text = ""
-        pages = 0
+        if ext not in SUPPORTED_EXTS:
+            continue
         if ext == ".pdf":
-            text, pages = _read_pdf(p)
-        elif ext == ".docx":
-            text, pages = _read_docx(p)
-        elif ext == ".txt":
-            text, pages = _read_txt(p)
+            total = _pdf_page_count(p)
+            for start in range(0, total, pages_per_task):
+                yield idx, p, start, min(total, start + pages_per_task), total
         else:
-            continue
-        documents.append(Document(name=os.path.basename(p), path=p, text=text, pages=pages))
-    return documents
+            yield idx, p, 0, 1, 0
+
+
+def _run_task(task: _Task) -> List[str]:
+    _, path, start, end, _ = task
+    if os.path.splitext(path)[1].lower() == ".pdf":
+        return _read_pdf_pages(path, start, end)
+    return _read_whole(path)
+
+
+_POOLS: Dict[int, ProcessPoolExecutor] = {}
+_POOLS_LOCK = threading.Lock()
+
+
+def get_parse_pool(max_workers: int) -> ProcessPoolExecutor:
+    """
+    进程内共享的解析进程池（按进程数复用）：所有文件、所有运行的页段任务都提交到同一个池，
+    解析进程总数不超过 max_workers，也不会为每个文件或每次运行重新创建进程
+    """
+    with _POOLS_LOCK:
+        if max_workers not in _POOLS:
+            _POOLS[max_workers] = ProcessPoolExecutor(max_workers=max_workers)
+        return _POOLS[max_workers]
+
+
+def page_ranges(path: str, total: int, pages_per_task: int = PAGES_PER_TASK) -> List[Tuple[int, int]]:
+    """文件的解析任务划分：PDF 按页段 [start, end)，无分页格式整篇一个任务 (0, 1)"""
+    if os.path.splitext(path)[1].lower() != ".pdf":
+        return [(0, 1)]
+    return [(start, min(total, start + pages_per_task)) for start in range(0, total, pages_per_task)]
+
+
+def page_count(path: str) -> int:
+    """PDF 的页数；无分页格式为 0"""
+    return _pdf_page_count(path) if os.path.splitext(path)[1].lower() == ".pdf" else 0
+
+
+def parse_pages(path: str, start: int, end: int, max_workers: int = 1) -> List[str]:
+    """解析一个页段，返回各页文本；max_workers > 1 时在共享进程池中执行"""
+    task = (0, path, start, end, 0)
+    if max_workers <= 1:
+        return _run_task(task)
+    return get_parse_pool(max_workers).submit(_run_task, task).result()
+
+
+def _iter_task_results(file_paths: List[str], max_workers: int, pages_per_task: int) -> Iterator[Tuple[_Task, List[str]]]:
+    """按任务顺序产出 (任务, 各页文本)；并行时提交到共享进程池，同时在途的任务数不超过 2 * max_workers"""
+    tasks = _plan_tasks(file_paths, pages_per_task)
+    if max_workers <= 1:
+        for task in tasks:
+            yield task, _run_task(task)
+        return
+
+    window = 2 * max_workers
+    pool = get_parse_pool(max_workers)
+    pending: Deque[Tuple[_Task, Future]] = deque()
+    try:
+        for task in tasks:
+            pending.append((task, pool.submit(_run_task, task)))
+            if len(pending) >= window:
+                done_task, fut = pending.popleft()
+                yield done_task, fut.result()
+        while pending:
+            done_task, fut = pending.popleft()
+            yield done_task, fut.result()
+    finally:
+        # 提前结束时撤回尚未开始的任务，不再为已放弃的流占用共享池
+        for _, fut in pending:
+            fut.cancel()
+
+
+def iter_pages(file_paths: List[str], max_workers: int = 1, pages_per_task: int = PAGES_PER_TASK) -> Iterator[PageText]:
+    """
+    流式逐页解析文档，按（文件顺序，页码顺序）产出 PageText
+
+    max_workers > 1 时多个文件以及大文件的不同页段在共享进程池中并行解析；同时在途的页段有上限，
+    即使是数百页的案例汇编，内存中也只保留少量页面。下游可以边解析边分块（iter_page_chunks），无需等待最后一页。
+    """
+    for (_, path, start, _, total), texts in _iter_task_results(file_paths, max_workers, pages_per_task):
+        for offset, text in enumerate(texts):
+            yield PageText(docName=os.path.basename(path), path=path, page=start + offset + 1, text=text, totalPages=total)
+
+
+def _page_offsets(page_texts: List[str]) -> List[int]:
+    """各页在以换行拼接后的全文中的起始偏移"""
+    offsets: List[int] = []
+    pos = 0
+    for text in page_texts:
+        offsets.append(pos)
+        pos += len(text) + 1
+    return offsets
+
+
+def build_document(path: str, page_texts: List[str], pages: int) -> Document:
+    """由各页文本组装文档：页间以换行拼接，并记录每页的起始偏移（无分页格式为空）"""
+    return Document(name=os.path.basename(path), path=path, text="\n".join(page_texts), pages=pages,
+                    page_offsets=_page_offsets(page_texts) if pages else [])
+
+
+def iter_documents(file_paths: List[str], max_workers: int = 1, store: Optional[DocumentStore] = None,
+                   emit: Optional[Emit] = None) -> Iterator[Document]:
+    """
+    按文件顺序逐篇产出 Document；max_workers > 1 时由共享进程池按页段并行解析
+
+    每篇文档的最后一个页段解析完即产出，内存中只保留正在拼接的文档与在途的少量页段。
+    提供 store 时按文件内容哈希查找已解析的结果，命中的文件不再解析，新解析的结果写回 store。
+    提供 emit 时每产出一篇文档发出一条进度事件与一条 document 事件。
+    """
+    paths = [p for p in file_paths if os.path.splitext(p)[1].lower() in SUPPORTED_EXTS]
+    cached: Dict[int, Tuple[str, List[int], int]] = {}
+    digests: Dict[int, str] = {}
+    if store is not None:
+        for idx, p in enumerate(paths):
+            digests[idx] = file_fingerprint(p)
+            hit = store.get(digests[idx], PARSER_VERSION)
+            if hit is not None:
+                cached[idx] = hit
+    to_parse = [p for idx, p in enumerate(paths) if idx not in cached]
+    results = _iter_task_results(to_parse, max_workers, PAGES_PER_TASK)
+    pending: Optional[Tuple[_Task, List[str]]] = next(results, None)
+    progress = ProgressCounter(emit, "documents", len(paths))
+    sub_idx = 0
+    for idx, p in enumerate(paths):
+        if idx in cached:
+            text, offsets, pages = cached[idx]
+            doc = Document(name=os.path.basename(p), path=p, text=text, pages=pages, page_offsets=offsets)
+        else:
+            page_texts: List[str] = []
+            pages = 0
+            # 零页的 PDF 没有解析任务，结果流中直接是下一个文件
+            while pending is not None and pending[0][0] == sub_idx:
+                page_texts.extend(pending[1])
+                pages = pending[0][4]
+                pending = next(results, None)
+            sub_idx += 1
+            doc = build_document(p, page_texts, pages)
+            if store is not None:
+                store.put(digests[idx], PARSER_VERSION, doc.text, doc.page_offsets, doc.pages)
+        progress.step()
+        if emit is not None:
+            emit({"type": "document", "name": doc.name, "pages": doc.pages, "chars": len(doc.text)})
+        yield doc
+
+
+def load_files(file_paths: List[str], max_workers: int = 1, store: Optional[DocumentStore] = None,
+               emit: Optional[Emit] = None) -> List[Document]:
+    """解析全部文件为 Document，见 iter_documents"""
+    return list(iter_documents(file_paths, max_workers, store, emit))
@@ -1,19 +1,21 @@
-from typing import List
+from typing import Iterable, List
 from models.schemas import Document, ExtractedItem
+from pipeline.utils.chunking import ITEM_CHUNK_TOKENS, ITEM_OVERLAP_TOKENS, iter_chunks
 
 
-def chunk_documents_to_items(documents: List[Document], chunk_chars: int = 1000, overlap: int = 100) -> List[ExtractedItem]:
+def chunk_documents_to_items(documents: Iterable[Document], max_tokens: int = ITEM_CHUNK_TOKENS,
+                             overlap_tokens: int = ITEM_OVERLAP_TOKENS) -> List[ExtractedItem]:
     items: List[ExtractedItem] = []
     for doc in documents:
         text = doc.text or ""
-        n = len(text)
-        if n == 0:
+        if not text:
             continue
-        start = 0
-        while start < n:
-            end = min(n, start + chunk_chars)
-            chunk = text[start:end].strip()
+        for c in iter_chunks(text, max_tokens, overlap_tokens):
+            chunk = c.text.strip()
             if chunk:
+                # 去掉首尾空白后的真实区间，页码由文档页偏移二分得到
+                span_start = c.start + (len(c.text) - len(c.text.lstrip()))
+                span_end = span_start + len(chunk)
                 items.append(
                     ExtractedItem(
                         type="RawText",
@@ -21,11 +23,8 @@ def chunk_documents_to_items(documents: List[Document], chunk_chars: int = 1000,
                         docName=doc.name,
                         section=None,
                         articleNo=None,
+                        charSpan=[span_start, span_end],
+                        pageRange=doc.page_range(span_start, span_end),
                     )
                 )
-            if end == n:
-                break
-            start = end - overlap
-            if start < 0:
-                start = 0
     return items
@@ -1,15 +1,34 @@
 import re
-from typing import List
+from typing import List, Tuple
 from models.schemas import Document
 
+# 句末标点后跟空白处断句（与先压缩空白再切分等价）
+_SENTENCE_BREAK = re.compile(r"(?<=[。！？；])\s+")
 
-def normalize_and_segment(doc: Document) -> List[str]:
+
+def segment_with_spans(doc: Document) -> List[Tuple[str, int, int]]:
+    """
+    与 normalize_and_segment 相同的分句规则，额外返回每句在 doc.text 中的 [start, end)
+
+    Returns:
+        (规范化后的句子, start, end) 列表
+    """
     text = doc.text
-    # 去除多余空白与页码样式（简单启发式）
-    text = re.sub(r"\u00a0", " ", text)
-    text = re.sub(r"\s+", " ", text)
-    # 分句：中文标点 + 换行
-    sentences = re.split(r"(?<=[。！？；])\s+", text)
-    # 保留较长句子
-    sentences = [s.strip() for s in sentences if len(s.strip()) > 5]
-    return sentences
+    out: List[Tuple[str, int, int]] = []
+    start = 0
+    for m in list(_SENTENCE_BREAK.finditer(text)) + [None]:
+        end = m.start() if m else len(text)
+        raw = text[start:end]
+        # 去除多余空白与页码样式（简单启发式）
+        sentence = re.sub(r"\s+", " ", raw).strip()
+        # 保留较长句子
+        if len(sentence) > 5:
+            lead = len(raw) - len(raw.lstrip())
+            out.append((sentence, start + lead, start + len(raw.rstrip())))
+        if m:
+            start = m.end()
+    return out
+
+
+def normalize_and_segment(doc: Document) -> List[str]:
+    return [sentence for sentence, _, _ in segment_with_spans(doc)]
@@ -1,14 +1,65 @@
-from typing import List
+import time
+from typing import Dict, List
 from rapidfuzz import fuzz
 
 from models.schemas import Card
+from pipeline.utils.dedup_index import DedupIndex, gram_document_frequency
+
+
+def _passes_quality(card: Card, min_quality: float) -> bool:
+    return (card.quality or 0.0) >= min_quality and bool(card.Question) and bool(card.Answer)
 
 
 def quality_gate(cards: List[Card], min_quality: float) -> List[Card]:
-    return [c for c in cards if (c.quality or 0.0) >= min_quality and c.Question and c.Answer]
+    return [c for c in cards if _passes_quality(c, min_quality)]
 
 
 def deduplicate_cards(cards: List[Card], threshold: float) -> List[Card]:
+    """
+    按顺序去重：与任一已保留卡片的问题或答案 token_set_ratio ≥ threshold 即丢弃
+
+    通过 DedupIndex 只对候选卡片做精确比较，结果与逐对比较完全一致，复杂度接近线性。
+    """
+    index = DedupIndex(
+        threshold,
+        question_order=gram_document_frequency((c.Question for c in cards), threshold),
+        answer_order=gram_document_frequency((c.Answer for c in cards), threshold),
+    )
+    return [c for c in cards if index.check_and_add(c.Question, c.Answer)]
+
+
+class CardFilter:
+    """
+    质量过滤与去重的流式版本：卡片按顺序逐张 accept，保留的卡片与 quality_gate 后再 deduplicate_cards 完全一致
+
+    卡片尚未全部生成，无法预先统计全局元素频次，索引退化为固定的伪随机顺序，结果不变，只是候选稍多。
+    """
+
+    def __init__(self, min_quality: float, threshold: float) -> None:
+        self.min_quality = min_quality
+        self.index = DedupIndex(threshold)
+        self.counts = {"cards": 0, "passed_quality": 0, "kept": 0}
+        # 两个阶段各自累计的耗时（毫秒），写入运行指标
+        self.ms: Dict[str, float] = {"quality": 0.0, "dedup": 0.0}
+
+    def accept(self, card: Card) -> bool:
+        """返回 True 表示保留"""
+        self.counts["cards"] += 1
+        started = time.perf_counter()
+        passed = _passes_quality(card, self.min_quality)
+        checked = time.perf_counter()
+        self.ms["quality"] += (checked - started) * 1000
+        if not passed:
+            return False
+        self.counts["passed_quality"] += 1
+        kept = self.index.check_and_add(card.Question, card.Answer)
+        self.ms["dedup"] += (time.perf_counter() - checked) * 1000
+        self.counts["kept"] += int(kept)
+        return kept
+
+
+def deduplicate_cards_bruteforce(cards: List[Card], threshold: float) -> List[Card]:
+    """逐对比较的参考实现（O(n²)），用于基准测试与结果校验"""
     kept: List[Card] = []
     for c in cards:
         is_dup = False
@@ -0,0 +1,204 @@
+"""
+法条文档的本地结构化解析
+
+法律、行政法规、司法解释等文本有固定的 第X编 / 第X章 / 第X节 / 第X条 结构，逐行扫描的状态机即可切出每一条，
+直接得到 Statute 条目（条号、所属章节、原文区间与页码），不必调用 LLM。
+只有切出的条文覆盖了文档大部分内容时才认定为法条文档；案例、讲义等不规整的材料仍交给模型抽取。
+"""
+
+import os
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+from models.schemas import Document, ExtractedItem
+from pipeline.utils.retrieval import AhoCorasick
+from pipeline.utils.semantic_index import SemanticIndex
+
+_NUM = r"[零〇一二三四五六七八九十百千两\d]+"
+# 行首的结构标题，编号后须有空白或行尾，避免把折行到行首的“第十四条规定……”之类的引用当成标题
+_HEADING = re.compile(rf"^[\s　]*(第{_NUM}(编|分编|章|节))(?:[\s　]+(.*))?$")
+_ARTICLE = re.compile(rf"^[\s　]*(第({_NUM})条(?:之({_NUM}))?)(?:[\s　]+(.*))?$")
+# 条文之后的注释、附件等，遇到即结束当前条文
+_TRAILER = re.compile(r"^[\s　]*(?:[*＊]\s*注[:：]|附[件表录][:：\s　]|©)")
+# 条文中新段落的开头：全角缩进或款项序号
+_PARAGRAPH = re.compile(r"^\s*(?:　|（[一二三四五六七八九十]+）)")
+_LAW_TITLE = re.compile(r"^[\s　]*(\S{2,40}?(?:法|条例|规定|办法|解释|决定|规则|细则))[\s　]*$")
+
+_LEVELS = ("编", "分编", "章", "节")
+_DIGITS = {"零": 0, "〇": 0, "一": 1, "二": 2, "两": 2, "三": 3, "四": 4, "五": 5, "六": 6, "七": 7, "八": 8, "九": 9}
+_UNITS = {"十": 10, "百": 100, "千": 1000}
+
+# 认定为法条文档的条件：至少这么多条，且条文覆盖的非空白字符比例不低于该值
+MIN_ARTICLES = 3
+MIN_COVERAGE = 0.5
+# 关键词没有出现在任何条文中时，按语义检索补上的条文数
+STATUTE_TOP_K = 10
+
+
+def chinese_number(text: str) -> int:
+    """把“一百二十三”“二十”“十”或阿拉伯数字转换为整数"""
+    if text.isdigit():
+        return int(text)
+    total, digit = 0, 0
+    for ch in text:
+        if ch in _DIGITS:
+            digit = _DIGITS[ch]
+        elif ch in _UNITS:
+            total += (digit or 1) * _UNITS[ch]
+            digit = 0
+    return total + digit
+
+
+def _lines(text: str) -> List[Tuple[int, str]]:
+    """(行首偏移, 行文本)"""
+    out: List[Tuple[int, str]] = []
+    pos = 0
+    for line in text.split("\n"):
+        out.append((pos, line))
+        pos += len(line) + 1
+    return out
+
+
+def _boilerplate(lines: Sequence[Tuple[int, str]], pages: int) -> set:
+    """在多页中重复出现的页眉页脚（数字视为相同），不计入条文正文"""
+    def key(line: str) -> str:
+        return re.sub(r"\d+", "#", line.strip())
+
+    counts = Counter(key(line) for _, line in lines if line.strip())
+    threshold = max(3, pages // 2)
+    return {k for k, n in counts.items() if n >= threshold}
+
+
+def _law_name(doc: Document, lines: Sequence[Tuple[int, str]], first_heading: int) -> str:
+    """文档开头（第一个结构标题之前）独占一行的法规名称，找不到时取文件名中括号前的部分"""
+    for _, line in lines[:first_heading]:
+        m = _LAW_TITLE.match(line)
+        if m:
+            return m.group(1)
+    stem = os.path.splitext(doc.name)[0]
+    return re.split(r"[(（]", stem, maxsplit=1)[0].strip() or stem
+
+
+class _Article:
+    def __init__(self, number: str, order: Tuple[int, int], start: int, path: List[str]) -> None:
+        self.number = number
+        self.order = order
+        self.start = start
+        self.end = start
+        self.path = path
+        self.paragraphs: List[str] = []
+
+    def add_line(self, line: str, end: int, body: Optional[str] = None) -> None:
+        content = (line if body is None else body).strip().strip("　")
+        if not content:
+            return
+        if body is not None or not self.paragraphs or _PARAGRAPH.match(line):
+            self.paragraphs.append(content)
+        else:
+            # PDF 的折行：同一段落的下一行直接接上
+            self.paragraphs[-1] += content
+        self.end = end
+
+
+def parse_statute(doc: Document) -> List[ExtractedItem]:
+    """
+    逐行扫描文档，切出每一条为一个 Statute 条目；文档不像法条（条数太少或覆盖率太低）时返回空列表
+
+    条号须递增（“第十条之一”排在第十条之后），正文中恰好折行到行首、后接空白的条文引用不会被误认为新条文。
+    """
+    text = doc.text or ""
+    lines = _lines(text)
+    noise = _boilerplate(lines, doc.pages)
+    headings: Dict[str, str] = {}
+    articles: List[_Article] = []
+    current: Optional[_Article] = None
+    first_heading = len(lines)
+
+    for idx, (offset, line) in enumerate(lines):
+        end = offset + len(line.rstrip())
+        m = _HEADING.match(line)
+        if m:
+            first_heading = min(first_heading, idx)
+            level = m.group(2)
+            title = re.sub(r"[\s　]+", "", m.group(3) or "")
+            headings[level] = f"{m.group(1)} {title}".strip()
+            # 上级标题变化时清空其下各级
+            for lower in _LEVELS[_LEVELS.index(level) + 1:]:
+                headings.pop(lower, None)
+            current = None
+            continue
+        m = _ARTICLE.match(line)
+        if m:
+            order = (chinese_number(m.group(2)), chinese_number(m.group(3)) if m.group(3) else 0)
+            if not articles or order > articles[-1].order:
+                first_heading = min(first_heading, idx)
+                current = _Article(m.group(1), order, offset + len(line) - len(line.lstrip()),
+                                   [headings[k] for k in _LEVELS if k in headings])
+                current.add_line(line, end, body=m.group(4) or "")
+                current.end = end
+                articles.append(current)
+                continue
+        if current is None:
+            continue
+        if _TRAILER.match(line):
+            current = None
+            continue
+        if re.sub(r"\d+", "#", line.strip()) in noise:
+            continue
+        current.add_line(line, end)
+
+    if len(articles) < MIN_ARTICLES:
+        return []
+    covered = sum(len("".join(a.paragraphs)) for a in articles)
+    if covered < MIN_COVERAGE * len("".join(text.split())):
+        return []
+
+    law = _law_name(doc, lines, first_heading)
+    items: List[ExtractedItem] = []
+    for a in articles:
+        body = "\n".join(a.paragraphs)
+        content = f"{a.number} {body}".strip()
+        items.append(ExtractedItem(
+            type="Statute",
+            title=f"{law} {a.number}",
+            articleNo=a.number,
+            source=law,
+            section=" / ".join(a.path) or None,
+            text=content,
+            evidence=content,
+            charSpan=[a.start, a.end],
+            pageRange=doc.page_range(a.start, a.end),
+            docName=doc.name,
+        ))
+    return items
+
+
+def statute_items(doc: Document, keywords: Sequence[str], top_k: int = STATUTE_TOP_K) -> Optional[List[ExtractedItem]]:
+    """
+    法条文档返回与关键词相关的条文（按原文顺序），并填上 keywordsHit；不是法条文档时返回 None，由调用方交给模型抽取
+
+    条文或所属章节标题包含关键词的直接入选；没有任何条文包含的关键词（如“反不当竞争”之于“不正当竞争”）
+    改用本地语义索引（pipeline/utils/semantic_index.py）检索最相关的 top_k 条。
+    所有关键词都检索不到相关条文时同样返回 None，交给模型按语义抽取，而不是返回空列表。
+    """
+    items = parse_statute(doc)
+    if not items:
+        return None
+    if not keywords:
+        return items
+    matcher = AhoCorasick(keywords)
+    hits: List[Set[str]] = [set(matcher.count(item.text or "")) | set(matcher.count(item.section or ""))
+                            for item in items]
+    unmatched = [k for k in keywords if not any(k in h for h in hits)]
+    if unmatched:
+        index = SemanticIndex([f"{item.section or ''} {item.text or ''}" for item in items])
+        for k in unmatched:
+            for i, _ in index.search([k], top_k=top_k):
+                hits[i].add(k)
+    out: List[ExtractedItem] = []
+    for item, h in zip(items, hits):
+        if h:
+            item.keywordsHit = [k for k in keywords if k in h]
+            out.append(item)
+    return out or None
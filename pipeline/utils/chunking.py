@@ -0,0 +1,194 @@
+"""
+按 token 预算分块的通用引擎
+
+extract、items_from_text 与 induction 共用：按模型的 token 预算把块尽量填满，
+优先在标题（第X编/章/节）、条文（第X条）、句末标点处切分，其次是换行，最后才硬切。
+以生成器形式提供，可直接消费逐页解析的流（iter_page_chunks），无需等全文读完。
+"""
+
+import re
+from bisect import bisect_right
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from llm.tokens import char_tokens, estimate_tokens
+from models.schemas import PageText
+
+# 每个模型单次抽取请求中原文部分的 token 预算；R1 的输出包含推理过程，给原文留得少一些
+MODEL_CHUNK_TOKENS = {
+    "DeepSeek-V3": 8000,
+    "DeepSeek-R1": 6000,
+}
+DEFAULT_CHUNK_TOKENS = 6000
+DEFAULT_OVERLAP_TOKENS = 200
+
+# 无关键词时每个原文条目的 token 预算，制卡提示词按同一预算截取内容，避免条目被截断
+ITEM_CHUNK_TOKENS = 600
+ITEM_OVERLAP_TOKENS = 60
+
+_NUM = r"[零一二三四五六七八九十百千万\d]+"
+# 切分点优先级从高到低；标题/条文在行首才算，切在该行之前
+_HEADING = re.compile(rf"\n[ \t　]*(?:第{_NUM}[编章节]|[一二三四五六七八九十]+、)")
+_ARTICLE = re.compile(rf"\n[ \t　]*第{_NUM}条")
+_SENTENCE = re.compile(r"[。！？；!?;]")
+_NEWLINE = re.compile(r"\n")
+
+# 切分点至少落在块的这个比例之后，保证块足够满
+_MIN_FILL = 0.6
+
+
+# 拼接分块中的一个原文片段：(片段在分块中的起点, 在原文中的起点, 在原文中的终点)
+Segment = Tuple[int, int, int]
+# 拼接不相邻片段时使用的分隔符
+SEGMENT_SEPARATOR = "\n……\n"
+
+
+class TextChunk(NamedTuple):
+    text: str
+    start: int  # 在全文中的起始偏移
+    end: int
+
+
+def chunk_token_budget(model: Optional[str] = None, override: int = 0) -> int:
+    """override > 0 时优先使用，否则取模型对应的预算"""
+    if override > 0:
+        return override
+    return MODEL_CHUNK_TOKENS.get(model or "", DEFAULT_CHUNK_TOKENS)
+
+
+def _hard_end(buf: str, max_tokens: int) -> int:
+    """不超过预算的最长前缀长度（至少 1 个字符，保证前进）"""
+    used = 0.0
+    for i, ch in enumerate(buf):
+        used += char_tokens(ch)
+        if used > max_tokens:
+            return max(1, i)
+    return len(buf)
+
+
+def _last_match(pattern: "re.Pattern", buf: str, lo: int, hi: int, after: bool) -> Optional[int]:
+    pos = None
+    for m in pattern.finditer(buf, lo, hi):
+        pos = m.end() if after else m.start() + 1
+    return pos if pos is not None and lo < pos <= hi else None
+
+
+def _choose_end(buf: str, hard_end: int) -> int:
+    lo = int(hard_end * _MIN_FILL)
+    for pattern, after in ((_HEADING, False), (_ARTICLE, False), (_SENTENCE, True), (_NEWLINE, True)):
+        pos = _last_match(pattern, buf, lo, hard_end, after)
+        if pos is not None:
+            return pos
+    return hard_end
+
+
+def _overlap_start(buf: str, end: int, overlap_tokens: int) -> int:
+    """下一块的起点：从 end 往回约 overlap_tokens，再对齐到其后的第一个句末"""
+    if overlap_tokens <= 0:
+        return end
+    used = 0.0
+    pos = end
+    while pos > 0 and used < overlap_tokens:
+        pos -= 1
+        used += char_tokens(buf[pos])
+    m = _SENTENCE.search(buf, pos, end)
+    if m and m.end() < end:
+        pos = m.end()
+    return pos if pos > 0 else end
+
+
+def _next_cut(buf: str, max_tokens: int, overlap_tokens: int, final: bool) -> Optional[Tuple[int, int]]:
+    """返回 (本块结束位置, 下一块起始位置)；缓冲区不足一块且流未结束时返回 None"""
+    hard_end = _hard_end(buf, max_tokens)
+    if hard_end >= len(buf):
+        return (len(buf), len(buf)) if final else None
+    end = _choose_end(buf, hard_end)
+    return end, _overlap_start(buf, end, overlap_tokens)
+
+
+def iter_text_chunks(pieces: Iterable[str], max_tokens: int, overlap_tokens: int = 0) -> Iterator[TextChunk]:
+    """
+    流式分块：pieces 依次拼接成全文，每攒够一块就立即产出
+
+    Args:
+        pieces: 文本片段流（如逐页文本）
+        max_tokens: 每块的 token 上限
+        overlap_tokens: 相邻块的重叠 token 数
+    """
+    buf = ""
+    buf_start = 0
+    for piece in pieces:
+        buf += piece
+        while True:
+            cut = _next_cut(buf, max_tokens, overlap_tokens, final=False)
+            if cut is None:
+                break
+            end, next_start = cut
+            yield TextChunk(buf[:end], buf_start, buf_start + end)
+            buf = buf[next_start:]
+            buf_start += next_start
+    while buf:
+        end, next_start = _next_cut(buf, max_tokens, overlap_tokens, final=True)
+        yield TextChunk(buf[:end], buf_start, buf_start + end)
+        if end >= len(buf):
+            break
+        buf = buf[next_start:]
+        buf_start += next_start
+
+
+def iter_chunks(text: str, max_tokens: int, overlap_tokens: int = 0) -> Iterator[TextChunk]:
+    """对整段文本分块"""
+    return iter_text_chunks([text], max_tokens, overlap_tokens)
+
+
+def iter_page_chunks(pages: Iterable[PageText], max_tokens: int, overlap_tokens: int = 0) -> Iterator[TextChunk]:
+    """
+    对同一文档的逐页流分块；页间以换行拼接，偏移与 build_document 得到的 Document.text 一致
+    """
+    def pieces() -> Iterator[str]:
+        for i, page in enumerate(pages):
+            yield page.text if i == 0 else "\n" + page.text
+    return iter_text_chunks(pieces(), max_tokens, overlap_tokens)
+
+
+def chunk_text(text: str, max_tokens: int, overlap_tokens: int = 0) -> List[TextChunk]:
+    return list(iter_chunks(text, max_tokens, overlap_tokens))
+
+
+def pack_spans(text: str, spans: List[Tuple[int, int]], max_tokens: int,
+               overlap_tokens: int = 0) -> List[Tuple[str, List[Segment]]]:
+    """
+    把原文中若干不相邻的区间按 token 预算拼成分块，片段间以 SEGMENT_SEPARATOR 分隔；
+    超出预算的单个区间先按预算切分。返回 (分块文本, 片段表)，片段表用于把分块内偏移映射回原文
+    """
+    pieces: List[Tuple[int, int]] = []
+    for start, end in spans:
+        for c in iter_chunks(text[start:end], max_tokens, overlap_tokens):
+            pieces.append((start + c.start, start + c.end))
+    packed: List[Tuple[str, List[Segment]]] = []
+    parts: List[str] = []
+    segments: List[Segment] = []
+    length = 0
+    used = 0
+    for start, end in pieces:
+        piece = text[start:end]
+        cost = estimate_tokens(piece)
+        if parts and used + cost > max_tokens:
+            packed.append(("".join(parts), segments))
+            parts, segments, length, used = [], [], 0, 0
+        if parts:
+            parts.append(SEGMENT_SEPARATOR)
+            length += len(SEGMENT_SEPARATOR)
+        segments.append((length, start, end))
+        parts.append(piece)
+        length += len(piece)
+        used += cost
+    if parts:
+        packed.append(("".join(parts), segments))
+    return packed
+
+
+def to_source_offset(segments: List[Segment], pos: int) -> int:
+    """分块内偏移 -> 原文偏移；落在分隔符上时取前一片段的末尾"""
+    k = max(0, bisect_right([s[0] for s in segments], pos) - 1)
+    local, start, end = segments[k]
+    return min(start + pos - local, end)
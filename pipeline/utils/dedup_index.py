@@ -0,0 +1,205 @@
+"""
+近线性的卡片去重索引
+
+原始做法把每张新卡与所有已保留卡片逐一计算 fuzz.token_set_ratio，复杂度 O(n²)。
+这里先用倒排索引生成候选，只对候选做精确的 token_set_ratio 计算：
+
+1. 词元索引：两段文本只要有一个相同的空白分隔词元，就一定是候选。
+2. 若没有共同词元，token_set_ratio 退化为两段“排序去重后的词元串” x、y 的
+   ratio = 2·LCS / (|x|+|y|)。达到阈值 t 需要 LCS ≥ t(|x|+|y|)/2，由此得到两个必要条件：
+   - 字符多重集重叠 ≥ t(|x|+|y|)/2；
+   - 字符二元组多重集重叠 ≥ 3·LCS - |x| - |y| - 1 ≥ (1.5t-1)(|x|+|y|) - 1
+     （每删除 x 的一个字符至多破坏 2 个二元组，每处插入至多破坏 1 个）。
+   t > 2/3 时用更稀疏、区分度更高的二元组，否则用单字。把元素按全局稀有度排序后做
+   前缀过滤（prefix filtering）：满足阈值的两条记录，其前缀必然相交；再用首次相交
+   位置给出的重叠上界（positional filter）剔除不可能达标的候选。
+3. 过短、前缀过滤不适用的记录按长度分桶，只与长度相容的记录比较。
+
+所有过滤条件都是必要条件，不会漏掉任何达到阈值的卡片，因此保留下来的卡片集合与
+逐对比较完全一致。
+"""
+
+import math
+import re
+import zlib
+from collections import Counter
+from typing import Dict, Iterable, List, Mapping, Optional, Set, Tuple
+
+from rapidfuzz import fuzz
+
+# 浮点误差余量：宁可多给候选，也不能漏
+_EPS = 1e-9
+
+# rapidfuzz 切分词元用的空白字符取决于字符串的存储宽度：只含 Latin-1 字符的串不把 \x85 与不换行空格 \xa0
+# 当作分隔符，含更宽字符（如汉字）的串则与 str.split 相同
+_LATIN1_SEPARATORS = re.compile("[\t\n\x0b\x0c\r\x1c-\x1f ]+")
+
+# (空白分隔词元集合, 排序去重词元串长度, 按全局稀有度排序后的前缀元素；None 表示过短、不走前缀索引)
+_Record = Tuple[Set[str], int, Optional[List[Tuple[str, int]]]]
+
+
+def _canonical(text: str) -> Tuple[Set[str], str]:
+    """与 token_set_ratio 相同的切分方式：空白分隔、去重、排序后以空格连接"""
+    if text.isascii() or max(text) > "\xff":
+        tokens = set(text.split())
+    else:
+        tokens = set(_LATIN1_SEPARATORS.split(text))
+        tokens.discard("")
+    return tokens, " ".join(sorted(tokens))
+
+
+def _grams(canon: str, q: int) -> List[str]:
+    return [canon[i:i + q] for i in range(len(canon) - q + 1)]
+
+
+def gram_document_frequency(texts: Iterable[str], threshold: float) -> Counter:
+    """统计每个元素（单字或二元组）出现在多少条文本中，用作前缀索引的全局稀有度排序"""
+    q = _gram_size(threshold)
+    df: Counter = Counter()
+    for text in texts:
+        df.update(set(_grams(_canonical(text)[1], q)))
+    return df
+
+
+def _gram_size(threshold: float) -> int:
+    return 2 if 1.5 * threshold - 1.0 > 0.05 else 1
+
+
+class _FieldIndex:
+    """单个字段（Question 或 Answer）的候选索引"""
+
+    def __init__(self, threshold: float, gram_order: Optional[Mapping[str, int]] = None) -> None:
+        self.threshold = threshold
+        self._t = max(0.0, threshold - _EPS)
+        self.beta = self._t / (2.0 - self._t) if self._t < 2.0 else 1.0
+        self.q = _gram_size(threshold)
+        self.gram_order = gram_order
+        self.token_postings: Dict[str, List[int]] = {}
+        # 前缀元素 -> [(记录下标, 该元素在记录排序后的位置)]
+        self.prefix_postings: Dict[Tuple[str, int], List[Tuple[int, int]]] = {}
+        self.lengths: Dict[int, int] = {}
+        self.by_length: Dict[int, List[int]] = {}  # 所有记录按长度分桶
+        self.short_by_length: Dict[int, List[int]] = {}  # 过短记录按长度分桶
+
+    def _need(self, la: int, lb: int) -> float:
+        """长度为 la、lb 的两条记录要达到阈值，所需的最少元素重叠数"""
+        if self.q == 1:
+            return self._t * (la + lb) / 2.0
+        return (1.5 * self._t - 1.0) * (la + lb) - 1.0
+
+    def _rank(self, gram: str) -> Tuple[int, str]:
+        if self.gram_order is not None:
+            return self.gram_order.get(gram, 0), gram
+        # 未提供全局频次时退化为固定的伪随机顺序，结果依旧精确，只是候选稍多
+        return zlib.crc32(gram.encode("utf-8")), gram
+
+    def _count(self, length: int) -> int:
+        """长度为 length 的串包含的元素（单字或二元组）个数"""
+        return max(0, length - self.q + 1)
+
+    def prepare(self, text: str) -> _Record:
+        tokens, canon = _canonical(text)
+        length = len(canon)
+        # 与最短的可行伙伴（长度 β·L）配对时所需的重叠，即该记录任何匹配都至少需要的重叠
+        alpha = math.ceil(self._need(length, math.ceil(self.beta * length - _EPS)) - _EPS)
+        if not tokens or alpha <= 0:
+            return tokens, length, None
+        counts = Counter(_grams(canon, self.q))
+        elems = [(g, k) for g in sorted(counts, key=self._rank) for k in range(1, counts[g] + 1)]
+        return tokens, length, elems[:len(elems) - alpha + 1]
+
+    def _length_ok(self, la: int, lb: int) -> bool:
+        return 2.0 * min(la, lb) >= self._t * (la + lb)
+
+    def _scan_lengths(self, buckets: Dict[int, List[int]], length: int, found: Set[int]) -> None:
+        lo = math.floor(self.beta * length)
+        hi = math.ceil(length / self.beta) if self.beta > 0 else max(buckets, default=0)
+        for other_len in range(max(0, lo), hi + 1):
+            for idx in buckets.get(other_len, ()):
+                if self._length_ok(length, other_len):
+                    found.add(idx)
+
+    def candidates(self, record: _Record) -> Set[int]:
+        tokens, length, prefix = record
+        if not tokens:
+            return set()
+        found: Set[int] = set()
+        for tok in tokens:
+            found.update(self.token_postings.get(tok, ()))
+        if prefix is None:
+            # 过短的记录：与所有长度相容的记录比较（此类记录很少，长度范围也窄）
+            self._scan_lengths(self.by_length, length, found)
+            return found
+        self._scan_lengths(self.short_by_length, length, found)
+        seen: Set[int] = set()
+        count = self._count(length)
+        for i, elem in enumerate(prefix):
+            for idx, j in self.prefix_postings.get(elem, ()):
+                if idx in seen or idx in found:
+                    continue
+                seen.add(idx)
+                # 首次相遇于 (i, j)：两侧排在它之前的元素必然互不相交，重叠上界为两侧剩余元素数的较小者
+                other = self.lengths[idx]
+                bound = min(count - i, self._count(other) - j)
+                if self._length_ok(length, other) and bound >= self._need(length, other) - _EPS:
+                    found.add(idx)
+        return found
+
+    def add(self, idx: int, record: _Record) -> None:
+        tokens, length, prefix = record
+        if not tokens:
+            return
+        self.lengths[idx] = length
+        self.by_length.setdefault(length, []).append(idx)
+        for tok in tokens:
+            self.token_postings.setdefault(tok, []).append(idx)
+        if prefix is None:
+            self.short_by_length.setdefault(length, []).append(idx)
+            return
+        for j, elem in enumerate(prefix):
+            self.prefix_postings.setdefault(elem, []).append((idx, j))
+
+
+class DedupIndex:
+    """
+    增量去重索引：check_and_add 依次喂入 (Question, Answer)，
+    与已保留条目中任一条的问题或答案相似度 ≥ threshold 即判为重复，否则保留并入索引
+    """
+
+    def __init__(
+        self,
+        threshold: float,
+        question_order: Optional[Mapping[str, int]] = None,
+        answer_order: Optional[Mapping[str, int]] = None,
+    ) -> None:
+        self.threshold = threshold
+        self._questions = _FieldIndex(threshold, question_order)
+        self._answers = _FieldIndex(threshold, answer_order)
+        self._kept: List[Tuple[str, str]] = []
+        self.comparisons = 0
+
+    def _is_duplicate(self, question: str, answer: str, q_rec: _Record, a_rec: _Record) -> bool:
+        if self.threshold <= 0:
+            # 阈值 ≤ 0 时任意两条都算重复，候选剪枝不再成立
+            return bool(self._kept)
+        for idx in self._questions.candidates(q_rec):
+            self.comparisons += 1
+            if fuzz.token_set_ratio(question, self._kept[idx][0]) / 100.0 >= self.threshold:
+                return True
+        for idx in self._answers.candidates(a_rec):
+            self.comparisons += 1
+            if fuzz.token_set_ratio(answer, self._kept[idx][1]) / 100.0 >= self.threshold:
+                return True
+        return False
+
+    def check_and_add(self, question: str, answer: str) -> bool:
+        """返回 True 表示保留（非重复）"""
+        q_rec = self._questions.prepare(question)
+        a_rec = self._answers.prepare(answer)
+        if self._is_duplicate(question, answer, q_rec, a_rec):
+            return False
+        idx = len(self._kept)
+        self._kept.append((question, answer))
+        self._questions.add(idx, q_rec)
+        self._answers.add(idx, a_rec)
+        return True
@@ -0,0 +1,94 @@
+"""
+解析结果的持久化存储
+
+以“文件内容 SHA-256 + 解析器版本”为键，把抽取出的全文、每页起始偏移与页数存入本地 SQLite。
+重新上传已解析过的文件时直接读取，不再调用 PyMuPDF / python-docx。
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+DEFAULT_STORE_PATH = os.path.join("data", "cache", "documents.sqlite3")
+
+
+class DocumentStore:
+    def __init__(self, path: str = DEFAULT_STORE_PATH) -> None:
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            " sha256 TEXT NOT NULL,"
+            " parser_version TEXT NOT NULL,"
+            " text TEXT NOT NULL,"
+            " page_offsets TEXT NOT NULL,"
+            " pages INTEGER NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " PRIMARY KEY (sha256, parser_version))"
+        )
+        self._conn.commit()
+
+    def get(self, sha256: str, parser_version: str) -> Optional[Tuple[str, List[int], int]]:
+        """命中时返回 (全文, 每页起始偏移, 页数)"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT text, page_offsets, pages FROM documents WHERE sha256 = ? AND parser_version = ?",
+                (sha256, parser_version),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        text, offsets, pages = row
+        return text, json.loads(offsets), pages
+
+    def put(self, sha256: str, parser_version: str, text: str, page_offsets: List[int], pages: int) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO documents (sha256, parser_version, text, page_offsets, pages, size, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (sha256, parser_version, text, json.dumps(page_offsets), pages, len(text.encode("utf-8")), time.time()),
+            )
+            self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM documents")
+            self._conn.commit()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM documents").fetchone()
+            lookups = self.hits + self.misses
+            return {
+                "entries": count,
+                "bytes": total,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits / lookups) if lookups else 0.0,
+            }
+
+
+_STORES: Dict[str, DocumentStore] = {}
+_STORES_LOCK = threading.Lock()
+
+
+def get_document_store(path: str = DEFAULT_STORE_PATH) -> DocumentStore:
+    """按路径复用存储实例，使同一进程内多次运行共享连接与计数"""
+    key = os.path.abspath(path)
+    with _STORES_LOCK:
+        if key not in _STORES:
+            _STORES[key] = DocumentStore(path)
+        return _STORES[key]
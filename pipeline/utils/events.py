@@ -0,0 +1,55 @@
+"""
+管线运行事件
+
+各节点通过 emit 回调上报进度与中间结果（文档、知识点、卡片），由 run_pipeline 转发到
+LangGraph 的自定义流（stream_mode="custom"），界面据此逐步渲染，无需等待整条管线结束。
+"""
+
+import contextvars
+import threading
+from typing import Any, Callable, Dict, Optional
+
+Emit = Callable[[Dict[str, Any]], None]
+
+
+def make_emitter(writer: Callable[[Any], None]) -> Emit:
+    """
+    包装 LangGraph 的 stream writer
+
+    writer 只能在运行上下文中调用，而事件多由线程池中的工作线程产生，
+    因此在创建时复制上下文，每次转发都在该上下文中执行，并加锁保证事件不交错。
+    """
+    ctx = contextvars.copy_context()
+    lock = threading.Lock()
+
+    def emit(event: Dict[str, Any]) -> None:
+        with lock:
+            ctx.copy().run(writer, event)
+
+    return emit
+
+
+class ProgressCounter:
+    """线程安全的进度计数，每前进一步发出一条 progress 事件"""
+
+    def __init__(self, emit: Optional[Emit], stage: str, total: int) -> None:
+        self.emit = emit
+        self.stage = stage
+        self.total = total
+        self.done = 0
+        self._lock = threading.Lock()
+        if emit is not None:
+            emit({"type": "progress", "stage": stage, "done": 0, "total": total})
+
+    def step(self, n: int = 1) -> None:
+        if self.emit is None:
+            return
+        with self._lock:
+            self.done += n
+            done, total = self.done, self.total
+        self.emit({"type": "progress", "stage": self.stage, "done": done, "total": total})
+
+    def add_total(self, n: int) -> None:
+        """总数事先未知（上游仍在产出）时，随条目到达增加总数"""
+        with self._lock:
+            self.total += n
@@ -0,0 +1,155 @@
+"""
+LLM JSON 输出的增量解析
+
+模型输出形如 {"cards":[{...},{...}]} 或 {"items":[...]}。JsonElementStream 逐段接收流式输出，
+单次线性扫描跟踪字符串/转义状态与括号栈，目标数组中的某个元素一旦闭合就立即解析并产出，
+不必等整段响应结束。输出被截断时，recover_prefix 在最后一个完整元素之后补齐括号，恢复出合法的前缀
+（未写完的元素整体丢弃，不会出现缺字段的半个元素）。
+"""
+
+import json
+from typing import Any, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+# 默认关注的数组字段（results 为批量制卡的响应）
+DEFAULT_KEYS = ("items", "cards", "results")
+
+_CLOSERS = {"{": "}", "[": "]"}
+
+
+class JsonElementStream:
+    def __init__(self, keys: Sequence[str] = DEFAULT_KEYS, top_level_array: bool = True) -> None:
+        """
+        Args:
+            keys: 这些字段对应的数组中的元素会被逐个产出（任意嵌套层级）
+            top_level_array: 顶层直接是数组时，也逐个产出其元素
+        """
+        self.keys = set(keys)
+        self.top_level_array = top_level_array
+        self._text = ""
+        self._pos = 0
+        self._root: Optional[int] = None  # 第一个 { 或 [ 的位置，之前的说明文字、代码围栏一律忽略
+        self._end: Optional[int] = None  # 顶层值闭合后的位置
+        self._stack: List[str] = []
+        self._in_str = False
+        self._esc = False
+        self._str_start = 0
+        self._last_string: Optional[str] = None
+        self._pending_key: Optional[str] = None
+        self._targets: List[int] = []  # 目标数组所在的栈深度
+        self._elem_start: Optional[int] = None
+        self._cut: Optional[Tuple[int, str]] = None  # 最近的安全截断点：(位置, 需要补齐的括号)
+
+    @property
+    def done(self) -> bool:
+        return self._end is not None
+
+    def feed(self, fragment: str) -> List[Any]:
+        """追加一段输出，返回其中新闭合的目标数组元素"""
+        if not fragment or self.done:
+            return []
+        self._text += fragment
+        out: List[Any] = []
+        text = self._text
+        i = self._pos
+        n = len(text)
+        while i < n and self._end is None:
+            ch = text[i]
+            if self._in_str:
+                if self._esc:
+                    self._esc = False
+                elif ch == "\\":
+                    self._esc = True
+                elif ch == '"':
+                    self._in_str = False
+                    try:
+                        self._last_string = json.loads(text[self._str_start:i + 1])
+                    except ValueError:
+                        self._last_string = None
+            elif self._root is None:
+                if ch in "{[":
+                    self._root = i
+                    self._open(ch, i)
+            elif ch == '"':
+                self._in_str = True
+                self._str_start = i
+            elif ch in "{[":
+                self._open(ch, i)
+            elif ch in "}]":
+                element = self._close(i)
+                if element is not None:
+                    out.append(element)
+            elif ch == ":":
+                self._pending_key = self._last_string
+            elif ch == ",":
+                self._pending_key = None
+            i += 1
+        self._pos = i
+        return out
+
+    def _open(self, ch: str, i: int) -> None:
+        depth = len(self._stack)
+        if self._targets and self._targets[-1] == depth and self._elem_start is None:
+            self._elem_start = i
+        is_target = ch == "[" and (self._pending_key in self.keys or (depth == 0 and self.top_level_array))
+        self._stack.append(ch)
+        self._pending_key = None
+        if is_target and self._elem_start is None:
+            self._targets.append(len(self._stack))
+        if (ch == "[" or depth == 0) and self._elem_start is None:
+            self._mark_cut(i + 1)
+
+    def _close(self, i: int) -> Optional[Any]:
+        if not self._stack:
+            return None
+        self._stack.pop()
+        depth = len(self._stack)
+        element = None
+        if self._targets and self._targets[-1] == depth + 1:
+            # 目标数组本身闭合
+            self._targets.pop()
+        elif self._targets and self._targets[-1] == depth and self._elem_start is not None:
+            try:
+                element = json.loads(self._text[self._elem_start:i + 1])
+            except ValueError:
+                element = None
+            self._elem_start = None
+        if depth == 0:
+            self._end = i + 1
+        if self._elem_start is None:
+            self._mark_cut(i + 1)
+        return element
+
+    def _mark_cut(self, pos: int) -> None:
+        self._cut = (pos, "".join(_CLOSERS[c] for c in reversed(self._stack)))
+
+    def result(self) -> Optional[Any]:
+        """完整解析结果；输出不完整时返回按最后一个安全截断点补齐后的前缀"""
+        if self._root is None:
+            return None
+        if self._end is not None:
+            try:
+                return json.loads(self._text[self._root:self._end])
+            except ValueError:
+                return None
+        if self._cut is None:
+            return None
+        pos, suffix = self._cut
+        prefix = self._text[self._root:pos].rstrip().rstrip(",")
+        try:
+            return json.loads(prefix + suffix)
+        except ValueError:
+            return None
+
+
+def iter_json_elements(fragments: Iterable[str], keys: Sequence[str] = DEFAULT_KEYS) -> Iterator[Any]:
+    """消费流式输出片段，每闭合一个目标数组元素就立即产出"""
+    stream = JsonElementStream(keys)
+    for fragment in fragments:
+        yield from stream.feed(fragment)
+
+
+def recover_prefix(text: str, keys: Sequence[str] = DEFAULT_KEYS) -> Optional[Any]:
+    """从可能被截断的输出中恢复合法的 JSON 前缀"""
+    stream = JsonElementStream(keys)
+    stream.feed(text)
+    return stream.result()
@@ -2,6 +2,7 @@ import json
 import re
 from typing import Any, Optional
 
+from pipeline.utils.json_stream import recover_prefix
 
 CODE_FENCE_PATTERN = re.compile(r"```(?:json|jsonc|JSON)?\s*([\s\S]*?)```", re.IGNORECASE)
 
@@ -39,6 +40,13 @@ def _find_balanced(text: str, open_ch: str, close_ch: str) -> Optional[str]:
 def safe_json_loads_any(text: str) -> Optional[Any]:
     if not text:
         return None
+    # 0) 最常见的情况：整段就是 JSON
+    stripped = text.strip()
+    if stripped[:1] in ("{", "["):
+        try:
+            return json.loads(stripped)
+        except Exception:
+            pass
     # 1) fenced code block
     m = CODE_FENCE_PATTERN.search(text)
     if m:
@@ -73,4 +81,5 @@ def safe_json_loads_any(text: str) -> Optional[Any]:
             return json.loads(text)
         except Exception:
             pass
-    return None
+    # 5) 输出被截断（如达到 max_tokens）：保留已写完的元素
+    return recover_prefix(text)
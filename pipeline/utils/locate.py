@@ -0,0 +1,41 @@
+"""
+条目在原文中的本地定位
+
+按证据片段在分块中查找，再经片段表映射回文档偏移与页码，不依赖模型猜测，也不额外消耗 token。
+"""
+
+from typing import List, Optional, Tuple
+
+from models.schemas import Document
+from pipeline.utils.chunking import Segment, to_source_offset
+
+
+def locate(chunk: str, snippet: str) -> Optional[Tuple[int, int]]:
+    """在分块中定位证据片段，返回分块内的 [start, end)；找不到时退而匹配片段开头"""
+    snippet = (snippet or "").strip()
+    if not snippet:
+        return None
+    pos = chunk.find(snippet)
+    if pos >= 0:
+        return pos, pos + len(snippet)
+    head = snippet[:30]
+    if len(head) >= 8:
+        pos = chunk.find(head)
+        if pos >= 0:
+            return pos, min(len(chunk), pos + len(snippet))
+    return None
+
+
+def stamp_location(it: dict, doc: Document, chunk: str, segments: List[Segment]) -> None:
+    """
+    用本地定位覆盖条目的 charSpan/pageRange
+
+    证据片段能在分块中找到时取其精确区间，否则取整个分块的区间；页码由文档的页偏移二分得到。
+    """
+    local = locate(chunk, it.get("evidence") or it.get("text") or "")
+    if local is None:
+        local = (0, len(chunk))
+    start = to_source_offset(segments, local[0])
+    end = max(start, to_source_offset(segments, max(local[0], local[1] - 1)) + 1)
+    it["charSpan"] = [start, end]
+    it["pageRange"] = doc.page_range(start, end)
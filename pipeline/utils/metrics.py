@@ -0,0 +1,165 @@
+"""
+管线运行指标
+
+MetricsRecorder 记录一次运行中各阶段的耗时、每次 LLM 调用的耗时与 token 用量、缓存命中、
+解析失败与重试等计数，汇总为 PipelineOutput.metrics；指定 trace_path 时每条记录即时追加到 JSONL 文件，
+便于事后分析真实运行中的热点。
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+# 各模型每百万 token 的价格（元）：(输入, 输出)，命中本地缓存的调用不计费
+MODEL_PRICES = {
+    "DeepSeek-V3": (2.0, 8.0),
+    "DeepSeek-R1": (4.0, 16.0),
+}
+
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, max(0, round(q * (len(sorted_values) - 1))))
+    return sorted_values[idx]
+
+
+class MetricsRecorder:
+    def __init__(self, trace_path: Optional[str] = None, run_id: str = "") -> None:
+        self.run_id = run_id
+        self.trace_path = trace_path or None
+        self.started = time.perf_counter()
+        self.stages: List[Dict[str, Any]] = []
+        self.calls: List[Dict[str, Any]] = []
+        self.counters: Dict[str, int] = {}
+        self.extra: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self._trace = None
+        if self.trace_path:
+            if os.path.dirname(self.trace_path):
+                os.makedirs(os.path.dirname(self.trace_path), exist_ok=True)
+            self._trace = open(self.trace_path, "a", encoding="utf-8")
+
+    def _write(self, record: Dict[str, Any]) -> None:
+        """调用方已持有锁"""
+        if self._trace is not None:
+            self._trace.write(json.dumps({"run_id": self.run_id, "ts": time.time(), **record}, ensure_ascii=False) + "\n")
+            self._trace.flush()
+
+    @contextmanager
+    def span(self, name: str, **attrs: Any) -> Iterator[Dict[str, Any]]:
+        """计时一个阶段；yield 出的 dict 可在阶段内补充属性（如 count、cached）"""
+        record: Dict[str, Any] = dict(attrs)
+        started = time.perf_counter()
+        try:
+            yield record
+        finally:
+            self.record_span(name, (time.perf_counter() - started) * 1000, **record)
+
+    def record_span(self, name: str, ms: float, **attrs: Any) -> None:
+        """直接记录一个阶段的耗时，用于与其他阶段交错执行、无法用 span 包住的阶段"""
+        record = {"name": name, **attrs, "ms": round(ms, 1)}
+        with self._lock:
+            self.stages.append(record)
+            self._write({"event": "span", **record})
+
+    def record_call(self, model: str, latency_ms: float, prompt_tokens: int = 0, completion_tokens: int = 0,
+                    cached: bool = False, ok: bool = True, estimated: bool = False, stream: bool = False) -> None:
+        """记录一次 LLM 调用；estimated 表示 token 数为本地估算（流式响应不带用量）"""
+        record = {
+            "model": model,
+            "latency_ms": round(latency_ms, 1),
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "cached": cached,
+            "ok": ok,
+            "estimated": estimated,
+            "stream": stream,
+        }
+        with self._lock:
+            self.calls.append(record)
+            self._write({"event": "llm_call", **record})
+
+    def count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+            self._write({"event": "count", "name": name, "n": n})
+
+    def set(self, name: str, value: Any) -> None:
+        """附加的结构化信息（如调度器统计），原样放进汇总"""
+        with self._lock:
+            self.extra[name] = value
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            calls = list(self.calls)
+            stages = [dict(s) for s in self.stages]
+            counters = dict(self.counters)
+            extra = dict(self.extra)
+        by_model: Dict[str, Dict[str, Any]] = {}
+        for c in calls:
+            m = by_model.setdefault(c["model"], {"calls": 0, "cached": 0, "failures": 0, "prompt_tokens": 0,
+                                                 "completion_tokens": 0, "cost": 0.0})
+            m["calls"] += 1
+            m["cached"] += int(c["cached"])
+            m["failures"] += int(not c["ok"])
+            if not c["cached"]:
+                m["prompt_tokens"] += c["prompt_tokens"]
+                m["completion_tokens"] += c["completion_tokens"]
+        for model, m in by_model.items():
+            price_in, price_out = MODEL_PRICES.get(model, (0.0, 0.0))
+            m["cost"] = round((m["prompt_tokens"] * price_in + m["completion_tokens"] * price_out) / 1e6, 4)
+        latencies = sorted(c["latency_ms"] for c in calls if not c["cached"])
+        llm = {
+            "calls": len(calls),
+            "cached": sum(m["cached"] for m in by_model.values()),
+            "failures": sum(m["failures"] for m in by_model.values()),
+            "prompt_tokens": sum(m["prompt_tokens"] for m in by_model.values()),
+            "completion_tokens": sum(m["completion_tokens"] for m in by_model.values()),
+            "cost": round(sum(m["cost"] for m in by_model.values()), 4),
+            "latency_ms_total": round(sum(latencies), 1),
+            "latency_ms_p50": _percentile(latencies, 0.5),
+            "latency_ms_p95": _percentile(latencies, 0.95),
+            "by_model": by_model,
+        }
+        return {
+            "run_id": self.run_id,
+            "total_ms": round((time.perf_counter() - self.started) * 1000, 1),
+            "stages": stages,
+            "llm": llm,
+            "counters": counters,
+            **extra,
+        }
+
+    def close(self) -> Dict[str, Any]:
+        """写入汇总并关闭追踪文件，返回汇总"""
+        result = self.summary()
+        with self._lock:
+            self._write({"event": "summary", **result})
+            if self._trace is not None:
+                self._trace.close()
+                self._trace = None
+        return result
+
+
+def client_metrics(client: Any) -> Optional[MetricsRecorder]:
+    """客户端上挂载的本次运行的记录器（见 DeepSeekClient.with_metrics），没有时为 None"""
+    return getattr(client, "metrics", None)
+
+
+def count_parse_failure(client: Any, stage: str) -> None:
+    """模型输出无法解析为预期的 JSON 时计数"""
+    metrics = client_metrics(client)
+    if metrics is not None:
+        metrics.count(f"parse_failures.{stage}")
+
+
+def record_counts(client: Any, stage: str, counts: Dict[str, int]) -> None:
+    """把阶段内的计数（请求次数、条目数等）以 “阶段.名称” 记入客户端所属运行的计数器"""
+    metrics = client_metrics(client)
+    if metrics is not None:
+        for name, n in counts.items():
+            metrics.count(f"{stage}.{name}", n)
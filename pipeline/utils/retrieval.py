@@ -0,0 +1,131 @@
+"""
+调用 LLM 之前的本地检索预筛
+
+把文档切成小段落，用 Aho-Corasick 一次扫描找出所有关键词的精确命中，
+再用字符二元组上的 BM25 给段落打分，只把命中段落、得分靠前的段落及其相邻段落交给模型抽取。
+关键词很窄时，绝大多数与之无关的原文不再消耗 token。
+"""
+
+import math
+from collections import Counter, deque
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+# 检索粒度：每个段落的 token 预算
+PASSAGE_TOKENS = 400
+
+
+class AhoCorasick:
+    """多模式串匹配：一次线性扫描找出文本中所有关键词的出现位置"""
+
+    def __init__(self, patterns: Iterable[str]) -> None:
+        self.patterns = sorted({p for p in patterns if p})
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[str]] = [[]]
+        for pattern in self.patterns:
+            node = 0
+            for ch in pattern:
+                nxt = self._goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                node = nxt
+            self._out[node].append(pattern)
+        # 按层次构造失配指针，并把后缀节点的输出合并进来
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[nxt] = self._goto[f].get(ch, 0)
+                self._out[nxt].extend(self._out[self._fail[nxt]])
+
+    def finditer(self, text: str) -> Iterator[Tuple[int, str]]:
+        """产出 (结束位置, 关键词)，结束位置为关键词最后一个字符之后的偏移"""
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(ch, 0)
+            for pattern in self._out[node]:
+                yield i + 1, pattern
+
+    def count(self, text: str) -> Counter:
+        return Counter(pattern for _, pattern in self.finditer(text))
+
+
+def char_ngrams(text: str, n: int = 2) -> List[str]:
+    """去掉空白后的字符 n 元组，中文无需分词"""
+    compact = "".join(text.split())
+    return [compact[i:i + n] for i in range(len(compact) - n + 1)]
+
+
+class BM25Index:
+    """字符二元组上的 BM25 索引"""
+
+    def __init__(self, passages: Sequence[str], k1: float = 1.5, b: float = 0.75, n: int = 2) -> None:
+        self.k1 = k1
+        self.b = b
+        self.n = n
+        self._tfs: List[Counter] = [Counter(char_ngrams(p, n)) for p in passages]
+        self._lens = [sum(tf.values()) for tf in self._tfs]
+        self._avg_len = (sum(self._lens) / len(self._lens)) if self._lens else 0.0
+        df: Counter = Counter()
+        for tf in self._tfs:
+            df.update(tf.keys())
+        total = len(self._tfs)
+        self._idf = {term: math.log(1.0 + (total - d + 0.5) / (d + 0.5)) for term, d in df.items()}
+
+    def query_terms(self, keywords: Iterable[str]) -> List[str]:
+        terms: List[str] = []
+        for kw in keywords:
+            terms.extend(char_ngrams(kw, self.n))
+        return terms
+
+    def scores(self, keywords: Iterable[str]) -> List[float]:
+        terms = Counter(self.query_terms(keywords))
+        out: List[float] = []
+        for tf, length in zip(self._tfs, self._lens):
+            norm = self.k1 * (1.0 - self.b + self.b * length / self._avg_len) if self._avg_len else self.k1
+            score = 0.0
+            for term, qtf in terms.items():
+                f = tf.get(term, 0)
+                if f:
+                    score += qtf * self._idf[term] * f * (self.k1 + 1.0) / (f + norm)
+            out.append(score)
+        return out
+
+
+def select_passages(passages: Sequence[str], keywords: Sequence[str], recall: float = 0.1,
+                    neighbours: int = 1, groups: Optional[Sequence[int]] = None) -> List[int]:
+    """
+    选出需要交给 LLM 的段落下标（升序）
+
+    Args:
+        passages: 所有文档的段落
+        keywords: 关键词
+        recall: 按 BM25 得分额外保留的段落比例（只计得分大于 0 的段落）；≥1 表示全部保留
+        neighbours: 每个入选段落前后各带上的相邻段落数，弥补被段落边界切开的上下文
+        groups: 每个段落所属的文档编号；相邻段落只在同一文档内扩展
+
+    精确命中关键词的段落总是入选。
+    """
+    if recall >= 1.0 or not keywords:
+        return list(range(len(passages)))
+    matcher = AhoCorasick(keywords)
+    chosen: Set[int] = {i for i, p in enumerate(passages) if next(matcher.finditer(p), None) is not None}
+    scores = BM25Index(passages).scores(keywords)
+    ranked = sorted((i for i, s in enumerate(scores) if s > 0), key=lambda i: (-scores[i], i))
+    chosen.update(ranked[:math.ceil(max(0.0, recall) * len(passages))])
+    with_context: Set[int] = set()
+    for i in chosen:
+        for j in range(max(0, i - neighbours), min(len(passages), i + neighbours + 1)):
+            if groups is None or groups[j] == groups[i]:
+                with_context.add(j)
+    return sorted(with_context)
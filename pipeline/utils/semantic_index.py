@@ -0,0 +1,139 @@
+"""
+本地语义检索索引
+
+对句子建立中文字符 n 元组的 TF-IDF 向量（L2 归一化），以 NumPy 数组存成按词项排列的倒排表，
+查询时只汇总查询词项的倒排，整个过程向量化完成。关键词扩展采用伪相关反馈（Rocchio）：
+取首轮得分最高的若干句子的质心并入查询，从而召回同义、近义表述的句子。
+"""
+
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+# 默认使用的字符 n 元组长度
+NGRAM_SIZES = (2, 3)
+
+
+def _ngrams(text: str, sizes: Sequence[int]) -> List[str]:
+    compact = "".join(text.split())
+    grams: List[str] = []
+    for n in sizes:
+        grams.extend(compact[i:i + n] for i in range(len(compact) - n + 1))
+    return grams
+
+
+class SemanticIndex:
+    def __init__(self, sentences: Sequence[str], ngram_sizes: Sequence[int] = NGRAM_SIZES) -> None:
+        self.ngram_sizes = tuple(ngram_sizes)
+        self.size = len(sentences)
+        self.vocab: Dict[str, int] = {}
+        rows: List[int] = []
+        cols: List[int] = []
+        counts: List[int] = []
+        for r, sentence in enumerate(sentences):
+            tf: Dict[int, int] = {}
+            for gram in _ngrams(sentence, self.ngram_sizes):
+                col = self.vocab.setdefault(gram, len(self.vocab))
+                tf[col] = tf.get(col, 0) + 1
+            rows.extend([r] * len(tf))
+            cols.extend(tf.keys())
+            counts.extend(tf.values())
+        self._terms = list(self.vocab)
+        row_arr = np.asarray(rows, dtype=np.int64)
+        col_arr = np.asarray(cols, dtype=np.int64)
+        vocab_size = len(self.vocab)
+        df = np.bincount(col_arr, minlength=vocab_size).astype(np.float64)
+        self.idf = np.log((1.0 + self.size) / (1.0 + df)) + 1.0
+        data = (1.0 + np.log(np.asarray(counts, dtype=np.float64))) * self.idf[col_arr] if counts else np.zeros(0)
+        norms = np.sqrt(np.bincount(row_arr, weights=data * data, minlength=self.size))
+        data = data / np.where(norms > 0, norms, 1.0)[row_arr] if len(data) else data
+        # 按句子排列（CSR）：rows 构造时已有序
+        self._row_ptr = np.concatenate(([0], np.cumsum(np.bincount(row_arr, minlength=self.size))))
+        self._row_cols = col_arr
+        self._row_data = data
+        # 按词项排列（CSC）：查询时只需汇总查询词项的倒排
+        order = np.argsort(col_arr, kind="stable")
+        self._col_ptr = np.concatenate(([0], np.cumsum(np.bincount(col_arr, minlength=vocab_size))))
+        self._col_rows = row_arr[order]
+        self._col_data = data[order]
+
+    def query_vector(self, texts: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """把查询文本（如关键词）转成稀疏向量 (词项下标, 权重)，未登录的 n 元组忽略"""
+        tf: Dict[int, int] = {}
+        for text in texts:
+            for gram in _ngrams(text, self.ngram_sizes):
+                col = self.vocab.get(gram)
+                if col is not None:
+                    tf[col] = tf.get(col, 0) + 1
+        if not tf:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        cols = np.fromiter(tf.keys(), dtype=np.int64, count=len(tf))
+        weights = (1.0 + np.log(np.fromiter(tf.values(), dtype=np.float64, count=len(tf)))) * self.idf[cols]
+        return cols, weights / np.linalg.norm(weights)
+
+    def scores(self, cols: np.ndarray, weights: np.ndarray) -> np.ndarray:
+        """查询向量与每个句子的余弦相似度"""
+        if self.size == 0 or len(cols) == 0:
+            return np.zeros(self.size)
+        starts = self._col_ptr[cols]
+        lengths = self._col_ptr[cols + 1] - starts
+        total = int(lengths.sum())
+        if total == 0:
+            return np.zeros(self.size)
+        # 把各词项的倒排区间展开成一个下标数组
+        offsets = np.repeat(starts - np.concatenate(([0], np.cumsum(lengths)[:-1])), lengths)
+        idx = offsets + np.arange(total)
+        return np.bincount(self._col_rows[idx], weights=self._col_data[idx] * np.repeat(weights, lengths),
+                           minlength=self.size)
+
+    def _centroid(self, rows: np.ndarray) -> np.ndarray:
+        """若干句子向量的质心（稠密，长度为词表大小）"""
+        centroid = np.zeros(len(self.vocab))
+        for r in rows:
+            lo, hi = self._row_ptr[r], self._row_ptr[r + 1]
+            centroid[self._row_cols[lo:hi]] += self._row_data[lo:hi]
+        return centroid / max(1, len(rows))
+
+    def search(self, keywords: Sequence[str], top_k: int = 20, min_score: float = 0.05, feedback: int = 5,
+               beta: float = 0.5, expansion_terms: int = 40) -> List[Tuple[int, float]]:
+        """
+        检索与关键词语义相关的句子，返回按得分降序的 (句子下标, 得分)
+
+        Args:
+            top_k: 最多返回的句子数
+            min_score: 最低余弦相似度
+            feedback: 伪相关反馈取首轮前几名句子，0 表示不做关键词扩展
+            beta: 反馈质心在扩展查询中的权重
+            expansion_terms: 扩展查询最多保留的词项数
+        """
+        cols, weights = self.query_vector(keywords)
+        scores = self.scores(cols, weights)
+        if feedback > 0 and scores.any():
+            top = np.argsort(-scores, kind="stable")[:feedback]
+            top = top[scores[top] > 0]
+            expanded = beta * self._centroid(top)
+            expanded[cols] += weights
+            keep = np.argsort(-expanded, kind="stable")[:max(expansion_terms, len(cols))]
+            keep = keep[expanded[keep] > 0]
+            cols, weights = keep, expanded[keep] / np.linalg.norm(expanded[keep])
+            scores = self.scores(cols, weights)
+        order = np.argsort(-scores, kind="stable")[:top_k]
+        return [(int(i), float(scores[i])) for i in order if scores[i] >= min_score]
+
+    def expand_keywords(self, keywords: Sequence[str], feedback: int = 5, limit: int = 10) -> List[str]:
+        """关键词扩展：首轮得分最高的句子中权重最大、且不属于原关键词的 n 元组"""
+        cols, weights = self.query_vector(keywords)
+        scores = self.scores(cols, weights)
+        if not scores.any():
+            return []
+        top = np.argsort(-scores, kind="stable")[:feedback]
+        centroid = self._centroid(top[scores[top] > 0])
+        centroid[cols] = 0.0
+        out: List[str] = []
+        for col in np.argsort(-centroid, kind="stable"):
+            if len(out) >= limit or centroid[col] <= 0:
+                break
+            term = self._terms[col]
+            if not any(term in kw for kw in keywords):
+                out.append(term)
+        return out
@@ -0,0 +1,72 @@
+"""
+管线阶段输出的内存缓存
+
+每个阶段（文档解析、知识点抽取、制卡）的输出按“该阶段的全部输入”做哈希缓存。
+只调整去重阈值、最低质量分等后处理参数时，上游阶段直接命中缓存，只重跑下游。
+"""
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+
+def stage_key(*parts: Any) -> str:
+    """把阶段输入（可 JSON 序列化）哈希为缓存键"""
+    payload = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+_FINGERPRINTS: Dict[Tuple[str, int, int], str] = {}
+_FINGERPRINTS_LOCK = threading.Lock()
+
+
+def file_fingerprint(path: str) -> str:
+    """
+    文件内容的 SHA-256
+
+    Streamlit 每次点击都会重写上传文件，修改时间会变但内容不变，因此按内容而非 mtime 判断；
+    同一 (路径, 大小, mtime) 的哈希结果会被记住，避免重复读盘。
+    """
+    st = os.stat(path)
+    memo_key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    with _FINGERPRINTS_LOCK:
+        if memo_key in _FINGERPRINTS:
+            return _FINGERPRINTS[memo_key]
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    digest = h.hexdigest()
+    with _FINGERPRINTS_LOCK:
+        _FINGERPRINTS[memo_key] = digest
+    return digest
+
+
+class StageCache:
+    def __init__(self, max_entries: int = 64) -> None:
+        self.max_entries = max_entries
+        self._data: "OrderedDict[Tuple[str, str], List[Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, stage: str, key: str) -> Optional[List[Dict[str, Any]]]:
+        with self._lock:
+            value = self._data.get((stage, key))
+            if value is None:
+                return None
+            self._data.move_to_end((stage, key))
+            return value
+
+    def put(self, stage: str, key: str, value: List[Dict[str, Any]]) -> None:
+        """value 为 model_dump() 后的 dict 列表，命中时由调用方重新构造模型，避免共享可变对象"""
+        with self._lock:
+            self._data[(stage, key)] = value
+            self._data.move_to_end((stage, key))
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
@@ -0,0 +1,11 @@
+import pytest
+
+from benchmarks.mock_openai import MockConfig, MockOpenAIServer
+
+
+@pytest.fixture
+def mock_server():
+    """本地的 OpenAI 兼容模拟服务（benchmarks/mock_openai.py），默认立即返回、不报错"""
+    server = MockOpenAIServer(config=MockConfig(seed=0)).start()
+    yield server
+    server.stop()
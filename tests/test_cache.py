@@ -0,0 +1,104 @@
+import pytest
+
+from llm import cache as cache_module
+from llm.cache import ResponseCache, make_cache_key
+
+_MESSAGES = [{"role": "user", "content": "问题"}]
+
+
+class _Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(cache_module.time, "time", clock)
+    return clock
+
+
+def _cache(tmp_path, **kwargs) -> ResponseCache:
+    return ResponseCache(str(tmp_path / "cache.sqlite3"), **kwargs)
+
+
+def test_key_covers_all_request_parameters():
+    base = make_cache_key("m", _MESSAGES, 0.2, None)
+    assert base == make_cache_key("m", [dict(_MESSAGES[0])], 0.2, None)
+    assert base != make_cache_key("m2", _MESSAGES, 0.2, None)
+    assert base != make_cache_key("m", _MESSAGES, 0.0, None)
+    assert base != make_cache_key("m", _MESSAGES, 0.2, 100)
+    assert base != make_cache_key("m", [{"role": "user", "content": "问题2"}], 0.2, None)
+
+
+def test_hit_miss_and_persistence(tmp_path):
+    cache = _cache(tmp_path)
+    assert cache.get("k") is None
+    cache.set("k", "响应", model="m")
+    assert cache.get("k") == "响应"
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert _cache(tmp_path).get("k") == "响应"  # 重新打开同一文件
+
+
+def test_ttl_expiry(tmp_path, clock):
+    cache = _cache(tmp_path, ttl_seconds=60)
+    cache.set("k", "响应")
+    clock.now += 59
+    assert cache.get("k") == "响应"
+    clock.now += 2
+    assert cache.get("k") is None
+    assert cache.stats()["entries"] == 0
+    # 读取不延长有效期：TTL 从写入时算起
+    cache.set("k", "响应")
+    clock.now += 30
+    cache.get("k")
+    clock.now += 31
+    assert cache.get("k") is None
+
+
+def test_no_ttl_never_expires(tmp_path, clock):
+    cache = _cache(tmp_path, ttl_seconds=None)
+    cache.set("k", "响应")
+    clock.now += 10 * 365 * 24 * 3600
+    assert cache.get("k") == "响应"
+
+
+def test_lru_eviction_by_entries(tmp_path, clock):
+    cache = _cache(tmp_path, max_entries=2)
+    cache.set("a", "1")
+    clock.now += 1
+    cache.set("b", "2")
+    clock.now += 1
+    assert cache.get("a") == "1"  # a 最近被访问，b 成为最久未用
+    clock.now += 1
+    cache.set("c", "3")
+    assert cache.get("b") is None
+    assert cache.get("a") == "1" and cache.get("c") == "3"
+    assert cache.stats()["entries"] == 2
+
+
+def test_lru_eviction_by_bytes(tmp_path, clock):
+    cache = _cache(tmp_path, max_bytes=10)
+    cache.set("a", "x" * 4)
+    clock.now += 1
+    cache.set("b", "x" * 4)
+    clock.now += 1
+    cache.set("c", "x" * 4)
+    assert cache.get("a") is None
+    assert cache.stats()["bytes"] == 8
+    # 覆盖写入同一个键时按新旧大小之差计算总量
+    clock.now += 1
+    cache.set("c", "x" * 2)
+    assert cache.stats()["bytes"] == 6 and cache.get("b") is not None
+
+
+def test_clear_resets_counts(tmp_path):
+    cache = _cache(tmp_path)
+    cache.set("k", "响应")
+    cache.get("k")
+    cache.clear()
+    assert cache.get("k") is None
+    assert cache.stats() == {"entries": 0, "bytes": 0, "hits": 0, "misses": 1, "hit_ratio": 0.0}
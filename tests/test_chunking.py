@@ -0,0 +1,95 @@
+import random
+
+import pytest
+
+from llm.tokens import estimate_tokens
+from pipeline.utils.chunking import (SEGMENT_SEPARATOR, chunk_token_budget, iter_chunks, iter_text_chunks, pack_spans,
+                                     to_source_offset)
+
+_LAW = "".join(f"第{i}条 经营者应当遵循自愿、平等、公平、诚信的原则。违反本条规定的，依法承担责任。\n" for i in range(1, 60))
+
+
+def _random_text(seed: int, n: int) -> str:
+    rng = random.Random(seed)
+    return "".join(rng.choice("法律条款规定合同责任。，；\n abc") for _ in range(n))
+
+
+@pytest.mark.parametrize("seed", range(10))
+@pytest.mark.parametrize("overlap", [0, 20])
+def test_chunks_cover_text_within_budget(seed, overlap):
+    text = _random_text(seed, 3000)
+    chunks = list(iter_chunks(text, 100, overlap))
+    assert chunks[0].start == 0 and chunks[-1].end == len(text)
+    for prev, cur in zip(chunks, chunks[1:]):
+        assert cur.start <= prev.end  # 没有遗漏
+        assert cur.start > prev.start  # 总在前进
+        if overlap == 0:
+            assert cur.start == prev.end
+    for c in chunks:
+        assert text[c.start:c.end] == c.text
+        assert estimate_tokens(c.text) <= 100 + 1
+
+
+def test_cuts_before_article_headings():
+    chunks = list(iter_chunks(_LAW, 200))
+    assert len(chunks) > 1
+    assert all(c.text.lstrip().startswith("第") for c in chunks[1:])
+    assert all(c.text.endswith("\n") for c in chunks[:-1])
+
+
+def test_overlap_starts_at_sentence_boundary():
+    chunks = list(iter_chunks(_LAW, 200, overlap_tokens=30))
+    for prev, cur in zip(chunks, chunks[1:]):
+        assert cur.start < prev.end
+        assert _LAW[cur.start - 1] in "。\n"
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_streamed_pieces_match_whole_text(seed):
+    text = _random_text(seed, 2000)
+    rng = random.Random(seed)
+    cuts = sorted(rng.sample(range(1, len(text)), 15))
+    pieces = [text[a:b] for a, b in zip([0] + cuts, cuts + [len(text)])]
+    assert list(iter_text_chunks(pieces, 80, 10)) == list(iter_chunks(text, 80, 10))
+
+
+def test_empty_and_short_text():
+    assert list(iter_chunks("", 100)) == []
+    assert [c.text for c in iter_chunks("短文本", 100)] == ["短文本"]
+
+
+def test_chunk_token_budget():
+    assert chunk_token_budget("DeepSeek-R1") == 6000
+    assert chunk_token_budget("DeepSeek-V3", override=500) == 500
+    assert chunk_token_budget("unknown") == chunk_token_budget(None)
+
+
+def test_pack_spans_maps_offsets_back_to_source():
+    text = _LAW
+    spans = [(0, 40), (300, 380), (1000, 1100)]
+    packed = pack_spans(text, spans, max_tokens=10000)
+    assert len(packed) == 1
+    chunk, segments = packed[0]
+    assert chunk == SEGMENT_SEPARATOR.join(text[s:e] for s, e in spans)
+    assert [(start, end) for _, start, end in segments] == spans
+    for local, start, end in segments:
+        for k in (0, 5, end - start - 1):
+            assert chunk[local + k] == text[start + k]
+            assert to_source_offset(segments, local + k) == start + k
+    # 落在分隔符上的偏移映射到前一片段的末尾
+    assert to_source_offset(segments, segments[1][0] - 1) == spans[0][1]
+
+
+def test_pack_spans_respects_budget_and_splits_long_spans():
+    text = _LAW
+    spans = [(0, 400), (600, 2000)]
+    packed = pack_spans(text, spans, max_tokens=150)
+    assert len(packed) > 2
+    covered = []
+    for chunk, segments in packed:
+        assert estimate_tokens(chunk) <= 150 + estimate_tokens(SEGMENT_SEPARATOR) * len(segments)
+        for local, start, end in segments:
+            assert chunk[local:local + end - start] == text[start:end]
+            covered.append((start, end))
+    assert covered[0][0] == 0 and covered[-1][1] == 2000
+    assert all(not (400 < s < 600) for s, _ in covered)
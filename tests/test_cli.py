@@ -0,0 +1,157 @@
+import argparse
+import os
+
+import pytest
+
+from app import cli
+from models.schemas import Card, PipelineInput, PipelineOutput
+
+
+class _Checkpointer:
+    def __init__(self) -> None:
+        self.deleted = []
+
+    def delete_thread(self, run_id: str) -> None:
+        self.deleted.append(run_id)
+
+
+@pytest.fixture
+def batch(tmp_path, monkeypatch):
+    """两个输入文件；process_file 按 outcomes[文件名] 返回结果，并记录每次处理的文件"""
+    files = []
+    for name in ("a.txt", "b.txt"):
+        path = tmp_path / "docs" / name
+        path.parent.mkdir(exist_ok=True)
+        path.write_text(f"{name} 的内容", encoding="utf-8")
+        files.append(str(path))
+    outcomes = {}
+    processed = []
+
+    def process_file(path, base_input, api_key, scheduler, max_concurrency, run_id):
+        processed.append(os.path.basename(path))
+        outcome = outcomes[os.path.basename(path)]
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    monkeypatch.setattr(cli, "process_file", process_file)
+    monkeypatch.setattr(cli, "export_deck", lambda name, cards, out, incremental: {"path": None, "added": len(cards),
+                                                                                    "updated": 0, "unchanged": 0})
+    monkeypatch.setattr(cli, "CHECKPOINTER", _Checkpointer())
+    args = argparse.Namespace(output=str(tmp_path / "out"), force=False, merge=None, incremental=False, api_key="",
+                              workers=1, max_concurrency=2, rpm=0, tpm=0)
+    base_input = PipelineInput(file_paths=[], keywords=["合同"], api_base="http://x", api_key="", extract_model="m",
+                               card_model="m", dedup_threshold=0.88, min_quality=0.5, max_cards_per_item=3)
+    return files, outcomes, processed, args, base_input
+
+
+def _output(cards: int = 1, failed_requests: int = 0, errors=()) -> PipelineOutput:
+    return PipelineOutput(
+        documents=[], extracted_items=[], errors=list(errors), metrics={"failed_requests": failed_requests},
+        cards=[Card(Question=f"问题{i}", Answer=f"答案{i}", SourceDoc="", SourceLoc="") for i in range(cards)])
+
+
+def _status(args, path):
+    return cli.BatchState(args.output).files[path]["status"]
+
+
+def test_done_files_are_skipped(batch):
+    files, outcomes, processed, args, base_input = batch
+    outcomes.update({"a.txt": _output(), "b.txt": _output()})
+    assert cli.run_batch(files, base_input, args) == 0
+    assert processed == ["a.txt", "b.txt"]
+    assert _status(args, files[0]) == _status(args, files[1]) == "done"
+
+    processed.clear()
+    assert cli.run_batch(files, base_input, args) == 0
+    assert processed == []
+
+    args.force = True
+    cli.run_batch(files, base_input, args)
+    assert processed == ["a.txt", "b.txt"]
+
+
+def test_changed_file_or_settings_are_reprocessed(batch):
+    files, outcomes, processed, args, base_input = batch
+    outcomes.update({"a.txt": _output(), "b.txt": _output()})
+    cli.run_batch(files, base_input, args)
+
+    processed.clear()
+    with open(files[1], "a", encoding="utf-8") as f:
+        f.write("新增内容")
+    cli.run_batch(files, base_input, args)
+    assert processed == ["b.txt"]
+
+    # 只影响速度的参数不会触发重跑，影响结果的参数会
+    processed.clear()
+    cli.run_batch(files, base_input.model_copy(update={"max_concurrency": 16}), args)
+    assert processed == []
+    cli.run_batch(files, base_input.model_copy(update={"api_base": "http://y"}), args)
+    assert processed == ["a.txt", "b.txt"]
+
+
+def test_final_request_failures_mark_partial_and_retry(batch):
+    files, outcomes, processed, args, base_input = batch
+    outcomes.update({"a.txt": _output(cards=2, failed_requests=3), "b.txt": _output()})
+    assert cli.run_batch(files, base_input, args) == 0
+    state = cli.BatchState(args.output)
+    assert state.files[files[0]]["status"] == "partial"
+    assert state.files[files[0]]["errors"] == ["3 次模型请求失败"]
+    assert len(state.load_cards(files[0])) == 2  # 已有的卡片照常保存
+    assert state.files[files[1]]["status"] == "done"
+
+    processed.clear()
+    outcomes["a.txt"] = _output(cards=3)
+    cli.run_batch(files, base_input, args)
+    assert processed == ["a.txt"]
+    assert _status(args, files[0]) == "done"
+
+
+def test_retried_requests_do_not_count_as_failures(batch):
+    files, outcomes, processed, args, base_input = batch
+    # 调度器重试成功的请求只出现在 scheduler 统计里，不影响状态
+    output = _output()
+    output.metrics["scheduler"] = {"retries": 5, "throttled": 5, "failures": 0}
+    outcomes.update({"a.txt": output, "b.txt": _output()})
+    cli.run_batch(files, base_input, args)
+    assert _status(args, files[0]) == "done"
+
+
+def test_failed_files(batch):
+    files, outcomes, processed, args, base_input = batch
+    outcomes.update({"a.txt": _output(cards=0, failed_requests=1), "b.txt": RuntimeError("boom")})
+    assert cli.run_batch(files, base_input, args) == 2
+    state = cli.BatchState(args.output)
+    assert state.files[files[0]]["status"] == "failed"
+    assert state.files[files[1]]["status"] == "failed"
+    assert state.files[files[1]]["errors"] == ["运行失败: boom"]
+    assert cli.CHECKPOINTER.deleted == []  # 失败的运行保留检查点，下次续跑
+
+    processed.clear()
+    outcomes.update({"a.txt": _output(), "b.txt": _output()})
+    assert cli.run_batch(files, base_input, args) == 0
+    assert processed == ["a.txt", "b.txt"]
+
+
+def test_merge_includes_done_and_partial_cards(batch, monkeypatch):
+    files, outcomes, processed, args, base_input = batch
+    merged = {}
+
+    def export_deck(name, cards, out, incremental):
+        merged[name] = cards
+        return {"path": None, "added": len(cards), "updated": 0, "unchanged": 0}
+
+    monkeypatch.setattr(cli, "export_deck", export_deck)
+    args.merge = "合并"
+    outcomes.update({"a.txt": _output(cards=2, failed_requests=1), "b.txt": _output(cards=0, errors=["读取文件失败"])})
+    assert cli.run_batch(files, base_input, args) == 1
+    assert len(merged["合并"]) == 2
+
+
+def test_batch_state_survives_corrupt_file(tmp_path):
+    (tmp_path / cli.STATE_FILE).write_text("{not json", encoding="utf-8")
+    state = cli.BatchState(str(tmp_path))
+    assert state.files == {}
+    state.update("x", status="running")
+    assert cli.BatchState(str(tmp_path)).files["x"]["status"] == "running"
+    assert not state.is_done("x", "fp", "settings")
@@ -0,0 +1,122 @@
+import asyncio
+from collections import OrderedDict
+
+import pytest
+
+import llm.client as client_module
+from llm.cache import ResponseCache
+from llm.client import AsyncDeepSeekClient, DeepSeekClient, LLMRequestError, content_or_raise, get_client
+from llm.scheduler import RateLimitedScheduler
+from models.schemas import ChatResult
+from pipeline.utils.metrics import MetricsRecorder
+
+_MESSAGES = [{"role": "user", "content": "请生成卡片"}]
+
+
+def test_complete_returns_content_latency_and_usage(mock_server):
+    result = DeepSeekClient(mock_server.base_url, "k", default_model="mock").complete(_MESSAGES)
+    assert isinstance(result, ChatResult)
+    assert result.ok and result.error is None
+    assert result.content and result.model == "mock"
+    assert result.prompt_tokens > 0 and result.completion_tokens > 0
+    assert result.latency_ms > 0
+    assert not result.cached
+
+
+def test_rate_limited_request_is_failed_result(mock_server):
+    mock_server.config.error_rate = 1.0
+    result = DeepSeekClient(mock_server.base_url, "k").chat(_MESSAGES)
+    assert not result.ok
+    assert result.status_code == 429 and result.retryable
+    assert "rate limited" in result.error
+    with pytest.raises(LLMRequestError) as excinfo:
+        content_or_raise(result)
+    assert excinfo.value.status_code == 429
+
+
+def test_connection_error_is_retryable():
+    result = DeepSeekClient("http://127.0.0.1:9/v1", "k").complete(_MESSAGES)
+    assert not result.ok and result.status_code is None and result.retryable
+
+
+def test_cache_hit_is_marked_and_recorded(mock_server, tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.db"))
+    metrics = MetricsRecorder()
+    client = DeepSeekClient(mock_server.base_url, "k", cache=cache).with_metrics(metrics)
+    first = client.complete(_MESSAGES)
+    second = client.complete(_MESSAGES)
+    assert not first.cached and second.cached
+    assert second.content == first.content
+    assert mock_server.reset_stats()["requests"] == 1
+    # 流式请求同样命中缓存
+    assert "".join(client.stream(_MESSAGES)) == first.content
+    assert mock_server.reset_stats()["requests"] == 0
+
+
+def test_stream_matches_complete(mock_server):
+    mock_server.config.stream_chunk_chars = 4
+    client = DeepSeekClient(mock_server.base_url, "k")
+    pieces = list(client.stream(_MESSAGES))
+    assert len(pieces) > 1
+    assert "".join(pieces) == client.complete(_MESSAGES).content
+
+
+def test_stream_raises_on_error(mock_server):
+    mock_server.config.error_rate = 1.0
+    with pytest.raises(Exception):
+        list(DeepSeekClient(mock_server.base_url, "k").stream(_MESSAGES))
+
+
+def test_async_chat_many_keeps_order(mock_server):
+    client = AsyncDeepSeekClient(mock_server.base_url, "k")
+    requests = [{"messages": [{"role": "user", "content": f"问题 {i}"}]} for i in range(6)]
+
+    async def main():
+        try:
+            return await client.chat_many(requests, max_concurrency=3)
+        finally:
+            await client.aclose()
+
+    results = asyncio.run(main())
+    assert all(r.ok for r in results)
+    assert mock_server.reset_stats()["requests"] == 6
+
+
+def test_scheduler_retries_failed_results(mock_server):
+    mock_server.config.error_rate = 1.0
+    client = DeepSeekClient(mock_server.base_url, "k")
+    scheduler = RateLimitedScheduler(max_retries=2, base_delay=0.001, max_delay=0.01)
+
+    def request(_):
+        if scheduler.stats["retries"] == 2:
+            mock_server.config.error_rate = 0.0
+        return content_or_raise(client.complete(_MESSAGES))
+
+    ok, content = scheduler.try_job(request, None)
+    assert ok and content
+    assert scheduler.stats["retries"] == 2 and scheduler.stats["throttled"] == 2
+
+
+def test_non_retryable_result_is_not_retried():
+    scheduler = RateLimitedScheduler(max_retries=3, base_delay=0.001)
+    calls = []
+
+    def request(_):
+        calls.append(1)
+        return content_or_raise(ChatResult(ok=False, error="bad request", status_code=400, retryable=False))
+
+    assert scheduler.try_job(request, None, default="") == (False, "")
+    assert len(calls) == 1
+
+
+def test_get_client_keys_on_key_hash_and_evicts(monkeypatch):
+    monkeypatch.setattr(client_module, "_CLIENTS", OrderedDict())
+    monkeypatch.setattr(client_module, "MAX_CLIENTS", 2)
+    first = get_client("http://x/v1", "sk-secret-1")
+    assert get_client("http://x/v1", "sk-secret-1") is first
+    assert all("sk-secret" not in part for key in client_module._CLIENTS for part in map(str, key))
+    get_client("http://x/v1", "sk-secret-2")
+    get_client("http://x/v1", "sk-secret-1")  # 最近用过，保留
+    get_client("http://x/v1", "sk-secret-3")
+    assert len(client_module._CLIENTS) == 2
+    assert get_client("http://x/v1", "sk-secret-1") is first
@@ -0,0 +1,88 @@
+"""DedupIndex 的候选剪枝只能去掉不可能达到阈值的卡片，保留结果须与逐对比较完全一致"""
+
+import random
+
+import pytest
+
+from models.schemas import Card
+from pipeline.nodes.quality import CardFilter, deduplicate_cards, deduplicate_cards_bruteforce
+
+_ALPHA = "的是法律条款规定人民法院当事人合同责任竞争经营者商业秘密不正当行为损害赔偿 abc"
+_SPACES = " 　\t"
+_THRESHOLDS = [0.0, 0.3, 0.5, 0.6, 0.7, 0.75, 0.8, 0.88, 0.95, 0.99, 1.0]
+
+
+def _random_text(rng: random.Random, n: int) -> str:
+    return "".join(rng.choice(_ALPHA + _SPACES if rng.random() < 0.2 else _ALPHA) for _ in range(n))
+
+
+def _mutate(rng: random.Random, text: str) -> str:
+    chars = list(text)
+    for _ in range(rng.randint(0, 4)):
+        op = rng.random()
+        i = rng.randrange(len(chars) + 1)
+        if op < 0.4 and chars:
+            chars.pop(min(i, len(chars) - 1))
+        elif op < 0.8:
+            chars.insert(i, rng.choice(_ALPHA + " "))
+        elif chars:
+            chars[min(i, len(chars) - 1)] = rng.choice(_ALPHA)
+    return "".join(chars)
+
+
+def _near_duplicates(seed: int, n: int = 40):
+    """从少量原型卡片变异出一批相互近似的卡片"""
+    rng = random.Random(seed)
+    base = [(_random_text(rng, rng.randint(1, 15)), _random_text(rng, rng.randint(1, 30))) for _ in range(8)]
+    cards = []
+    for _ in range(n):
+        q, a = rng.choice(base)
+        cards.append(Card(Question=_mutate(rng, q) or "x", Answer=_mutate(rng, a) or "y", SourceDoc="", SourceLoc="",
+                          quality=1.0))
+    return cards
+
+
+@pytest.mark.parametrize("threshold", _THRESHOLDS)
+@pytest.mark.parametrize("seed", range(20))
+def test_matches_bruteforce(seed, threshold):
+    cards = _near_duplicates(seed)
+    expected = [id(c) for c in deduplicate_cards_bruteforce(cards, threshold)]
+    assert [id(c) for c in deduplicate_cards(cards, threshold)] == expected
+
+
+@pytest.mark.parametrize("threshold", [0.5, 0.88])
+@pytest.mark.parametrize("seed", range(5))
+def test_card_filter_matches_bruteforce(seed, threshold):
+    # 流式版本没有全局频次，候选顺序不同，但保留结果不变
+    cards = _near_duplicates(seed)
+    card_filter = CardFilter(min_quality=0.0, threshold=threshold)
+    kept = [id(c) for c in cards if card_filter.accept(c)]
+    assert kept == [id(c) for c in deduplicate_cards_bruteforce(cards, threshold)]
+    assert card_filter.counts["kept"] == len(kept)
+
+
+@pytest.mark.parametrize("text", ["\xa0", "\x85", "a\xa0b", "\u3000", " \xa0 ", "b\xa0合", "\xa0合\x85"])
+def test_unicode_spaces_tokenized_like_rapidfuzz(text):
+    # 只含 Latin-1 字符时 rapidfuzz 不把 \xa0、\x85 当作分隔符，str.split 会；切分不一致时索引会漏掉重复
+    cards = [Card(Question=text, Answer=text, SourceDoc="", SourceLoc="") for _ in range(2)]
+    for threshold in (0.6, 0.88):
+        expected = [id(c) for c in deduplicate_cards_bruteforce(cards, threshold)]
+        assert [id(c) for c in deduplicate_cards(cards, threshold)] == expected
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_matches_bruteforce_with_unicode_spaces(seed):
+    rng = random.Random(seed)
+    alphabet = "法律条款合同 ab\xa0\x85\u3000\u2003\t"
+    cards = [Card(Question="".join(rng.choice(alphabet) for _ in range(rng.randint(1, 6))),
+                  Answer="".join(rng.choice(alphabet) for _ in range(rng.randint(1, 6))), SourceDoc="", SourceLoc="")
+             for _ in range(40)]
+    for threshold in (0.5, 0.6, 0.8, 1.0):
+        expected = [id(c) for c in deduplicate_cards_bruteforce(cards, threshold)]
+        assert [id(c) for c in deduplicate_cards(cards, threshold)] == expected
+
+
+def test_exact_duplicates_and_empty_input():
+    card = Card(Question="什么是商业秘密", Answer="不为公众所知悉的信息", SourceDoc="", SourceLoc="")
+    assert deduplicate_cards([], 0.88) == []
+    assert deduplicate_cards([card, card.model_copy()], 0.88) == [card]
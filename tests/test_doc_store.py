@@ -0,0 +1,62 @@
+import pytest
+
+from pipeline.utils.doc_store import DocumentStore, get_document_store
+
+
+@pytest.fixture
+def store(tmp_path):
+    return DocumentStore(str(tmp_path / "cache" / "documents.sqlite3"))
+
+
+def test_put_get_round_trip(store):
+    assert store.get("abc", "v1") is None
+    store.put("abc", "v1", "第一页\n第二页", [0, 4], 2)
+    assert store.get("abc", "v1") == ("第一页\n第二页", [0, 4], 2)
+    assert (store.hits, store.misses) == (1, 1)
+
+
+def test_parser_version_is_part_of_key(store):
+    # 解析器升级后旧结果不再命中，两个版本的结果并存
+    store.put("abc", "v1", "旧", [], 0)
+    assert store.get("abc", "v2") is None
+    store.put("abc", "v2", "新", [], 0)
+    assert store.get("abc", "v1")[0] == "旧"
+    assert store.get("abc", "v2")[0] == "新"
+    assert store.stats()["entries"] == 2
+
+
+def test_put_replaces_existing_entry(store):
+    store.put("abc", "v1", "旧", [], 0)
+    store.put("abc", "v1", "新内容", [0], 1)
+    assert store.get("abc", "v1") == ("新内容", [0], 1)
+    assert store.stats()["entries"] == 1
+
+
+def test_stats_and_clear(store):
+    assert store.stats() == {"entries": 0, "bytes": 0, "hits": 0, "misses": 0, "hit_ratio": 0.0}
+    store.put("abc", "v1", "合同", [], 0)
+    store.get("abc", "v1")
+    store.get("abc", "v1")
+    store.get("def", "v1")
+    stats = store.stats()
+    assert stats["bytes"] == len("合同".encode("utf-8"))
+    assert (stats["hits"], stats["misses"]) == (2, 1)
+    assert stats["hit_ratio"] == pytest.approx(2 / 3)
+
+    store.clear()
+    assert store.stats() == {"entries": 0, "bytes": 0, "hits": 0, "misses": 0, "hit_ratio": 0.0}
+
+
+def test_entries_persist_across_instances(tmp_path):
+    path = str(tmp_path / "documents.sqlite3")
+    DocumentStore(path).put("abc", "v1", "全文", [], 0)
+    assert DocumentStore(path).get("abc", "v1") == ("全文", [], 0)
+
+
+def test_get_document_store_reuses_instance_per_path(tmp_path, monkeypatch):
+    path = str(tmp_path / "documents.sqlite3")
+    store = get_document_store(path)
+    monkeypatch.chdir(tmp_path)
+    # 相对路径与绝对路径指向同一文件时共享实例与计数
+    assert get_document_store("documents.sqlite3") is store
+    assert get_document_store(str(tmp_path / "other.sqlite3")) is not store
@@ -0,0 +1,76 @@
+import json
+import os
+import sqlite3
+import zipfile
+
+from anki.exporter import deck_id_for, export_deck, manifest_path_for, note_guid
+from models.schemas import Card
+
+
+def _card(q: str, a: str = "答案", doc: str = "a.pdf", **kwargs) -> Card:
+    return Card(Question=q, Answer=a, SourceDoc=doc, SourceLoc="", **kwargs)
+
+
+def _note_guids(path, tmp_path):
+    """读出 .apkg 中全部笔记的 GUID"""
+    target = tmp_path / "unpacked"
+    with zipfile.ZipFile(path) as z:
+        z.extract("collection.anki2", target)
+    conn = sqlite3.connect(str(target / "collection.anki2"))
+    try:
+        return {row[0] for row in conn.execute("SELECT guid FROM notes")}
+    finally:
+        conn.close()
+
+
+def test_note_guid_is_stable_under_normalization():
+    assert note_guid(_card("什么是 商业秘密？")) == note_guid(_card("什么是  商业秘密?"))  # 全半角、空白折叠
+    assert note_guid(_card("问题", "答案")) == note_guid({"Question": "问题", "Answer": "答案", "SourceDoc": "a.pdf"})
+    assert note_guid(_card("问题", "答案")) != note_guid(_card("问题", "另一个答案"))
+    assert note_guid(_card("问题", doc="a.pdf")) != note_guid(_card("问题", doc="b.pdf"))
+
+
+def test_deck_id_is_stable_and_in_range():
+    assert deck_id_for("刑法学总论") == deck_id_for("刑法学总论")
+    assert deck_id_for("刑法学总论") != deck_id_for("民法总论")
+    assert (1 << 30) <= deck_id_for("刑法学总论") < (1 << 31)
+
+
+def test_full_export_writes_manifest(tmp_path):
+    out = str(tmp_path)
+    cards = [_card("问题1"), _card("问题2"), _card("问题1")]  # 重复的 GUID 只写一条
+    result = export_deck("牌组", cards, out)
+    assert result == {"path": os.path.join(out, "牌组.apkg"), "delta_path": None, "added": 2, "updated": 0,
+                      "unchanged": 0}
+    assert _note_guids(result["path"], tmp_path) == {note_guid(cards[0]), note_guid(cards[1])}
+    with open(manifest_path_for("牌组", out), encoding="utf-8") as f:
+        manifest = json.load(f)
+    assert manifest["deck_id"] == deck_id_for("牌组")
+    assert set(manifest["notes"]) == {note_guid(cards[0]), note_guid(cards[1])}
+
+
+def test_incremental_export_keeps_full_deck_and_writes_delta(tmp_path):
+    out = str(tmp_path)
+    export_deck("牌组", [_card("问题1"), _card("问题2")], out, incremental=True)
+
+    changed = _card("问题2", Evidence="新增的证据")  # 字段变化，GUID 不变
+    result = export_deck("牌组", [_card("问题1"), changed, _card("问题3")], out, incremental=True)
+    assert (result["added"], result["updated"], result["unchanged"]) == (1, 1, 1)
+    # 完整牌组包含本次的全部卡片，增量包只含新增与变化的
+    assert len(_note_guids(result["path"], tmp_path)) == 3
+    assert result["delta_path"] != result["path"] and ".delta-" in os.path.basename(result["delta_path"])
+    assert _note_guids(result["delta_path"], tmp_path) == {note_guid(changed), note_guid(_card("问题3"))}
+
+    # 清单保留本次未出现的笔记；没有变化时不写增量包，之前的增量包不被覆盖
+    again = export_deck("牌组", [_card("问题1")], out, incremental=True)
+    assert again["delta_path"] is None and again["unchanged"] == 1
+    assert os.path.exists(result["delta_path"])
+    with open(manifest_path_for("牌组", out), encoding="utf-8") as f:
+        assert len(json.load(f)["notes"]) == 3
+
+
+def test_delta_paths_do_not_collide(tmp_path):
+    out = str(tmp_path)
+    first = export_deck("牌组", [_card("问题1")], out, incremental=True)["delta_path"]
+    second = export_deck("牌组", [_card("问题2")], out, incremental=True)["delta_path"]
+    assert first != second and os.path.exists(first) and os.path.exists(second)
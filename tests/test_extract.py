@@ -0,0 +1,63 @@
+from llm.scheduler import RateLimitedScheduler
+from models.schemas import ChatResult, Document
+from pipeline.nodes.extract import iter_extracted_items
+from pipeline.utils.metrics import MetricsRecorder
+
+_FILLER = "本段讨论与主题无关的一般性程序问题，法院依照规定进行审理。" * 6
+
+
+def _doc(name: str, topic: str) -> Document:
+    paragraphs = [_FILLER] * 6 + [f"本段涉及{topic}的认定标准与责任承担。"] + [_FILLER] * 6
+    return Document(name=name, path=name, text="\n".join(paragraphs))
+
+
+class _Client:
+    """记录每次请求的原文，返回一个摘录原文首句的条目"""
+
+    def __init__(self) -> None:
+        self.prompts = []
+        self.metrics = None
+
+    def complete(self, messages, model=None, temperature=0.2, max_tokens=None):
+        text = messages[-1]["content"]
+        self.prompts.append(text)
+        return ChatResult(content='{"items": [{"type": "KeywordHit", "text": "%d"}]}' % len(self.prompts))
+
+
+def test_prefilter_streams_per_document():
+    client = _Client()
+    pulled = []
+
+    def documents():
+        for name, topic in (("a.txt", "商业秘密"), ("b.txt", "格式条款"), ("c.txt", "商业秘密")):
+            pulled.append(name)
+            yield _doc(name, topic)
+
+    stats = {}
+    items = iter_extracted_items(documents(), ["商业秘密"], client, "m", RateLimitedScheduler(max_concurrency=1),
+                                 chunk_tokens=100000, stats=stats, retrieval_recall=0.05, max_pending=1,
+                                 parse_statutes=False)
+    first = next(items)
+    # 第一篇文档的结果出来时，后面的文档还没有被读取
+    assert first.docName == "a.txt"
+    assert pulled == ["a.txt"]
+    rest = list(items)
+    assert pulled == ["a.txt", "b.txt", "c.txt"]
+    # 每篇文档只发送命中段落及其相邻段落，没有任何相关段落的文档不发送
+    assert stats["passages_selected"] < stats["passages"]
+    assert all("格式条款" not in p for p in client.prompts)
+    assert {i.docName for i in [first] + rest} == {"a.txt", "c.txt"}
+
+
+def test_counts_go_to_run_metrics(capsys):
+    client = _Client()
+    client.metrics = MetricsRecorder()
+    docs = [_doc("a.txt", "商业秘密"), _doc("b.txt", "商业秘密")]
+    items = list(iter_extracted_items(docs, ["商业秘密"], client, "m", RateLimitedScheduler(), chunk_tokens=100000,
+                                      retrieval_recall=0.05, parse_statutes=False))
+    counters = client.metrics.summary()["counters"]
+    assert counters["extract.chunk_calls"] == 2
+    assert counters["extract.semantic_calls"] == len(client.prompts) - 2
+    assert counters["extract.items"] == len(items)
+    assert 0 < counters["extract.passages_selected"] < counters["extract.passages"]
+    assert capsys.readouterr().out == ""
@@ -0,0 +1,37 @@
+import json
+
+from llm.scheduler import RateLimitedScheduler
+from models.schemas import ChatResult, ExtractedItem
+from pipeline.nodes.generate_cards import iter_cards
+from pipeline.utils.metrics import MetricsRecorder
+
+
+class _Client:
+    """批量请求只返回偶数编号条目的卡片，逐条请求总能返回一张卡片"""
+
+    def __init__(self) -> None:
+        self.metrics = MetricsRecorder()
+
+    def complete(self, messages, model=None, temperature=0.2, max_tokens=None):
+        prompt = messages[-1]["content"]
+        card = {"type": "basic", "Question": "问题", "Answer": "答案"}
+        if "【条目 " not in prompt:
+            return ChatResult(content=json.dumps({"cards": [card]}))
+        count = prompt.count("【条目 ")
+        results = [{"index": i, "cards": [card]} for i in range(0, count, 2)]
+        return ChatResult(content=json.dumps({"results": results}))
+
+
+def _items(n: int):
+    return [ExtractedItem(type="KeywordHit", text=f"第{i}个知识点的内容", docName="a.txt") for i in range(n)]
+
+
+def test_batch_and_retry_counts_go_to_run_metrics(capsys):
+    client = _Client()
+    cards = list(iter_cards(_items(6), client, "m", 1, scheduler=RateLimitedScheduler(), batch_size=4))
+    assert len(cards) == 6
+    counters = client.metrics.summary()["counters"]
+    assert counters["cards.items"] == 6
+    assert counters["cards.batches"] == 2
+    assert counters["cards.retries"] == 3  # 每批中缺失的奇数编号条目逐条重试
+    assert capsys.readouterr().out == ""
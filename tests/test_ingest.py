@@ -0,0 +1,79 @@
+import fitz
+import pytest
+
+from pipeline.nodes import ingest
+from pipeline.nodes.ingest import build_document, get_parse_pool, iter_documents, iter_pages, load_files
+from pipeline.utils.chunking import iter_chunks, iter_page_chunks
+from pipeline.utils.doc_store import DocumentStore
+
+
+def _pdf(path, pages):
+    doc = fitz.open()
+    for i in range(pages):
+        doc.new_page().insert_text((72, 72), f"page {i + 1} text")
+    doc.save(str(path))
+    doc.close()
+    return str(path)
+
+
+@pytest.fixture
+def files(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest, "PAGES_PER_TASK", 2)
+    txt = tmp_path / "c.txt"
+    txt.write_text("第一条 纯文本文件。", encoding="utf-8")
+    return [_pdf(tmp_path / "a.pdf", 5), str(tmp_path / "skip.md"), str(txt), _pdf(tmp_path / "b.pdf", 3)]
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_iter_pages_in_file_and_page_order(files, workers):
+    pages = list(iter_pages(files, max_workers=workers, pages_per_task=2))
+    assert [(p.docName, p.page) for p in pages] == (
+        [("a.pdf", i) for i in range(1, 6)] + [("c.txt", 1)] + [("b.pdf", i) for i in range(1, 4)])
+    assert "page 3 text" in pages[2].text
+    assert pages[0].totalPages == 5 and pages[5].totalPages == 0
+
+
+def test_page_chunks_match_document_offsets(files):
+    pages = [p for p in iter_pages(files[:1]) if p.docName == "a.pdf"]
+    doc = build_document(files[0], [p.text for p in pages], len(pages))
+    streamed = list(iter_page_chunks(pages, max_tokens=8, overlap_tokens=2))
+    assert streamed == list(iter_chunks(doc.text, 8, 2))
+    for chunk in streamed:
+        assert doc.text[chunk.start:chunk.end] == chunk.text
+    assert doc.page_at(doc.text.index("page 4")) == 4
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_load_files_skips_unsupported_and_keeps_order(files, workers):
+    events = []
+    docs = load_files(files, max_workers=workers, emit=events.append)
+    assert [d.name for d in docs] == ["a.pdf", "c.txt", "b.pdf"]
+    assert [d.pages for d in docs] == [5, 0, 3]
+    assert docs[1].page_offsets == [] and docs[1].text == "第一条 纯文本文件。"
+    assert [e["name"] for e in events if e["type"] == "document"] == ["a.pdf", "c.txt", "b.pdf"]
+
+
+def test_documents_are_yielded_before_later_files_are_parsed(files, monkeypatch):
+    parsed = []
+    run_task = ingest._run_task
+
+    def _tracking(task):
+        parsed.append(task[1])
+        return run_task(task)
+
+    monkeypatch.setattr(ingest, "_run_task", _tracking)
+    stream = iter_documents(files)
+    assert next(stream).name == "a.pdf"
+    assert files[3] not in parsed
+
+
+def test_store_hits_are_not_parsed_again(files, tmp_path, monkeypatch):
+    store = DocumentStore(str(tmp_path / "docs.sqlite3"))
+    first = load_files(files, store=store)
+    monkeypatch.setattr(ingest, "_run_task", lambda task: pytest.fail("命中存储的文件不应重新解析"))
+    assert load_files(files, store=store) == first
+    assert store.hits == 3
+
+
+def test_parse_pool_is_shared():
+    assert get_parse_pool(2) is get_parse_pool(2)
@@ -0,0 +1,149 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from models.schemas import PipelineInput, PipelineOutput
+from pipeline import graph, jobs
+
+
+class _FakePipeline:
+    """代替 run_pipeline：每次运行等到 release 被设置后返回一份空结果；被取消的运行留下可续跑的检查点"""
+
+    def __init__(self) -> None:
+        self.release = threading.Event()
+        self.started = []
+        self.inputs = []
+        self.interrupted = set()
+
+    def get_state(self, config):
+        return SimpleNamespace(next=("run",) if config["configurable"]["thread_id"] in self.interrupted else ())
+
+    def stream(self, pipeline_input, config, stream_mode):
+        run_id = config["configurable"]["thread_id"]
+        self.started.append(run_id)
+        self.inputs.append(pipeline_input)
+        yield "custom", {"type": "card", "card": {"Question": "问题", "Answer": "答案"}}
+        deadline = time.time() + 5
+        while not self.release.is_set() and time.time() < deadline:
+            if run_id in graph._CANCELLED_RUNS:
+                self.interrupted.add(run_id)
+                raise graph.RunCancelled(run_id)
+            time.sleep(0.01)
+        self.interrupted.discard(run_id)
+        yield "custom", {"type": "progress", "stage": "documents", "done": 1, "total": 1}
+        yield "values", PipelineOutput(documents=[], extracted_items=[], cards=[], errors=[])
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    pipeline = _FakePipeline()
+    monkeypatch.setattr(jobs, "run_pipeline", pipeline)
+    monkeypatch.setattr(jobs, "prune_runs", lambda: 0)
+    job_manager = jobs.JobManager(jobs.JobStore(str(tmp_path / "jobs.sqlite3")), max_workers=1)
+    yield job_manager, pipeline
+    pipeline.release.set()
+    job_manager._executor.shutdown(wait=True)
+
+
+def _input() -> PipelineInput:
+    return PipelineInput(file_paths=[], keywords=[], api_base="http://x", api_key="sk-in-input", extract_model="m",
+                         card_model="m", dedup_threshold=0.88, min_quality=0.5, max_cards_per_item=3)
+
+
+def _wait_status(job_manager, job_id, status, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if job_manager.get(job_id)["status"] == status:
+            return
+        time.sleep(0.01)
+    raise AssertionError(f"{job_id} 状态为 {job_manager.get(job_id)['status']}，期望 {status}")
+
+
+def test_cancel_queued_job_releases_run_state(manager):
+    job_manager, pipeline = manager
+    running = job_manager.submit(_input(), api_key="sk-1")
+    queued = job_manager.submit(_input(), api_key="sk-2")
+    _wait_status(job_manager, running, "running")
+    assert queued in graph._RUN_API_KEYS
+
+    job_manager.cancel(queued)
+    assert job_manager.get(queued)["status"] == "cancelled"
+    # 排队的任务不会执行 run_pipeline，登记的密钥在任务结束时丢弃
+    assert queued not in graph._RUN_API_KEYS
+    assert queued not in graph._RUN_SCHEDULERS
+
+    pipeline.release.set()
+    _wait_status(job_manager, running, "done")
+    job_manager._executor.shutdown(wait=True)  # 等完成回调执行完
+    assert pipeline.started == [running]
+    assert running not in graph._RUN_API_KEYS
+
+
+def test_submit_runs_to_done_without_storing_api_key(manager):
+    job_manager, pipeline = manager
+    pipeline.release.set()
+    job_id = job_manager.submit(_input(), api_key="sk-1", metadata={"files": "a.txt"})
+    _wait_status(job_manager, job_id, "done")
+    job = job_manager.get(job_id)
+    assert job["metadata"] == {"files": "a.txt"}
+    assert job["has_output"] and job["started_at"] and job["finished_at"]
+    assert job["progress"]["counts"]["card"] == 1
+    assert job["progress"]["stages"]["documents"]["done"] == 1
+    assert job_manager.output(job_id).cards == []
+    # 密钥只经运行配置传入，任务记录与传给管线的输入里都没有
+    assert job_manager.store.input(job_id).api_key == ""
+    assert pipeline.inputs[0].api_key == ""
+
+
+def test_cancel_running_job_then_resume(manager):
+    job_manager, pipeline = manager
+    job_id = job_manager.submit(_input(), api_key="sk-1")
+    _wait_status(job_manager, job_id, "running")
+    job_manager.cancel(job_id)
+    _wait_status(job_manager, job_id, "cancelled")
+
+    pipeline.release.set()
+    assert job_manager.resume(job_id, api_key="sk-1") == job_id
+    _wait_status(job_manager, job_id, "done")
+    # 有检查点时从检查点续跑，不再传入输入
+    assert pipeline.started == [job_id, job_id]
+    assert pipeline.inputs[1] is None
+
+
+def test_resume_cancelled_queued_job_reruns_stored_input(manager):
+    job_manager, pipeline = manager
+    running = job_manager.submit(_input(), api_key="sk-1")
+    queued = job_manager.submit(_input(), api_key="sk-2")
+    _wait_status(job_manager, running, "running")
+    job_manager.cancel(queued)
+
+    pipeline.release.set()
+    job_manager.resume(queued, api_key="sk-2")
+    _wait_status(job_manager, queued, "done")
+    assert pipeline.inputs[-1].keywords == _input().keywords
+
+
+def test_resume_without_checkpoint_or_input_fails(manager):
+    job_manager, _ = manager
+    with pytest.raises(ValueError):
+        job_manager.resume("missing-run")
+
+
+def test_store_mark_interrupted_prune_and_list(tmp_path):
+    store = jobs.JobStore(str(tmp_path / "jobs.sqlite3"))
+    for i, status in enumerate(["done", "running", "queued", "failed"]):
+        store.create(f"job-{i}", _input().model_copy(update={"api_key": ""}), {})
+        store.update(f"job-{i}", status=status, created_at=float(i))
+    assert [j["id"] for j in store.list()] == ["job-3", "job-2", "job-1", "job-0"]
+    assert [j["id"] for j in store.list(limit=2)] == ["job-3", "job-2"]
+
+    assert store.mark_interrupted() == 2
+    assert store.get("job-1")["status"] == store.get("job-2")["status"] == "interrupted"
+    assert store.get("job-0")["status"] == "done"
+
+    # 只删除最近 keep 个之外、已经结束的任务
+    store.update("job-0", status="running")
+    assert store.prune(keep=1) == 2
+    assert {j["id"] for j in store.list()} == {"job-3", "job-0"}
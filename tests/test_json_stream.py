@@ -0,0 +1,82 @@
+import json
+
+import pytest
+
+from pipeline.utils.json_stream import JsonElementStream, iter_json_elements, recover_prefix
+
+_CARDS = {"cards": [{"Question": "问 {1}", "Answer": "答 \"引号\" ]"}, {"Question": "q2", "Answer": "a\\\\"}]}
+
+
+def _feed_all(fragments, **kwargs):
+    stream = JsonElementStream(**kwargs)
+    out = []
+    for fragment in fragments:
+        out.extend(stream.feed(fragment))
+    return stream, out
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 1000])
+def test_elements_split_across_fragments(size):
+    text = json.dumps(_CARDS, ensure_ascii=False)
+    stream, out = _feed_all([text[i:i + size] for i in range(0, len(text), size)])
+    assert out == _CARDS["cards"]
+    assert stream.done
+    assert stream.result() == _CARDS
+
+
+def test_element_emitted_as_soon_as_it_closes():
+    stream = JsonElementStream()
+    assert stream.feed('{"items": [{"a": 1}') == [{"a": 1}]
+    assert stream.feed(', {"b": 2') == []
+    assert stream.feed("}]}") == [{"b": 2}]
+
+
+def test_ignores_prose_and_code_fence():
+    text = '好的，结果如下：\n```json\n{"items": [{"a": 1}]}\n```\n以上。{"items": [{"b": 2}]}'
+    stream, out = _feed_all([text])
+    assert out == [{"a": 1}]
+    assert stream.result() == {"items": [{"a": 1}]}
+    assert stream.feed('{"items": [{"c": 3}]}') == []
+
+
+def test_top_level_array():
+    assert list(iter_json_elements(['[{"a": 1}, ', '{"b": 2}]'])) == [{"a": 1}, {"b": 2}]
+    _, out = _feed_all(['[{"a": 1}]'], top_level_array=False)
+    assert out == []
+
+
+def test_nested_target_yields_outer_element_only():
+    data = {"results": [{"id": 1, "cards": [{"Question": "q", "Answer": "a"}]}]}
+    _, out = _feed_all([json.dumps(data)])
+    assert out == data["results"]
+
+
+def test_non_target_arrays_are_not_yielded():
+    _, out = _feed_all(['{"tags": [{"x": 1}], "items": [{"y": 2}]}'])
+    assert out == [{"y": 2}]
+
+
+def test_scalar_elements():
+    _, out = _feed_all(['{"items": [1, "二", null, [3]]}'])
+    assert out == [[3]]  # 只有以括号开始的元素会被逐个产出
+
+
+def test_invalid_element_is_skipped():
+    _, out = _feed_all(['{"items": [{"a": 1,}, {"b": 2}]}'])
+    assert out == [{"b": 2}]
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('{"cards": [{"Question": "q1", "Answer": "a1"}, {"Question": "q2", "Ans', {"cards": [{"Question": "q1", "Answer": "a1"}]}),
+    ('{"cards": [{"Question": "q1", "Answer": "a1"},', {"cards": [{"Question": "q1", "Answer": "a1"}]}),
+    ('{"cards": [', {"cards": []}),
+    ('{"cards": [{"Question": "含 } 与 ] 的字符串', {"cards": []}),
+    ('[{"a": 1}, {"b"', [{"a": 1}]),
+])
+def test_recover_prefix_drops_unfinished_element(text, expected):
+    assert recover_prefix(text) == expected
+
+
+def test_recover_prefix_without_json():
+    assert recover_prefix("") is None
+    assert recover_prefix("模型拒绝回答") is None
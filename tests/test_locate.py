@@ -0,0 +1,69 @@
+from models.schemas import Document
+from pipeline.utils.chunking import SEGMENT_SEPARATOR, pack_spans
+from pipeline.utils.locate import locate, stamp_location
+
+_PAGES = ["第一页：合同的订立与效力。", "第二页：商业秘密是指不为公众所知悉的技术信息和经营信息。", "第三页：附则。"]
+_TEXT = "\n".join(_PAGES)
+_OFFSETS = [0, len(_PAGES[0]) + 1, len(_PAGES[0]) + len(_PAGES[1]) + 2]
+
+
+def _doc(**kwargs) -> Document:
+    kwargs.setdefault("pages", 3)
+    kwargs.setdefault("page_offsets", _OFFSETS)
+    return Document(name="a.pdf", path="a.pdf", text=_TEXT, **kwargs)
+
+
+def test_page_at_and_page_range():
+    doc = _doc()
+    assert doc.page_at(0) == 1
+    assert doc.page_at(_OFFSETS[1] - 1) == 1  # 页间换行归前一页
+    assert doc.page_at(_OFFSETS[1]) == 2
+    assert doc.page_at(len(_TEXT)) == 3
+    assert doc.page_range(_OFFSETS[1] - 3, _OFFSETS[2] + 1) == [1, 3]
+    assert doc.page_range(_OFFSETS[1], _OFFSETS[2]) == [2, 2]  # 终点不含
+    assert _doc(pages=0, page_offsets=[]).page_range(0, 10) is None
+
+
+def test_locate_exact_and_head_fallback():
+    chunk = "前文。商业秘密是指不为公众所知悉、具有商业价值并经权利人采取相应保密措施的技术信息、经营信息等商业信息。后文。"
+    assert locate(chunk, "  商业秘密是指  ") == (3, 9)
+    # 模型改写了片段结尾时按前 30 字定位，区间长度取片段长度
+    snippet = "商业秘密是指不为公众所知悉、具有商业价值并经权利人采取相应保密措施的信息"
+    assert locate(chunk, snippet) == (3, 3 + len(snippet))
+    # 开头太短不做模糊定位
+    assert locate(chunk, "商业秘密即") is None
+    assert locate(chunk, "") is None
+
+
+def test_stamp_location_maps_through_segments_to_pages():
+    spans = [(0, len(_PAGES[0])), (_OFFSETS[1], _OFFSETS[2] - 1)]
+    (chunk, segments), = pack_spans(_TEXT, spans, max_tokens=10000)
+    assert SEGMENT_SEPARATOR in chunk
+    item = {"evidence": "不为公众所知悉"}
+    stamp_location(item, _doc(), chunk, segments)
+    start, end = item["charSpan"]
+    assert _TEXT[start:end] == "不为公众所知悉"
+    assert item["pageRange"] == [2, 2]
+
+
+def test_stamp_location_uses_text_and_whole_chunk_fallback():
+    chunk_start = _OFFSETS[1]
+    chunk = _TEXT[chunk_start:]
+    segments = [(0, chunk_start, len(_TEXT))]
+    item = {"evidence": "", "text": "附则"}
+    stamp_location(item, _doc(), chunk, segments)
+    assert _TEXT[slice(*item["charSpan"])] == "附则"
+    assert item["pageRange"] == [3, 3]
+
+    # 找不到证据时取整个分块的区间
+    item = {"evidence": "完全不存在的证据片段内容"}
+    stamp_location(item, _doc(), chunk, segments)
+    assert item["charSpan"] == [chunk_start, len(_TEXT)]
+    assert item["pageRange"] == [2, 3]
+
+
+def test_stamp_location_without_pages():
+    item = {"evidence": "合同的订立"}
+    stamp_location(item, _doc(pages=0, page_offsets=[]), _TEXT, [(0, 0, len(_TEXT))])
+    assert _TEXT[slice(*item["charSpan"])] == "合同的订立"
+    assert item["pageRange"] is None
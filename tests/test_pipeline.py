@@ -0,0 +1,115 @@
+"""run_pipeline 端到端测试：请求发往本地模拟服务，检查点与阶段缓存都写到临时目录"""
+
+import threading
+import time
+
+import pytest
+
+from models.schemas import PipelineInput
+from pipeline import graph
+from pipeline.utils.stage_cache import StageCache
+
+
+@pytest.fixture
+def isolated(tmp_path, monkeypatch):
+    """检查点库、阶段缓存与相对路径的缓存文件都放到临时目录，不影响其他运行"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(graph, "STAGE_CACHE", StageCache())
+    monkeypatch.setattr(graph.CHECKPOINTER, "path", str(tmp_path / "checkpoints.sqlite3"))
+    monkeypatch.setattr(graph.CHECKPOINTER, "_conn", None)
+    monkeypatch.setattr(graph.CHECKPOINTER, "is_setup", False)
+    yield tmp_path
+    if graph.CHECKPOINTER._conn is not None:
+        graph.CHECKPOINTER._conn.close()
+
+
+def _files(directory, n: int = 4):
+    """n 篇文本文件，每篇只有少数段落命中关键词"""
+    paths = []
+    for i in range(n):
+        path = directory / f"doc{i}.txt"
+        lines = [f"第{j}段：经营者在第{i}号合同中不得侵犯他人的商业秘密，否则应当承担相应的赔偿责任。" if j % 5 == 0
+                 else f"第{j}段：本段记载了与本案无关的程序性事项和审理经过，供参考之用。" for j in range(40)]
+        path.write_text("\n".join(lines), encoding="utf-8")
+        paths.append(str(path))
+    return paths
+
+
+def _input(server, files, **kwargs) -> PipelineInput:
+    fields = dict(file_paths=files, keywords=["商业秘密"], api_base=server.base_url, api_key="", extract_model="m",
+                  card_model="m", dedup_threshold=0.88, min_quality=0.0, max_cards_per_item=2, use_llm_cache=False,
+                  chunk_tokens=300, retrieval_recall=1.0)
+    return PipelineInput(**{**fields, **kwargs})
+
+
+def _questions(output):
+    return [c.Question for c in output.cards]
+
+
+def test_postprocessing_settings_reuse_stage_cache(isolated, mock_server):
+    files = _files(isolated)
+    first = graph.run_pipeline.invoke(_input(mock_server, files), graph.new_run_config("sk"))
+    assert first.cards and not first.errors
+    assert mock_server.reset_stats()["requests"] > 0
+
+    # 只调整质量过滤与去重参数时抽取与制卡都命中阶段缓存，不再请求模型
+    second = graph.run_pipeline.invoke(_input(mock_server, files, min_quality=0.99, dedup_threshold=0.5),
+                                       graph.new_run_config("sk"))
+    assert mock_server.reset_stats()["requests"] == 0
+    assert second.extracted_items == first.extracted_items
+    assert len(second.cards) <= len(first.cards)
+
+    # 影响制卡的参数变化时只重跑制卡
+    graph.run_pipeline.invoke(_input(mock_server, files, max_cards_per_item=1), graph.new_run_config("sk"))
+    stats = mock_server.reset_stats()
+    assert 0 < stats["requests"] < len(first.extracted_items)
+
+
+def test_cancelled_run_resumes_without_repeating_requests(isolated, mock_server):
+    files = _files(isolated)
+    pipeline_input = _input(mock_server, files)
+    full = graph.run_pipeline.invoke(pipeline_input, graph.new_run_config("sk"))
+    total = mock_server.reset_stats()["requests"]
+    graph.STAGE_CACHE.clear()
+
+    mock_server.config.latency_ms = 10
+    config = graph.new_run_config("sk")
+    run_id = config["configurable"]["thread_id"]
+
+    def cancel_midway():
+        while mock_server.stats["requests"] < total // 2:
+            time.sleep(0.002)
+        graph.cancel_run(run_id)
+
+    threading.Thread(target=cancel_midway, daemon=True).start()
+    with pytest.raises(graph.RunCancelled):
+        graph.run_pipeline.invoke(pipeline_input, config)
+    before = mock_server.reset_stats()["requests"]
+    assert before < total
+
+    # 以同一 run ID、None 为输入续跑：已完成的请求从检查点复用，只补发剩余的请求
+    resumed = graph.run_pipeline.invoke(None, graph.new_run_config("sk", run_id=run_id))
+    after = mock_server.reset_stats()["requests"]
+    assert before + after == total
+    assert _questions(resumed) == _questions(full)
+    graph.release_run(run_id)
+
+
+@pytest.mark.parametrize("recall", [1.0, 0.1])
+def test_stream_emits_items_and_cards_before_parsing_finishes(isolated, mock_server, recall):
+    files = _files(isolated)
+    kinds = []
+    output = None
+    for mode, event in graph.run_pipeline.stream(_input(mock_server, files, retrieval_recall=recall),
+                                                 graph.new_run_config("sk"), stream_mode=["custom", "values"]):
+        if mode == "values":
+            output = event
+        elif event["type"] in ("document", "item", "card"):
+            kinds.append(event["type"])
+    assert output is not None and output.cards
+    assert kinds.count("document") == len(files)
+    assert kinds.count("card") >= len(output.cards)
+    # 逐篇流式处理：最后一篇文档解析完之前，前面文档的条目与卡片已经产出
+    last_document = len(kinds) - 1 - kinds[::-1].index("document")
+    assert kinds.index("item") < last_document
+    assert kinds.index("card") < last_document
@@ -0,0 +1,61 @@
+import random
+
+import pytest
+
+from pipeline.utils.retrieval import AhoCorasick, BM25Index, char_ngrams, select_passages
+
+
+def _naive_matches(text, patterns):
+    return sorted((i + len(p), p) for p in set(patterns) if p for i in range(len(text)) if text.startswith(p, i))
+
+
+def test_aho_corasick_overlapping_patterns():
+    matcher = AhoCorasick(["不正当竞争", "正当", "竞争", "竞争行为", ""])
+    text = "不正当竞争行为与正当竞争"
+    assert sorted(matcher.finditer(text)) == _naive_matches(text, matcher.patterns)
+    assert matcher.count(text) == {"不正当竞争": 1, "正当": 2, "竞争": 2, "竞争行为": 1}
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_aho_corasick_matches_naive_search(seed):
+    rng = random.Random(seed)
+    alphabet = "商业秘密ab"
+    patterns = ["".join(rng.choice(alphabet) for _ in range(rng.randint(1, 4))) for _ in range(6)]
+    text = "".join(rng.choice(alphabet) for _ in range(200))
+    assert sorted(AhoCorasick(patterns).finditer(text)) == _naive_matches(text, patterns)
+
+
+def test_char_ngrams_ignore_whitespace():
+    assert char_ngrams("商业 秘密") == ["商业", "业秘", "秘密"]
+    assert char_ngrams("商") == []
+
+
+def test_bm25_prefers_relevant_and_shorter_passages():
+    passages = ["商业秘密的保护范围", "商业秘密的保护范围，以及其他与本案无关的大量程序性内容和审理经过", "合同的订立与效力"]
+    scores = BM25Index(passages).scores(["商业秘密"])
+    assert scores[0] > scores[1] > scores[2] == 0.0
+
+
+def test_select_passages_keeps_exact_hits_and_neighbours():
+    passages = ["无关一", "无关二", "涉及商业秘密", "无关三", "无关四", "无关五"]
+    assert select_passages(passages, ["商业秘密"], recall=0.0) == [1, 2, 3]
+    assert select_passages(passages, ["商业秘密"], recall=0.0, neighbours=0) == [2]
+
+
+def test_select_passages_adds_top_bm25_passages():
+    # “商业信息”与关键词共享二元组，按得分补入；完全无关的段落不入选
+    passages = ["合同订立"] * 4 + ["商业信息的保密"] + ["合同订立"] * 4 + ["商业秘密"]
+    assert select_passages(passages, ["商业秘密"], recall=0.0, neighbours=0) == [9]
+    assert select_passages(passages, ["商业秘密"], recall=0.2, neighbours=0) == [4, 9]
+    assert select_passages(passages, ["商业秘密"], recall=0.9, neighbours=0) == [4, 9]
+
+
+def test_select_passages_neighbours_stay_in_group():
+    passages = ["无关", "商业秘密", "无关", "无关"]
+    assert select_passages(passages, ["商业秘密"], recall=0.0, groups=[0, 0, 1, 1]) == [0, 1]
+
+
+def test_select_passages_without_prefilter():
+    passages = ["甲", "乙"]
+    assert select_passages(passages, ["商业秘密"], recall=1.0) == [0, 1]
+    assert select_passages(passages, [], recall=0.1) == [0, 1]
@@ -0,0 +1,198 @@
+import threading
+import time
+
+import pytest
+
+from llm.scheduler import RateLimitedScheduler, is_retryable, note_cache_hit
+
+
+class _ApiError(Exception):
+    def __init__(self, status_code: int, retry_after: str = "") -> None:
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = type("Response", (), {"headers": {"retry-after": retry_after} if retry_after else {}})()
+
+
+def _scheduler(**kwargs) -> RateLimitedScheduler:
+    kwargs.setdefault("base_delay", 0.001)
+    kwargs.setdefault("max_delay", 0.01)
+    return RateLimitedScheduler(**kwargs)
+
+
+def _flaky(failures, exc):
+    """前 failures 次调用抛出 exc，之后返回调用次数"""
+    calls = []
+
+    def fn():
+        calls.append(1)
+        if len(calls) <= failures:
+            raise exc
+        return len(calls)
+    return fn, calls
+
+
+# ---------------------------------------------------------------------- 限流窗口
+
+def test_tpm_waits_until_enough_tokens_leave_window():
+    s = _scheduler(tokens_per_minute=100)
+    s._window.extend([(0.0, 60), (10.0, 30)])
+    s._window_tokens = 90
+    # 需要腾出 40：最早一笔（60）滑出窗口即可
+    assert s._wait_time(50, now=20.0) == pytest.approx(40.0)
+    # 需要腾出 85：两笔都要滑出
+    assert s._wait_time(95, now=20.0) == pytest.approx(50.0)
+    assert s._wait_time(10, now=20.0) == 0.0
+
+
+def test_tpm_oversized_request_waits_for_empty_window_only():
+    s = _scheduler(tokens_per_minute=100)
+    assert s._wait_time(500, now=0.0) == 0.0  # 窗口为空时单个超大请求直接放行
+    s._window.extend([(0.0, 10), (5.0, 10)])
+    s._window_tokens = 20
+    assert s._wait_time(500, now=20.0) == pytest.approx(45.0)  # 等到窗口清空，而不是永久阻塞
+
+
+def test_window_expires_old_entries():
+    s = _scheduler(tokens_per_minute=100)
+    s._window.extend([(0.0, 90)])
+    s._window_tokens = 90
+    assert s._wait_time(50, now=61.0) == 0.0
+    assert not s._window and s._window_tokens == 0
+
+
+def test_rpm_limit():
+    s = _scheduler(requests_per_minute=2)
+    s._window.extend([(0.0, 0), (5.0, 0)])
+    assert s._wait_time(0, now=10.0) == pytest.approx(50.0)
+
+
+def test_concurrency_limit():
+    s = _scheduler(max_concurrency=2)
+    active, peak = [0], [0]
+    lock = threading.Lock()
+
+    def job(_):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.01)
+        with lock:
+            active[0] -= 1
+        return True
+
+    assert s.map(job, range(8)) == [True] * 8
+    assert peak[0] <= 2
+
+
+# ---------------------------------------------------------------------- 重试与退避
+
+def test_is_retryable():
+    assert is_retryable(_ApiError(429))
+    assert is_retryable(_ApiError(503))
+    assert not is_retryable(_ApiError(400))
+    assert not is_retryable(ValueError("bad json"))
+
+
+def test_429_is_retried_and_shrinks_rate():
+    s = _scheduler(max_retries=3)
+    fn, _ = _flaky(2, _ApiError(429))
+    assert s.call(fn) == 3
+    assert s.stats["retries"] == 2
+    assert s.stats["throttled"] == 2
+    assert s.stats["failures"] == 0
+    assert s._scale < 1.0
+
+
+def test_429_gives_up_after_max_retries():
+    s = _scheduler(max_retries=2)
+    fn, calls = _flaky(10, _ApiError(429))
+    with pytest.raises(_ApiError):
+        s.call(fn)
+    assert len(calls) == 3
+    assert s.stats["failures"] == 1
+    assert s._inflight == 0
+
+
+def test_non_retryable_error_fails_immediately():
+    s = _scheduler(max_retries=3)
+    fn, calls = _flaky(10, _ApiError(401))
+    with pytest.raises(_ApiError):
+        s.call(fn)
+    assert len(calls) == 1
+    assert s.stats["retries"] == 0
+    assert s._scale == 1.0
+
+
+def test_backoff_honours_retry_after():
+    s = RateLimitedScheduler(base_delay=1.0, max_delay=30.0)
+    assert s._backoff(0, _ApiError(429, retry_after="7")) == 7.0
+    assert s._backoff(0, _ApiError(429, retry_after="120")) == 30.0
+    assert 2.0 <= s._backoff(2, _ApiError(429)) <= 4.0
+
+
+def test_try_job_reports_failure():
+    s = _scheduler(max_retries=0)
+    assert s.try_job(lambda job: job * 2, 21) == (True, 42)
+    fn, _ = _flaky(10, _ApiError(500))
+    assert s.try_job(lambda job: fn(), None, default=[]) == (False, [])
+    assert s.run_job(lambda job: fn(), None, default="x") == "x"
+
+
+def test_map_fills_default_for_failed_jobs_and_keeps_order():
+    s = _scheduler(max_concurrency=4, max_retries=0)
+
+    def job(i):
+        if i % 3 == 0:
+            raise _ApiError(400)
+        time.sleep(0.001 * (5 - i % 5))
+        return i
+
+    assert s.map(job, range(7), default=-1) == [-1, 1, 2, -1, 4, 5, -1]
+
+
+def test_imap_keeps_order_and_bounds_pending():
+    s = _scheduler(max_concurrency=2)
+    pulled = []
+
+    def jobs():
+        for i in range(10):
+            pulled.append(i)
+            yield i
+
+    stream = s.imap(lambda i: i * i, jobs(), max_pending=3)
+    assert next(stream) == (0, 0)
+    assert len(pulled) == 3  # 取走第一个结果前最多提交 max_pending 个
+    assert [r for _, r in stream] == [i * i for i in range(1, 10)]
+
+
+# ---------------------------------------------------------------------- 缓存命中退还额度
+
+def test_cache_hit_refunds_rate_budget():
+    s = _scheduler(requests_per_minute=1, tokens_per_minute=100)
+
+    def cached():
+        note_cache_hit()
+        return "cached"
+
+    for _ in range(5):
+        assert s.call(cached, tokens=80) == "cached"
+    assert not s._window and s._window_tokens == 0
+    assert s.stats["requests"] == 0
+    assert s.stats["cache_hits"] == 5
+    # 额度没有被缓存命中占用，真实请求无需等待
+    assert s.call(lambda: "live", tokens=80) == "live"
+    assert s.stats["requests"] == 1
+    assert len(s._window) == 1
+
+
+def test_cache_hit_flag_does_not_leak_into_next_call():
+    s = _scheduler()
+
+    def cached():
+        note_cache_hit()
+        return 1
+
+    s.call(cached)
+    s.call(lambda: 2)
+    assert s.stats["cache_hits"] == 1
+    assert s.stats["requests"] == 1
@@ -0,0 +1,95 @@
+import pytest
+
+from models.schemas import Document
+from pipeline.nodes.statute import chinese_number, parse_statute, statute_items
+
+_LAW = """中华人民共和国测试法
+
+第一章 总则
+第一条 为了促进市场竞争，保护经营者的合法权益，制定本法。
+第二条 经营者在生产经营活动中，应当遵循自愿、平等、公平、诚信的原则。
+第二章 不正当竞争行为
+第三条 经营者不得实施下列混淆行为：
+（一）擅自使用与他人有一定影响的商品名称；
+（二）擅自使用他人有一定影响的企业名称。
+第三条之一 经营者不得侵犯商业秘密。
+第四条 违反本法第三条规定的，由监督检查部门责令停止违法行为。
+第二条 规定的原则适用于本章。
+第三章 附则
+第五条 本法自公布之日起施行。
+"""
+
+
+def _doc(text: str) -> Document:
+    return Document(name="test.txt", path="test.txt", text=text)
+
+
+@pytest.mark.parametrize("text, value", [
+    ("一", 1), ("十", 10), ("十二", 12), ("二十", 20), ("一百零三", 103), ("一千二百三十四", 1234), ("两百", 200),
+    ("42", 42),
+])
+def test_chinese_number(text, value):
+    assert chinese_number(text) == value
+
+
+def test_parse_statute_articles_and_sections():
+    items = parse_statute(_doc(_LAW))
+    assert [i.articleNo for i in items] == ["第一条", "第二条", "第三条", "第三条之一", "第四条", "第五条"]
+    assert all(i.type == "Statute" and i.source == "中华人民共和国测试法" for i in items)
+    by_no = {i.articleNo: i for i in items}
+    assert by_no["第一条"].section == "第一章 总则"
+    assert by_no["第三条"].section == "第二章 不正当竞争行为"
+    assert by_no["第五条"].section == "第三章 附则"
+    assert by_no["第三条"].title == "中华人民共和国测试法 第三条"
+    # 款项折行并入本条
+    assert "（二）擅自使用他人有一定影响的企业名称。" in by_no["第三条"].text
+    # 条号回退的行是正文中的引用，不是新条文
+    assert "第二条 规定的原则适用于本章。" in by_no["第四条"].text
+
+
+def test_parse_statute_char_spans_point_into_text():
+    items = parse_statute(_doc(_LAW))
+    for item in items:
+        start, end = item.charSpan
+        assert _LAW[start:end].startswith(item.articleNo)
+
+
+def test_parse_statute_page_range():
+    offset = _LAW.index("第三章")
+    doc = Document(name="test.pdf", path="test.pdf", text=_LAW, pages=2, page_offsets=[0, offset])
+    by_no = {i.articleNo: i for i in parse_statute(doc)}
+    assert by_no["第一条"].pageRange == [1, 1]
+    assert by_no["第五条"].pageRange == [2, 2]
+
+
+def test_not_a_statute():
+    text = "本案中，原告主张被告违反第三条的规定。法院审理后认为，被告的行为构成不正当竞争。\n判决如下：驳回上诉。"
+    assert parse_statute(_doc(text)) == []
+    assert statute_items(_doc(text), ["不正当竞争"]) is None
+
+
+def test_statute_items_exact_keywords():
+    items = statute_items(_doc(_LAW), ["混淆", "商业秘密"])
+    assert [i.articleNo for i in items] == ["第三条", "第三条之一"]
+    assert items[0].keywordsHit == ["混淆"]
+    assert items[1].keywordsHit == ["商业秘密"]
+
+
+def test_statute_items_section_heading_counts_as_hit():
+    items = statute_items(_doc(_LAW), ["附则"])
+    assert [i.articleNo for i in items] == ["第五条"]
+
+
+def test_statute_items_without_keywords_returns_all():
+    assert len(statute_items(_doc(_LAW), [])) == 6
+
+
+def test_statute_items_unrelated_keyword_falls_back_to_model():
+    # 精确匹配与语义检索都找不到相关条文时返回 None，交给模型抽取而不是返回空列表
+    assert statute_items(_doc(_LAW), ["量子"]) is None
+
+
+def test_statute_items_semantic_fallback_respects_top_k():
+    items = statute_items(_doc(_LAW), ["竞争行为混淆"], top_k=2)
+    assert items is not None and 0 < len(items) <= 2
+    assert all(i.keywordsHit == ["竞争行为混淆"] for i in items)